@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro da lista: mede a requisição inteira (ver vendas/metricas.py)
+    'vendas.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -135,3 +137,31 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Diretório compartilhado entre os workers do gunicorn para somar as métricas de /metrics
+# (sem ele, cada processo expõe só as próprias métricas)
+METRICAS_DIR = os.getenv('METRICAS_DIR')
+
+# Cache do Django (contexto do dashboard). Por padrão fica na memória de cada
+# processo; com CACHE_DIR os workers do gunicorn compartilham um cache em arquivos.
+if os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Segundos em que a home serve os números do cache sem recalcular
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '30'))
+
+# Exportações ZIP (/produtos/export/zip/) ao mesmo tempo; as demais recebem 503.
+# Cada uma usa até EXPORTACAO_ZIP_PROCESSOS processos (padrão: número de CPUs).
+EXPORTACAO_ZIP_SIMULTANEAS = int(os.getenv('EXPORTACAO_ZIP_SIMULTANEAS', '1'))
+EXPORTACAO_ZIP_PROCESSOS = int(os.getenv('EXPORTACAO_ZIP_PROCESSOS', '0')) or None
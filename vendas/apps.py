@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VendasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vendas'
+
+    def ready(self):
+        # Registra os receivers de signals (versão do catálogo)
+        from . import signals  # noqa: F401
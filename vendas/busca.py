@@ -0,0 +1,118 @@
+"""
+Busca de produtos por nome e descrição, com os resultados por relevância.
+
+No PostgreSQL (migração 0011) a busca usa a coluna gerada 'busca' (tsvector
+de nome e descrição, sem acentos quando a extensão 'unaccent' existe) com
+índice GIN: a última palavra digitada vale como prefixo ('teclado mec'
+acha "Teclado Mecânico"). Com a extensão pg_trgm, nomes parecidos também entram
+('tecaldo' acha "Teclado"), pelo índice de trigramas do nome.
+A relevância é o ts_rank (nome pesa mais que descrição) mais a semelhança
+do nome com o texto buscado.
+
+Nos outros bancos cada palavra precisa aparecer no nome ou na descrição
+(icontains, sem índice), e os nomes que começam pelo texto buscado vêm antes.
+"""
+import re
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from .models import Produto
+
+# Resultados por busca: um texto que casa com o catálogo inteiro devolve só os
+# MAX_RESULTADOS mais relevantes (a listagem pagina dentro deles)
+MAX_RESULTADOS = 1000
+MAX_PALAVRAS = 8
+
+_indice_trigramas = {}
+
+
+def palavras_da_busca(texto: str) -> list:
+    return re.findall(r'\w+', texto or '')[:MAX_PALAVRAS]
+
+
+def _trigramas_disponiveis() -> bool:
+    """Se o índice de trigramas foi criado (lido uma vez por banco, por processo)."""
+    chave = (connection.alias, connection.settings_dict['NAME'])
+    if chave not in _indice_trigramas:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('produto_nome_trgm') IS NOT NULL")
+            _indice_trigramas[chave] = cursor.fetchone()[0]
+    return _indice_trigramas[chave]
+
+
+def buscar_produtos(texto: str, queryset=None):
+    """
+    Produtos de 'queryset' (padrão: todos) que casam com 'texto', anotados
+    com 'relevancia' e ordenados por ela. Sem nenhuma palavra, nada é encontrado.
+    Os filtros de 'queryset' não devem fazer JOIN: a condição da busca usa
+    as colunas do produto sem o nome da tabela.
+    """
+    queryset = Produto.objects.all() if queryset is None else queryset
+    palavras = palavras_da_busca(texto)
+    if not palavras:
+        return queryset.none()
+    ordem = ('-relevancia', 'nome', 'pk')
+    if connection.vendor == 'postgresql':
+        condicao, relevancia = _busca_postgresql(palavras)
+        # O planejador estima toda busca por prefixo em 2% da tabela e, com o
+        # LIMIT, prefere ler a tabela inteira a usar o índice GIN. A CTE
+        # MATERIALIZED é planejada sem o LIMIT, então usa o índice; o corte
+        # vem depois de ordenar os encontrados pela relevância.
+        sql, parametros = (
+            queryset.filter(condicao).annotate(relevancia=relevancia).values('id', 'nome', 'relevancia')
+            .order_by().query.sql_with_params()
+        )
+        candidatos = RawSQL(
+            f"WITH candidatos AS MATERIALIZED ({sql}) "
+            "SELECT c.id FROM candidatos AS c ORDER BY c.relevancia DESC, c.nome, c.id LIMIT %s",
+            (*parametros, MAX_RESULTADOS),
+        )
+    else:
+        condicao, relevancia = _busca_generica(palavras)
+        candidatos = (
+            queryset.filter(condicao).annotate(relevancia=relevancia).order_by(*ordem).values('pk')[:MAX_RESULTADOS]
+        )
+    return (
+        queryset.filter(pk__in=candidatos)
+        .annotate(relevancia=relevancia)
+        .order_by(*ordem)
+    )
+
+
+def _busca_postgresql(palavras: list):
+    tabela = connection.ops.quote_name(Produto._meta.db_table)
+    # Só a última palavra é prefixo (a que ainda está sendo digitada): as palavras
+    # completas são procuradas inteiras, o que deixa o índice pular direto para
+    # as linhas raras em vez de juntar todas as que começam por uma palavra comum
+    prefixos = ' & '.join(palavras[:-1] + [f'{palavras[-1]}:*'])
+    texto = ' '.join(palavras)
+    consulta = "to_tsquery('simple', vendas_normalizar(%s))"
+    condicao = f"busca @@ {consulta}"
+    parametros = [prefixos]
+    relevancia = f"ts_rank({tabela}.busca, {consulta})"
+    parametros_relevancia = [prefixos]
+    if _trigramas_disponiveis():
+        # '<%': o texto é parecido com alguma parte do nome (word_similarity)
+        condicao = f"({condicao} OR vendas_normalizar(%s) <%% vendas_normalizar(nome))"
+        parametros.append(texto)
+        relevancia += f" + word_similarity(vendas_normalizar(%s), vendas_normalizar({tabela}.nome))"
+        parametros_relevancia.append(texto)
+    return (
+        RawSQL(condicao, parametros, output_field=BooleanField()),
+        RawSQL(relevancia, parametros_relevancia, output_field=FloatField()),
+    )
+
+
+def _busca_generica(palavras: list):
+    condicao = Q()
+    for palavra in palavras:
+        condicao &= Q(nome__icontains=palavra) | Q(descricao__icontains=palavra)
+    texto = ' '.join(palavras)
+    relevancia = Case(
+        When(nome__istartswith=texto, then=Value(3.0)),
+        When(nome__icontains=texto, then=Value(2.0)),
+        When(nome__icontains=palavras[0], then=Value(1.5)),
+        default=Value(1.0),
+        output_field=FloatField(),
+    )
+    return condicao, relevancia
@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Iterator, NamedTuple, Optional
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from .models import VersaoCatalogo
+
+
+# A versão do catálogo é a soma das linhas de VersaoCatalogo (criadas pela
+# migração 0012). Cada escrita incrementa só a linha da fatia dos seus produtos,
+# dentro da própria transação: vendas de produtos diferentes não disputam a
+# mesma linha, e a versão nunca fica para trás de dados já confirmados.
+FATIAS_VERSAO = 16
+
+
+class Versao(NamedTuple):
+    versao: int
+    atualizado_em: Optional[datetime]
+
+
+def versao_catalogo() -> Versao:
+    """Versão atual do catálogo (número e data da última alteração), em uma consulta."""
+    agregado = VersaoCatalogo.objects.aggregate(versao=Sum('versao'), atualizado_em=Max('atualizado_em'))
+    return Versao(agregado['versao'] or 0, agregado['atualizado_em'])
+
+
+def fatia_da_versao(produto_ids: Iterable[int] = ()) -> int:
+    """
+    Linha de VersaoCatalogo de uma escrita: pelo menor id de produto, como as
+    partições da fila de vendas. Vendas de um mesmo produto já esperam pelo
+    lock do produto, então a linha da fatia não acrescenta disputa.
+    """
+    produto_ids = [pk for pk in produto_ids if pk is not None]
+    return min(produto_ids) % FATIAS_VERSAO + 1 if produto_ids else 1
+
+
+def registrar_alteracao_catalogo(produto_ids: Iterable[int] = ()):
+    """
+    Incrementa a versão do catálogo na transação atual, depois das escritas
+    que a alteram (as linhas dos produtos já estão travadas nessa hora).
+    Um erro aqui desfaz a escrita inteira, em vez de deixar a versão antiga
+    valendo para dados novos.
+    """
+    fatia = fatia_da_versao(produto_ids)
+    atualizadas = VersaoCatalogo.objects.filter(pk=fatia).update(
+        versao=F('versao') + 1, atualizado_em=timezone.now()
+    )
+    if not atualizadas:
+        # Linha ainda não criada: nasce com versao=1, o que também muda a soma
+        VersaoCatalogo.objects.get_or_create(pk=fatia)
+
+
+class CacheExportacoes:
+    """
+    Cache LRU, em memória do processo, dos corpos de exportação já serializados.
+    A chave inclui a versão do catálogo: quando os dados mudam, as entradas
+    antigas deixam de ser usadas e saem do cache pela ordem de uso.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_bytes_por_item: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_bytes_por_item = max_bytes_por_item
+        self._itens = OrderedDict()
+        self._tamanho = 0
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            corpo = self._itens.get(chave)
+            if corpo is not None:
+                self._itens.move_to_end(chave)
+            return corpo
+
+    def set(self, chave, corpo: bytes):
+        if len(corpo) > self.max_bytes_por_item:
+            return
+        with self._lock:
+            if chave in self._itens:
+                self._tamanho -= len(self._itens.pop(chave))
+            self._itens[chave] = corpo
+            self._tamanho += len(corpo)
+            while self._tamanho > self.max_bytes:
+                _, removido = self._itens.popitem(last=False)
+                self._tamanho -= len(removido)
+
+    def armazenar_ao_final(self, chave, pedacos: Iterator[bytes]) -> Iterator[bytes]:
+        """
+        Repassa os pedaços de uma resposta em streaming e, se o corpo inteiro
+        couber em 'max_bytes_por_item', guarda-o no cache ao final.
+        Corpos maiores continuam em streaming sem serem acumulados.
+        """
+        acumulado = []
+        tamanho = 0
+        for pedaco in pedacos:
+            if acumulado is not None:
+                tamanho += len(pedaco)
+                if tamanho > self.max_bytes_por_item:
+                    acumulado = None
+                else:
+                    acumulado.append(pedaco)
+            yield pedaco
+        if acumulado is not None:
+            self.set(chave, b''.join(acumulado))
+
+
+cache_exportacoes = CacheExportacoes()
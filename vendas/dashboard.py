@@ -0,0 +1,87 @@
+"""
+Cache do contexto do dashboard (home) com stale-while-revalidate.
+
+Os números ficam no cache do Django (CACHES['default']: memória local por
+padrão, ou arquivos com CACHE_DIR, compartilhado entre os workers) por
+DASHBOARD_CACHE_TTL segundos. Vencido o prazo, ou depois de uma escrita que
+mude os números, um único worker recalcula (quem consegue o cache.add da
+trava) e os demais continuam servindo os valores antigos enquanto isso.
+Sem nenhum valor em cache, quem não ficou com a trava espera o recálculo
+em vez de ir ao banco também.
+
+A invalidação troca a versão do dashboard depois do commit: o contexto
+guardado com a versão anterior passa a ser servido só como valor antigo.
+"""
+import time
+import uuid
+from typing import Callable
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CHAVE_CONTEXTO = 'vendas:dashboard:contexto'
+CHAVE_VERSAO = 'vendas:dashboard:versao'
+CHAVE_TRAVA = 'vendas:dashboard:recalculando'
+
+# Por quanto tempo o contexto vencido ainda pode ser servido enquanto outro worker recalcula
+PERMANENCIA_MAXIMA = 10 * 60
+# A trava expira sozinha se o worker que recalcula morrer no meio
+VALIDADE_TRAVA = 30
+# Sem contexto em cache: quanto tempo esperar pelo worker que recalcula
+ESPERA_MAXIMA = 5.0
+INTERVALO_ESPERA = 0.05
+
+
+def _ttl() -> int:
+    return getattr(settings, 'DASHBOARD_CACHE_TTL', 30)
+
+
+def _versao() -> str:
+    versao = cache.get(CHAVE_VERSAO)
+    if versao is None:
+        # Primeira leitura (ou chave removida pelo cache): qualquer contexto guardado fica velho
+        cache.add(CHAVE_VERSAO, uuid.uuid4().hex, timeout=None)
+        versao = cache.get(CHAVE_VERSAO)
+    return versao
+
+
+def invalidar_dashboard():
+    """Marca o contexto do dashboard como desatualizado depois do commit da transação atual."""
+    transaction.on_commit(lambda: cache.set(CHAVE_VERSAO, uuid.uuid4().hex, timeout=None))
+
+
+def contexto_dashboard(calcular: Callable[[], dict]) -> dict:
+    """
+    Contexto do dashboard vindo do cache; 'calcular' (as consultas ao banco)
+    só roda no worker que ficar com a trava, ou se a espera pelo recálculo
+    de outro worker passar de ESPERA_MAXIMA.
+    """
+    versao = _versao()
+    guardado = cache.get(CHAVE_CONTEXTO)
+    if guardado and guardado['versao'] == versao and guardado['expira_em'] > time.time():
+        return guardado['contexto']
+
+    if cache.add(CHAVE_TRAVA, True, timeout=VALIDADE_TRAVA):
+        try:
+            # A versão foi lida antes das consultas: uma escrita feita durante o
+            # recálculo troca a versão e o resultado já nasce velho
+            contexto = calcular()
+            cache.set(
+                CHAVE_CONTEXTO,
+                {'versao': versao, 'expira_em': time.time() + _ttl(), 'contexto': contexto},
+                timeout=PERMANENCIA_MAXIMA,
+            )
+            return contexto
+        finally:
+            cache.delete(CHAVE_TRAVA)
+
+    if guardado:
+        return guardado['contexto']
+
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        guardado = cache.get(CHAVE_CONTEXTO)
+        if guardado:
+            return guardado['contexto']
+    return calcular()
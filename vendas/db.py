@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+from django.db import connection, transaction
+
+
+@contextmanager
+def snapshot_somente_leitura():
+    """
+    Abre uma transação somente leitura com um snapshot consistente do catálogo.
+    No PostgreSQL usamos REPEATABLE READ READ ONLY: a exportação inteira enxerga
+    o mesmo estado dos dados e nenhum lock de escrita é adquirido.
+    """
+    transacao_externa = connection.in_atomic_block
+    with transaction.atomic():
+        if not transacao_externa and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        yield
+
+
+def copy_disponivel() -> bool:
+    """
+    True quando o banco é PostgreSQL acessado pelo psycopg2, que oferece
+    'copy_expert' para COPY ... TO STDOUT / FROM STDIN.
+    """
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg2'
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import MovimentoEstoque, Produto, SaldoEstoque
+
+# Movimentos compactados por transação
+LOTE_COMPACTACAO = 10000
+
+
+def registrar_movimentos(movimentos: list):
+    """Grava movimentos no extrato (só INSERT, sem nenhuma leitura)."""
+    if movimentos:
+        MovimentoEstoque.objects.bulk_create(movimentos, batch_size=1000)
+
+
+def movimentos_dos_itens(itens, tipo: str, sinal: int) -> list:
+    """Um movimento por ItemVenda: sinal -1 para saída (venda), +1 para entrada (devolução)."""
+    return [
+        MovimentoEstoque(
+            produto_id=item.produto_id,
+            tipo=tipo,
+            quantidade=sinal * item.quantidade,
+            venda_id=item.venda_id,
+            item_venda_id=item.pk,
+        )
+        for item in itens
+    ]
+
+
+def registrar_ajuste(produto_id: int, quantidade: int, tipo: str = MovimentoEstoque.Tipo.AJUSTE):
+    if quantidade:
+        registrar_movimentos([MovimentoEstoque(produto_id=produto_id, tipo=tipo, quantidade=quantidade)])
+
+
+def produtos_com_saldo_do_extrato():
+    """
+    Produtos anotados com 'saldo_extrato': snapshot compactado + movimentos pendentes.
+    Deve ser igual a Produto.estoque; a diferença indica uma alteração fora do extrato.
+    """
+    pendentes = (
+        MovimentoEstoque.objects.filter(produto=OuterRef('pk'))
+        .order_by()
+        .values('produto')
+        .annotate(total=Sum('quantidade'))
+        .values('total')
+    )
+    return Produto.objects.annotate(
+        saldo_extrato=Coalesce('saldo_estoque__saldo', Value(0))
+        + Coalesce(Subquery(pendentes, output_field=IntegerField()), Value(0))
+    )
+
+
+def divergencias_do_extrato():
+    """Produtos cujo estoque não bate com o extrato."""
+    return produtos_com_saldo_do_extrato().exclude(saldo_extrato=F('estoque'))
+
+
+def compactar_extrato(antes_de) -> int:
+    """
+    Soma os movimentos anteriores a 'antes_de' no SaldoEstoque de cada produto
+    e os remove do extrato. Cada lote é uma transação: os movimentos são travados,
+    somados e apagados juntos, então nenhum é contado duas vezes nem perdido.
+    Devolve quantos movimentos foram compactados.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            movimentos = list(
+                MovimentoEstoque.objects.select_for_update()
+                .filter(criado_em__lt=antes_de)
+                .order_by('pk')
+                .values_list('pk', 'produto_id', 'quantidade')[:LOTE_COMPACTACAO]
+            )
+            if not movimentos:
+                return total
+
+            somas = {}
+            for _, produto_id, quantidade in movimentos:
+                somas[produto_id] = somas.get(produto_id, 0) + quantidade
+
+            agora = timezone.now()
+            saldos = SaldoEstoque.objects.select_for_update().in_bulk(list(somas))
+            novos = []
+            for produto_id, soma in somas.items():
+                saldo = saldos.get(produto_id)
+                if saldo is None:
+                    novos.append(SaldoEstoque(produto_id=produto_id, saldo=soma, compactado_em=agora))
+                else:
+                    saldo.saldo += soma
+                    saldo.compactado_em = agora
+            SaldoEstoque.objects.bulk_create(novos)
+            SaldoEstoque.objects.bulk_update(saldos.values(), ['saldo', 'compactado_em'], batch_size=1000)
+            MovimentoEstoque.objects.filter(pk__in=[pk for pk, _, _ in movimentos]).delete()
+            total += len(movimentos)
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+from .db import snapshot_somente_leitura
+from .exporters import ExporterFactory
+from .metricas import medir_iteracao
+
+# Modos de divisão do catálogo em partes (shards)
+MODO_CATEGORIA = 'categoria'
+MODO_FAIXA = 'faixa'
+MODOS = (MODO_CATEGORIA, MODO_FAIXA)
+
+# Produtos por parte no modo 'faixa' (intervalos de pk)
+TAMANHO_FAIXA = 50000
+# Bloco usado para copiar cada parte para dentro do ZIP
+BLOCO_COPIA = 256 * 1024
+
+CHAVE_VAGA = 'vendas:exportacao_zip:vaga:{}'
+# Uma vaga expira sozinha se o worker que a reservou morrer no meio da exportação;
+# enquanto a resposta está sendo enviada ela é renovada
+VALIDADE_VAGA = 60
+# Segundos sugeridos no Retry-After a quem não conseguiu uma vaga
+NOVA_TENTATIVA = 10
+
+
+def planejar_shards(queryset: QuerySet, modo: str = MODO_CATEGORIA, tamanho_faixa: int = TAMANHO_FAIXA) -> list:
+    """
+    Divide o queryset em partes independentes.
+    Cada parte é um dicionário com 'nome' (usado no nome do arquivo) e 'filtro'
+    (kwargs de .filter()), que precisa ser serializável para ir a outro processo.
+    """
+    if modo not in MODOS:
+        raise ValueError(f"Modo de divisão desconhecido: {modo}")
+
+    base = queryset.order_by()
+    if modo == MODO_CATEGORIA:
+        shards = []
+        for categoria_id in base.values_list('categoria_id', flat=True).distinct():
+            if categoria_id is None:
+                shards.append({'nome': 'sem-categoria', 'filtro': {'categoria__isnull': True}})
+            else:
+                shards.append({'nome': f'categoria-{categoria_id}', 'filtro': {'categoria_id': categoria_id}})
+        return sorted(shards, key=lambda shard: shard['nome'])
+
+    limites = base.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+    if limites['minimo'] is None:
+        return []
+    return [
+        {'nome': f'faixa-{inicio}-{inicio + tamanho_faixa - 1}', 'filtro': {'pk__gte': inicio, 'pk__lt': inicio + tamanho_faixa}}
+        for inicio in range(limites['minimo'], limites['maximo'] + 1, tamanho_faixa)
+    ]
+
+
+def _inicializar_worker():
+    # Com 'spawn' o processo filho começa do zero; com 'fork' o Django já está pronto
+    # e as conexões herdadas foram fechadas pelo processo pai antes do fork.
+    django.setup()
+
+
+def exportar_shard(formato: str, query, shard: dict, opcoes: dict) -> dict:
+    """
+    Serializa uma parte em um arquivo temporário (executado no processo filho).
+    Contagem e conteúdo saem do mesmo snapshot somente leitura.
+    """
+    from .models import Produto
+
+    queryset = Produto.objects.all()
+    queryset.query = query
+    queryset = queryset.filter(**shard['filtro'])
+    exporter = ExporterFactory().get_exporter(formato, queryset, **opcoes)
+
+    # 'produtos.json.gz' -> 'produtos-categoria-3.json.gz'
+    base, ponto, extensao = exporter.nome_arquivo.partition('.')
+    hash_conteudo = hashlib.sha256()
+    tamanho = 0
+    with tempfile.NamedTemporaryFile(prefix='export-shard-', delete=False) as saida:
+        try:
+            with snapshot_somente_leitura():
+                linhas = queryset.count()
+                for bloco in exporter.iter_bytes():
+                    saida.write(bloco)
+                    hash_conteudo.update(bloco)
+                    tamanho += len(bloco)
+        except BaseException:
+            os.unlink(saida.name)
+            raise
+
+    return {
+        'arquivo': f"{base}-{shard['nome']}{ponto}{extensao}",
+        'caminho': saida.name,
+        'linhas': linhas,
+        'bytes': tamanho,
+        'sha256': hash_conteudo.hexdigest(),
+        'filtro': shard['filtro'],
+    }
+
+
+class VagaExportacao:
+    """
+    Uma das EXPORTACAO_ZIP_SIMULTANEAS vagas de exportação ZIP (cada uma usa
+    um pool de processos inteiro), reservada com cache.add no cache do Django:
+    com CACHE_DIR o limite vale para todos os workers do gunicorn, sem ele
+    vale por processo.
+    """
+
+    def __init__(self, chave: str, dono: str):
+        self.chave = chave
+        self.dono = dono
+        self.renovada_em = time.monotonic()
+
+    @classmethod
+    def reservar(cls):
+        """Reserva uma vaga livre; None se todas estão ocupadas."""
+        dono = uuid.uuid4().hex
+        for numero in range(getattr(settings, 'EXPORTACAO_ZIP_SIMULTANEAS', 1)):
+            chave = CHAVE_VAGA.format(numero)
+            if cache.add(chave, dono, timeout=VALIDADE_VAGA):
+                return cls(chave, dono)
+        return None
+
+    def renovar(self):
+        if time.monotonic() - self.renovada_em > VALIDADE_VAGA / 3:
+            cache.touch(self.chave, VALIDADE_VAGA)
+            self.renovada_em = time.monotonic()
+
+    def liberar(self):
+        # Só apaga a vaga se ela ainda for desta exportação (pode ter expirado e sido reservada de novo)
+        if cache.get(self.chave) == self.dono:
+            cache.delete(self.chave)
+
+    def acompanhar(self, pedacos: Iterator[bytes]) -> '_PedacosComVaga':
+        return _PedacosComVaga(pedacos, self)
+
+
+class _PedacosComVaga:
+    """
+    Repassa os pedaços da resposta renovando a vaga. O Django chama close()
+    ao fim da resposta, mesmo que ela nem tenha começado a ser enviada
+    (cliente desconectado), e a vaga é liberada aí.
+    """
+
+    def __init__(self, pedacos: Iterator[bytes], vaga: VagaExportacao):
+        self.pedacos = iter(pedacos)
+        self.vaga = vaga
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        self.vaga.renovar()
+        return next(self.pedacos)
+
+    def close(self):
+        try:
+            if hasattr(self.pedacos, 'close'):
+                self.pedacos.close()
+        finally:
+            self.vaga.liberar()
+
+
+class _SaidaZip:
+    """
+    Destino "não posicionável" para o ZipFile: o zipfile percebe que não há
+    seek/tell e grava os tamanhos em data descriptors, permitindo gerar o
+    ZIP enquanto ele é enviado ao cliente.
+    """
+    def __init__(self):
+        self.pendente = bytearray()
+
+    def write(self, dados) -> int:
+        self.pendente += dados
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self) -> bytes:
+        dados = bytes(self.pendente)
+        self.pendente.clear()
+        return dados
+
+
+class ExportacaoZip:
+    """
+    Exportação do catálogo em partes, serializadas em paralelo por um pool de
+    processos (uma CPU por parte) e reunidas em um único ZIP com um manifest.json.
+
+    Cada parte lê o próprio snapshot: as partes são consistentes internamente,
+    mas escritas concorrentes podem aparecer em umas e não em outras.
+    """
+    filename = 'produtos.zip'
+
+    def __init__(
+        self,
+        formato: str,
+        queryset: QuerySet,
+        modo: str = MODO_CATEGORIA,
+        tamanho_faixa: int = TAMANHO_FAIXA,
+        processos: int = None,
+        **opcoes,
+    ):
+        # Valida formato e opções antes de qualquer trabalho
+        ExporterFactory().get_exporter(formato, queryset, **opcoes)
+        self.formato = formato
+        self.queryset = queryset
+        self.modo = modo
+        self.shards = planejar_shards(queryset, modo, tamanho_faixa)
+        self.processos = processos or getattr(settings, 'EXPORTACAO_ZIP_PROCESSOS', None) or os.cpu_count() or 1
+        self.opcoes = opcoes
+
+    def _em_paralelo(self) -> bool:
+        # Um banco SQLite em memória não é visível a outros processos
+        em_memoria = connection.vendor == 'sqlite' and connection.is_in_memory_db()
+        return self.processos > 1 and len(self.shards) > 1 and not em_memoria
+
+    def _resultados(self) -> Iterator[dict]:
+        """Gera as partes prontas na ordem em que terminam."""
+        if not self._em_paralelo():
+            for shard in self.shards:
+                yield exportar_shard(self.formato, self.queryset.query, shard, self.opcoes)
+            return
+
+        # Conexões abertas não podem ser compartilhadas com processos criados por fork
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(self.processos, len(self.shards)), initializer=_inicializar_worker) as pool:
+            futuros = [
+                pool.submit(exportar_shard, self.formato, self.queryset.query, shard, self.opcoes)
+                for shard in self.shards
+            ]
+            try:
+                for futuro in as_completed(futuros):
+                    yield futuro.result()
+            finally:
+                # Cliente desconectou ou uma parte falhou: descarta o que ainda não começou
+                # e apaga os arquivos temporários das partes que não foram enviadas
+                pool.shutdown(wait=True, cancel_futures=True)
+                for futuro in futuros:
+                    if not futuro.cancelled() and futuro.exception() is None:
+                        resultado = futuro.result()
+                        if os.path.exists(resultado['caminho']):
+                            os.unlink(resultado['caminho'])
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        return medir_iteracao('exportacao_zip', self._gerar_zip())
+
+    def _gerar_zip(self) -> Iterator[bytes]:
+        saida = _SaidaZip()
+        manifesto = []
+        with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_STORED) as arquivo_zip:
+            for resultado in self._resultados():
+                try:
+                    # As partes já vêm comprimidas pelos processos (se pedido);
+                    # o processo principal só copia bytes
+                    with open(resultado['caminho'], 'rb') as parte, \
+                            arquivo_zip.open(resultado['arquivo'], 'w', force_zip64=True) as destino:
+                        while bloco := parte.read(BLOCO_COPIA):
+                            destino.write(bloco)
+                            yield saida.retirar()
+                finally:
+                    os.unlink(resultado['caminho'])
+                manifesto.append({campo: valor for campo, valor in resultado.items() if campo != 'caminho'})
+                yield saida.retirar()
+
+            manifesto.sort(key=lambda parte: parte['arquivo'])
+            arquivo_zip.writestr('manifest.json', json.dumps({
+                'formato': self.formato,
+                'modo': self.modo,
+                'gerado_em': timezone.now().isoformat(),
+                'total_linhas': sum(parte['linhas'] for parte in manifesto),
+                'partes': manifesto,
+            }, indent=4, ensure_ascii=False))
+        yield saida.retirar()
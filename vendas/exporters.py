@@ -1,9 +1,98 @@
+import bz2
+import codecs
+import csv
 import json
+import lzma
+import queue
+import threading
+import zlib
 from abc import ABC, abstractmethod
-from dicttoxml import dicttoxml
-from xml.dom.minidom import parseString
+from io import StringIO
+from numbers import Number
+from typing import Iterator
+from django.db import connection
 from django.db.models import QuerySet
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from .db import copy_disponivel, snapshot_somente_leitura
+from .metricas import medir_iteracao
+
+# Campos exportados (na ordem em que aparecem nos arquivos)
+CAMPOS_EXPORTACAO = (
+    'id',
+    'nome',
+    'descricao',
+    'categoria__nome',
+    'preco',
+    'estoque',
+)
+
+# Compressões aceitas em ?compress=: (fábrica do compressor, content-type, extensão)
+# 'gzip' também é usado quando o cliente envia Accept-Encoding: gzip
+COMPRESSORES = {
+    'gzip': (lambda: zlib.compressobj(6, zlib.DEFLATED, 31), 'application/gzip', '.gz'),
+    'bz2': (bz2.BZ2Compressor, 'application/x-bzip2', '.bz2'),
+    'xz': (lzma.LZMACompressor, 'application/x-xz', '.xz'),
+}
+
+
+
+class _CopyCancelado(Exception):
+    """Quem envia os blocos desistiu (cliente desconectado ou erro)."""
+
+
+class _SaidaCopy:
+    """
+    Destino do copy_expert, que roda em outra thread: junta as linhas em blocos
+    de 'tamanho' bytes e os passa por uma fila limitada para o gerador da resposta.
+    """
+    _FIM = object()
+
+    def __init__(self, tamanho: int, blocos_na_fila: int = 4):
+        self.tamanho = tamanho
+        self.fila = queue.Queue(maxsize=blocos_na_fila)
+        self.cancelado = threading.Event()
+        self.pendente = bytearray()
+
+    def write(self, dados) -> int:
+        self.pendente += dados
+        if len(self.pendente) >= self.tamanho:
+            self._entregar(bytes(self.pendente))
+            self.pendente.clear()
+        return len(dados)
+
+    def _entregar(self, item):
+        while not self.cancelado.is_set():
+            try:
+                self.fila.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _CopyCancelado()
+
+    def copiar(self, cursor, sql: str):
+        """Executado na thread: o fim (ou o erro) do COPY também passa pela fila."""
+        try:
+            cursor.copy_expert(sql, self)
+            if self.pendente:
+                self._entregar(bytes(self.pendente))
+            self._entregar(self._FIM)
+        except _CopyCancelado:
+            pass
+        except BaseException as e:
+            try:
+                self._entregar(e)
+            except _CopyCancelado:
+                pass
+
+    def blocos(self) -> Iterator[bytes]:
+        while (item := self.fila.get()) is not self._FIM:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def cancelar(self):
+        self.cancelado.set()
+
 
 # --- Padrão de Projeto: Factory Method ---
 
@@ -11,99 +100,340 @@ from django.http import HttpResponse
 class BaseExporter(ABC):
     """
     Interface para diferentes tipos de exportadores.
-    Define o método 'export' que todas as classes concretas devem implementar.
+    Cada classe concreta implementa 'render', que gera o conteúdo em pedaços;
+    'export' decide se a resposta é montada em memória ou enviada em streaming.
     """
-    def __init__(self, queryset: QuerySet):
+    content_type = 'application/octet-stream'
+    filename = 'produtos'
+
+    # Linhas lidas por ida ao banco (cursor do lado do servidor)
+    chunk_size = 2000
+    # Tamanho aproximado de cada pedaço enviado ao cliente
+    buffer_size = 64 * 1024
+
+    def __init__(
+        self,
+        queryset: QuerySet,
+        streaming: bool = False,
+        chunk_size: int = None,
+        compact: bool = False,
+        compressao: str = None,
+        content_encoding: bool = False,
+    ):
+        """
+        compact: sem indentação (para integrações, em vez de leitura humana).
+        compressao: 'gzip', 'bz2' ou 'xz'; o corpo é comprimido enquanto é gerado.
+        content_encoding: entrega a compressão gzip como Content-Encoding
+        (negociada pelo Accept-Encoding) em vez de um arquivo .gz para download.
+        """
+        if compressao and compressao not in COMPRESSORES:
+            raise ValueError(f"Compressão desconhecida: {compressao}")
         self.queryset = queryset
+        self.streaming = streaming
+        self.compact = compact
+        self.compressao = compressao
+        self.content_encoding = content_encoding and compressao == 'gzip'
+        if chunk_size:
+            self.chunk_size = chunk_size
 
     @abstractmethod
-    def export(self) -> HttpResponse:
+    def render(self) -> Iterator[str]:
+        """Gera o conteúdo do arquivo em pedaços de texto."""
         pass
 
-    def get_data_to_export(self) -> list:
-        """Helper que transforma o queryset do Django em uma lista de dicionários."""
-        return list(self.queryset.values(
-            'id', 
-            'nome', 
-            'descricao', 
-            'categoria__nome', 
-            'preco', 
-            'estoque'
-        ))
+    def iter_bytes(self) -> Iterator[bytes]:
+        """Conteúdo final do arquivo (já comprimido, se for o caso) em blocos de bytes."""
+        conteudo = self._agrupar(self.render())
+        if self.compressao:
+            conteudo = self._comprimir(conteudo)
+        # Medido do primeiro ao último bloco (inclui o tempo de streaming)
+        return medir_iteracao(f"exportacao_{self.filename.rsplit('.', 1)[-1]}", conteudo)
+
+    @property
+    def nome_arquivo(self) -> str:
+        """Nome do arquivo gerado, com a extensão da compressão quando há uma."""
+        if self.compressao and not self.content_encoding:
+            return self.filename + COMPRESSORES[self.compressao][2]
+        return self.filename
+
+    def export(self) -> HttpResponse:
+        conteudo = self.iter_bytes()
+        if self.streaming:
+            response = StreamingHttpResponse(conteudo)
+        else:
+            response = HttpResponse(b''.join(conteudo))
+        return self._com_cabecalhos(response)
+
+    def export_from_cache(self, corpo: bytes) -> HttpResponse:
+        """Monta a resposta a partir de um corpo já serializado (cache de exportações)."""
+        return self._com_cabecalhos(HttpResponse(corpo))
+
+    def _com_cabecalhos(self, response: HttpResponse) -> HttpResponse:
+        content_type = self.content_type
+        if self.content_encoding:
+            response['Content-Encoding'] = 'gzip'
+        elif self.compressao:
+            # Compressão pedida explicitamente: o download é o arquivo comprimido
+            content_type = COMPRESSORES[self.compressao][1]
+        response['Content-Type'] = content_type
+        response['Content-Disposition'] = f'attachment; filename="{self.nome_arquivo}"'
+        return response
+
+    def _comprimir(self, pedacos: Iterator[bytes]) -> Iterator[bytes]:
+        fabrica, _, _ = COMPRESSORES[self.compressao]
+        compressor = fabrica()
+        for pedaco in pedacos:
+            comprimido = compressor.compress(pedaco)
+            if comprimido:
+                yield comprimido
+        yield compressor.flush()
+
+    def iter_data_to_export(self) -> Iterator[dict]:
+        """
+        Helper que percorre o queryset com um cursor do lado do servidor.
+        Só 'chunk_size' linhas ficam em memória por vez, dentro de um snapshot
+        somente leitura que dura até o fim da iteração.
+        """
+        with snapshot_somente_leitura():
+            yield from self.queryset.values(*CAMPOS_EXPORTACAO).iterator(chunk_size=self.chunk_size)
+
+    def iter_copy_to_stdout(self, montar_copy) -> Iterator[str]:
+        """
+        Fast path do PostgreSQL: o próprio servidor gera o arquivo com COPY ... TO STDOUT.
+        'montar_copy' recebe o SELECT do queryset e devolve o comando COPY.
+        O copy_expert do psycopg2 só volta no fim do COPY, então ele roda em uma
+        thread que entrega blocos de 'buffer_size' por uma fila limitada: o
+        primeiro bloco sai assim que o servidor o gera e a memória continua
+        constante (a thread espera enquanto o cliente não consome).
+        """
+        with snapshot_somente_leitura(), connection.cursor() as cursor:
+            sql, params = self.queryset.values_list(*CAMPOS_EXPORTACAO).query.sql_with_params()
+            select_sql = cursor.mogrify(sql, params).decode('utf-8')
+            saida = _SaidaCopy(self.buffer_size)
+            thread = threading.Thread(
+                target=saida.copiar, args=(cursor, montar_copy(select_sql)), name='copy-to-stdout', daemon=True
+            )
+            thread.start()
+            try:
+                utf8 = codecs.getincrementaldecoder('utf-8')()
+                for bloco in saida.blocos():
+                    yield utf8.decode(bloco)
+                yield utf8.decode(b'', final=True)
+            finally:
+                # Cliente desconectou ou o COPY falhou: a thread para no próximo write
+                # e a conexão só volta a ser usada (rollback do snapshot) depois dela
+                saida.cancelar()
+                thread.join()
+
+    def _agrupar(self, pedacos: Iterator[str]) -> Iterator[bytes]:
+        """Junta pedaços pequenos para não fazer uma escrita no socket por linha."""
+        buffer = StringIO()
+        for pedaco in pedacos:
+            buffer.write(pedaco)
+            if buffer.tell() >= self.buffer_size:
+                yield buffer.getvalue().encode('utf-8')
+                buffer = StringIO()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
 
 # Produto Concreto 1: JSON
 class JsonExporter(BaseExporter):
     """Exporta os dados como um arquivo JSON."""
-    
-    def export(self) -> HttpResponse:
-        data = self.get_data_to_export()
-        json_data = json.dumps(data, indent=4, ensure_ascii=False, default=str)
-        
-        response = HttpResponse(json_data, content_type='application/json')
-        response['Content-Disposition'] = 'attachment; filename="produtos.json"'
-        return response
+    content_type = 'application/json'
+    filename = 'produtos.json'
+
+    def render(self) -> Iterator[str]:
+        if self.compact:
+            yield from self._render_compacto()
+            return
+        # Mesmo resultado de json.dumps(lista, indent=4), mas item a item
+        primeiro = True
+        for item in self.iter_data_to_export():
+            item_json = json.dumps(item, indent=4, ensure_ascii=False, default=str)
+            yield ('[\n    ' if primeiro else ',\n    ') + item_json.replace('\n', '\n    ')
+            primeiro = False
+        yield '[]' if primeiro else '\n]'
+
+    def _render_compacto(self) -> Iterator[str]:
+        separador = '['
+        for item in self.iter_data_to_export():
+            yield separador + json.dumps(item, ensure_ascii=False, default=str, separators=(',', ':'))
+            separador = ','
+        yield '[]' if separador == '[' else ']'
+
+class XmlIncrementalWriter:
+    """
+    Serializador XML incremental: escreve um <produto> por vez.
+    Gera exatamente o mesmo documento que dicttoxml + minidom.toprettyxml
+    (inclusive o atributo 'type' e a indentação), sem montar o DOM inteiro.
+    """
+    def __init__(self, root: str = 'produtos', item: str = 'produto', compact: bool = False):
+        self.root = root
+        self.item = item
+        # No modo compacto não há indentação nem quebras de linha
+        self.indent = '' if compact else '  '
+        self.newl = '' if compact else '\n'
+
+    def cabecalho(self) -> str:
+        return f'<?xml version="1.0" ?>\n<{self.root}>{self.newl}'
+
+    def rodape(self) -> str:
+        return f'</{self.root}>\n'
+
+    def documento_vazio(self) -> str:
+        return f'<?xml version="1.0" ?>\n<{self.root}/>\n'
+
+    def elemento(self, dados: dict) -> str:
+        linhas = [f'{self.indent}<{self.item} type="dict">']
+        for campo, valor in dados.items():
+            texto = self._escapar(valor)
+            tipo = self._tipo(valor)
+            if texto:
+                linhas.append(f'{self.indent * 2}<{campo} type="{tipo}">{texto}</{campo}>')
+            else:
+                linhas.append(f'{self.indent * 2}<{campo} type="{tipo}"/>')
+        linhas.append(f'{self.indent}</{self.item}>{self.newl}')
+        return self.newl.join(linhas)
+
+    @staticmethod
+    def _tipo(valor) -> str:
+        # Mesmos nomes de tipo usados pelo dicttoxml
+        if valor is None:
+            return 'null'
+        if isinstance(valor, str):
+            return 'str'
+        if isinstance(valor, bool):
+            return 'bool'
+        if isinstance(valor, int):
+            return 'int'
+        if isinstance(valor, float):
+            return 'float'
+        if isinstance(valor, Number):
+            return 'number'
+        return 'str'
+
+    @staticmethod
+    def _escapar(valor) -> str:
+        if valor is None:
+            return ''
+        if isinstance(valor, bool):
+            valor = str(valor).lower()
+        return (
+            str(valor)
+            .replace('&', '&amp;')
+            .replace('<', '&lt;')
+            .replace('"', '&quot;')
+            .replace('>', '&gt;')
+        )
 
 # Produto Concreto 2: XML
 class XmlExporter(BaseExporter):
     """Exporta os dados como um arquivo XML."""
+    content_type = 'application/xml'
+    filename = 'produtos.xml'
 
-    def export(self) -> HttpResponse:
-        data = self.get_data_to_export()
-        
-        # Usamos a biblioteca dicttoxml para converter a lista de dicts
-        # O 'custom_root' será <produtos>, e cada item será <produto>
-        xml_data = dicttoxml(data, custom_root='produtos', item_func=lambda x: 'produto')
-        
-        # Deixa o XML bonito (com indentação)
-        dom = parseString(xml_data)
-        pretty_xml = dom.toprettyxml(indent="  ")
-        
-        response = HttpResponse(pretty_xml, content_type='application/xml')
-        response['Content-Disposition'] = 'attachment; filename="produtos.xml"'
-        return response
+    def render(self) -> Iterator[str]:
+        writer = XmlIncrementalWriter(root='produtos', item='produto', compact=self.compact)
+        primeiro = True
+        for item in self.iter_data_to_export():
+            if primeiro:
+                yield writer.cabecalho()
+                primeiro = False
+            yield writer.elemento(item)
+
+        yield writer.documento_vazio() if primeiro else writer.rodape()
 
 # Produto Concreto 3: TXT (Relatório Simples)
 class TxtExporter(BaseExporter):
     """Exporta os dados como um relatório simples em .txt."""
+    content_type = 'text/plain; charset=utf-8'
+    filename = 'relatorio_produtos.txt'
 
-    def export(self) -> HttpResponse:
-        data = self.get_data_to_export()
-        
-        report_lines = []
-        report_lines.append("RELATÓRIO DE PRODUTOS\n")
-        report_lines.append("="*40 + "\n\n")
-        
+    def render(self) -> Iterator[str]:
+        linhas = self._report_lines()
+        yield next(linhas)
+        for linha in linhas:
+            yield "\n" + linha
+
+    def _report_lines(self) -> Iterator[str]:
+        yield "RELATÓRIO DE PRODUTOS\n"
+        yield "="*40 + "\n\n"
+
+        total_itens = 0
         total_estoque = 0
         total_valor_estoque = 0
-        
-        for item in data:
+
+        for item in self.iter_data_to_export():
             preco = item.get('preco', 0)
             estoque = item.get('estoque', 0)
             valor_item = (preco or 0) * (estoque or 0)
-            
-            report_lines.append(f"ID:       {item.get('id')}")
-            report_lines.append(f"Nome:     {item.get('nome')}")
-            report_lines.append(f"Categoria:{item.get('categoria__nome', '-')}")
-            report_lines.append(f"Preço:    R$ {preco:.2f}")
-            report_lines.append(f"Estoque:  {estoque} unidades")
-            report_lines.append(f"Subtotal: R$ {valor_item:.2f}")
-            report_lines.append("-"*40 + "\n")
-            
+
+            yield f"ID:       {item.get('id')}"
+            yield f"Nome:     {item.get('nome')}"
+            yield f"Categoria:{item.get('categoria__nome', '-')}"
+            yield f"Preço:    R$ {preco:.2f}"
+            yield f"Estoque:  {estoque} unidades"
+            yield f"Subtotal: R$ {valor_item:.2f}"
+            yield "-"*40 + "\n"
+
+            total_itens += 1
             total_estoque += estoque
             total_valor_estoque += valor_item
 
-        report_lines.append("\n" + "="*40)
-        report_lines.append("RESUMO DO RELATÓRIO\n")
-        report_lines.append(f"Total de Itens:   {len(data)}")
-        report_lines.append(f"Total em Estoque: {total_estoque} unidades")
-        report_lines.append(f"Valor Total:      R$ {total_valor_estoque:.2f}")
-        report_lines.append("="*40)
-        
-        report_content = "\n".join(report_lines)
-        
-        response = HttpResponse(report_content, content_type='text/plain; charset=utf-8')
-        response['Content-Disposition'] = 'attachment; filename="relatorio_produtos.txt"'
-        return response
+        yield "\n" + "="*40
+        yield "RESUMO DO RELATÓRIO\n"
+        yield f"Total de Itens:   {total_itens}"
+        yield f"Total em Estoque: {total_estoque} unidades"
+        yield f"Valor Total:      R$ {total_valor_estoque:.2f}"
+        yield "="*40
+
+# Produto Concreto 4: CSV
+class CsvExporter(BaseExporter):
+    """Exporta os dados como CSV (uma linha por produto)."""
+    content_type = 'text/csv; charset=utf-8'
+    filename = 'produtos.csv'
+    cabecalho = ['id', 'nome', 'descricao', 'categoria', 'preco', 'estoque']
+
+    def render(self) -> Iterator[str]:
+        yield ','.join(self.cabecalho) + '\n'
+        if copy_disponivel():
+            yield from self.iter_copy_to_stdout(
+                lambda select_sql: f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv)"
+            )
+            return
+
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for item in self.iter_data_to_export():
+            writer.writerow([item[campo] for campo in CAMPOS_EXPORTACAO])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+# Produto Concreto 5: NDJSON (um objeto JSON por linha)
+class NdjsonExporter(BaseExporter):
+    """Exporta os dados como JSON delimitado por quebras de linha."""
+    content_type = 'application/x-ndjson'
+    filename = 'produtos.ndjson'
+
+    def render(self) -> Iterator[str]:
+        if copy_disponivel():
+            colunas = ', '.join(CAMPOS_EXPORTACAO)
+            # Os caracteres de controle \x01/\x02 como QUOTE/DELIMITER fazem o COPY
+            # em formato csv devolver o JSON sem nenhum escape adicional
+            yield from self.iter_copy_to_stdout(
+                lambda select_sql: (
+                    "COPY (SELECT row_to_json(r) FROM ("
+                    "SELECT t.id, t.nome, t.descricao, t.categoria__nome, t.preco::text AS preco, t.estoque "
+                    f"FROM ({select_sql}) AS t({colunas})) AS r) "
+                    "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+                )
+            )
+            return
+
+        for item in self.iter_data_to_export():
+            # Mesmo formato compacto do row_to_json do PostgreSQL
+            yield json.dumps(item, ensure_ascii=False, default=str, separators=(',', ':')) + '\n'
 
 # O Criador (Factory)
 class ExporterFactory:
@@ -114,16 +444,19 @@ class ExporterFactory:
         'json': JsonExporter,
         'xml': XmlExporter,
         'txt': TxtExporter,
+        'csv': CsvExporter,
+        'ndjson': NdjsonExporter,
     }
 
-    def get_exporter(self, format: str, queryset: QuerySet) -> BaseExporter:
+    def get_exporter(self, format: str, queryset: QuerySet, streaming: bool = False, **opcoes) -> BaseExporter:
         """
         O "Factory Method".
         Recebe o formato e o queryset, e retorna a instância correta.
+        'opcoes' (compact, compressao, content_encoding) são repassadas ao exportador.
         """
         exporter_class = self.exporters.get(format)
-        
+
         if not exporter_class:
             raise ValueError(f"Formato de exportação desconhecido: {format}")
-            
-        return exporter_class(queryset)
\ No newline at end of file
+
+        return exporter_class(queryset, streaming=streaming, **opcoes)
@@ -1,7 +1,34 @@
+import logging
 from decimal import Decimal
 from django.db import transaction
-from django.db.models import F
-from .models import Venda, ItemVenda, Produto
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from .models import Venda, ItemVenda, Produto, MovimentoEstoque
+from .catalogo import registrar_alteracao_catalogo
+from .estoque import movimentos_dos_itens, registrar_movimentos
+from .metricas import medido
+from .orcamentos import orcamento_consultas
+from .resumo import registrar_no_resumo, somar_venda
+
+logger = logging.getLogger(__name__)
+
+
+class EstoqueInsuficiente(Exception):
+    """Um ou mais produtos não têm estoque para a quantidade pedida."""
+
+    def __init__(self, mensagem: str, produtos: list):
+        super().__init__(mensagem)
+        self.produtos = produtos
+
+
+# Limite de vendas aceitas em uma única chamada de criar_vendas_em_lote
+MAX_VENDAS_POR_LOTE = 5000
+
+# Faixa aceita para a data de uma venda. Datas nos extremos do datetime
+# (ano 1 ou 9999) estouram ao converter para o fuso local no resumo diário.
+ANO_MINIMO_VENDA = 1970
+ANO_MAXIMO_VENDA = 2100
 
 # --- Padrão de Projeto: Facade ---
 
@@ -13,29 +40,89 @@ class VendaFacade:
     def __init__(self):
         self.total_venda_calculado = Decimal('0.00')
 
+    @staticmethod
+    def _quantidades_por_produto(itens) -> dict:
+        """{produto_id: quantidade total} dos itens."""
+        quantidades = {}
+        for item in itens:
+            quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+        return quantidades
+
+    def _travar_produtos(self, quantidades: dict):
+        # Sempre em ordem de pk: duas transações com os mesmos produtos
+        # travam na mesma ordem, então não há deadlock
+        list(
+            Produto.objects.select_for_update()
+            .filter(pk__in=quantidades)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+
+    @staticmethod
+    def _quantidade_por_pk(quantidades: dict) -> Case:
+        return Case(
+            *[When(pk=pk, then=Value(quantidade)) for pk, quantidade in quantidades.items()],
+            output_field=IntegerField(),
+        )
+
     @transaction.atomic
     def _devolver_estoque(self, venda: Venda):
-        """Método helper para retornar itens ao estoque."""
-        print(f"Devolvendo estoque para Venda {venda.id}")
-        itens = venda.itens.all()
-        for item in itens:
-            # Usamos F() para segurança contra race conditions
-            item.produto.estoque = F('estoque') + item.quantidade
-            item.produto.save(update_fields=['estoque'])
+        """Método helper para retornar itens ao estoque (número fixo de consultas)."""
+        logger.info("Devolvendo estoque para Venda %s", venda.id)
+        itens = list(venda.itens.only('pk', 'venda_id', 'produto_id', 'quantidade'))
+        quantidades = self._quantidades_por_produto(itens)
+        if not quantidades:
+            return itens
+        self._travar_produtos(quantidades)
+        Produto.objects.filter(pk__in=quantidades).update(
+            estoque=F('estoque') + self._quantidade_por_pk(quantidades)
+        )
+        registrar_movimentos(movimentos_dos_itens(itens, MovimentoEstoque.Tipo.DEVOLUCAO, +1))
+        registrar_alteracao_catalogo(quantidades)
+        return itens
 
     @transaction.atomic
     def _retirar_estoque(self, venda: Venda):
-        """Método helper para retirar itens do estoque (ao criar ou re-ativar)."""
-        print(f"Retirando estoque para Venda {venda.id}")
-        itens = venda.itens.all()
-        for item in itens:
-            # Recarrega o produto para ter o estoque mais atual
-            produto = Produto.objects.get(pk=item.produto.pk)
-            if produto.estoque < item.quantidade:
-                raise Exception(f"Estoque insuficiente para re-ativar venda: {produto.nome}")
-            produto.estoque = F('estoque') - item.quantidade
-            produto.save(update_fields=['estoque'])
+        """Método helper para retirar itens do estoque (ao re-ativar uma venda)."""
+        logger.info("Retirando estoque para Venda %s", venda.id)
+        itens = list(venda.itens.only('pk', 'venda_id', 'produto_id', 'quantidade'))
+        quantidades = self._quantidades_por_produto(itens)
+        self._baixar_estoque(quantidades, "Estoque insuficiente para re-ativar venda")
+        registrar_movimentos(movimentos_dos_itens(itens, MovimentoEstoque.Tipo.REATIVACAO, -1))
+        registrar_alteracao_catalogo(quantidades)
+        return itens
 
+    def _baixar_estoque(self, quantidades: dict, mensagem: str, ja_travados: bool = False):
+        """
+        Baixa o estoque de vários produtos de uma vez ({produto_id: quantidade}).
+        1. Trava as linhas em ordem de pk (ver '_travar_produtos');
+        2. Um único UPDATE ... CASE com a guarda 'estoque >= quantidade':
+           o banco nunca deixa o estoque ficar negativo, mesmo que o valor
+           lido pelo formulário já esteja desatualizado.
+        Se alguma linha não passou pela guarda, levanta EstoqueInsuficiente
+        (a transação de quem chamou desfaz o resto).
+        """
+        if not quantidades:
+            return
+        if not ja_travados:
+            self._travar_produtos(quantidades)
+        quantidade_pedida = self._quantidade_por_pk(quantidades)
+        atualizados = Produto.objects.filter(
+            pk__in=quantidades, estoque__gte=quantidade_pedida
+        ).update(estoque=F('estoque') - quantidade_pedida)
+
+        if atualizados != len(quantidades):
+            sem_estoque = [
+                f"{nome} (disponível: {estoque}, pedido: {quantidades[pk]})"
+                for pk, nome, estoque in Produto.objects.filter(pk__in=quantidades)
+                .order_by('nome')
+                .values_list('pk', 'nome', 'estoque')
+                if estoque < quantidades[pk]
+            ]
+            raise EstoqueInsuficiente(f"{mensagem}: {', '.join(sem_estoque)}", sem_estoque)
+
+    @orcamento_consultas(8)
+    @medido('atualizar_status_venda')
     @transaction.atomic
     def atualizar_status_venda(self, venda: Venda, old_status: str, new_status: str):
         """
@@ -44,17 +131,154 @@ class VendaFacade:
         """
         # Caso 1: Venda está sendo CANCELADA (e não estava antes)
         if new_status == Venda.StatusVenda.CANCELADA and old_status != Venda.StatusVenda.CANCELADA:
-            self._devolver_estoque(venda)
+            itens = sum(item.quantidade for item in self._devolver_estoque(venda))
         
         # Caso 2: Venda estava CANCELADA e está sendo re-ativada (ex: PAGA ou PENDENTE)
         elif new_status != Venda.StatusVenda.CANCELADA and old_status == Venda.StatusVenda.CANCELADA:
             # Verifica se há estoque para re-ativar
-            self._retirar_estoque(venda)
+            itens = sum(item.quantidade for item in self._retirar_estoque(venda))
         
         # Outras transições (ex: PENDENTE -> PAGA) não afetam o estoque.
+        elif new_status != old_status:
+            itens = venda.itens.aggregate(total=Sum('quantidade'))['total'] or 0
+
+        # A venda muda de linha no resumo do dia
+        if new_status != old_status:
+            variacoes = {}
+            somar_venda(variacoes, venda.data, old_status, venda.total, itens, sinal=-1)
+            somar_venda(variacoes, venda.data, new_status, venda.total, itens)
+            registrar_no_resumo(variacoes)
         return True
 
+    @orcamento_consultas(8)
+    @medido('atualizar_status_em_lote')
+    @transaction.atomic
+    def atualizar_status_em_lote(self, venda_ids: list, novo_status: str) -> list:
+        """
+        Aplica as regras de 'atualizar_status_venda' a várias vendas de uma vez
+        (ex.: fechamento do dia, marcando milhares de vendas como PAGA):
+        1. Trava as vendas (em ordem de pk) e lê o status atual;
+        2. Lê de uma só vez os itens das vendas canceladas ou re-ativadas;
+        3. Devoluções somam ao estoque disponível; re-ativações são aceitas na
+           ordem recebida enquanto houver estoque (as demais são rejeitadas);
+        4. Aplica o saldo líquido por produto com um único UPDATE e muda o
+           status das vendas aceitas com outro.
+        Devolve um resultado por id, na ordem recebida.
+        """
+        if novo_status not in Venda.StatusVenda.values:
+            raise ValueError(f"Status inválido: {novo_status!r}.")
+        if len(venda_ids) > MAX_VENDAS_POR_LOTE:
+            raise ValueError(f"Lote muito grande: máximo de {MAX_VENDAS_POR_LOTE} vendas por chamada.")
+
+        vendas = {
+            venda['pk']: venda
+            for venda in Venda.objects.select_for_update()
+            .filter(pk__in=venda_ids)
+            .order_by('pk')
+            .values('pk', 'status', 'data', 'total')
+        }
+        status_atual = {pk: venda['status'] for pk, venda in vendas.items()}
+        cancelar = {
+            pk for pk, status in status_atual.items()
+            if novo_status == Venda.StatusVenda.CANCELADA and status != Venda.StatusVenda.CANCELADA
+        }
+        reativar = {
+            pk for pk, status in status_atual.items()
+            if novo_status != Venda.StatusVenda.CANCELADA and status == Venda.StatusVenda.CANCELADA
+        }
+
+        itens_por_venda = {}
+        for item in ItemVenda.objects.filter(venda_id__in=cancelar | reativar).only(
+            'pk', 'venda_id', 'produto_id', 'quantidade'
+        ):
+            itens_por_venda.setdefault(item.venda_id, []).append(item)
+
+        # Saldo líquido a baixar por produto (negativo = devolução)
+        baixa = {}
+        for pk in cancelar:
+            for produto_id, quantidade in self._quantidades_por_produto(itens_por_venda.get(pk, [])).items():
+                baixa[produto_id] = baixa.get(produto_id, 0) - quantidade
+
+        produto_ids = {item.produto_id for itens in itens_por_venda.values() for item in itens}
+        estoques = dict(
+            Produto.objects.select_for_update()
+            .filter(pk__in=produto_ids)
+            .order_by('pk')
+            .values_list('pk', 'estoque')
+        )
+        nomes = {}
+        resultados = []
+        alteradas = {}  # dict: mantém a ordem e faz 'in' em O(1)
+        for pk in venda_ids:
+            if pk in alteradas:
+                # Id repetido na lista: a venda já foi alterada acima
+                resultados.append({'id': pk, 'status': 'inalterada'})
+                continue
+            if pk not in status_atual:
+                resultados.append({'id': pk, 'status': 'nao_encontrada'})
+                continue
+            if status_atual[pk] == novo_status:
+                resultados.append({'id': pk, 'status': 'inalterada'})
+                continue
+            if pk in reativar:
+                pedido = self._quantidades_por_produto(itens_por_venda.get(pk, []))
+                faltando = [
+                    produto_id for produto_id, quantidade in pedido.items()
+                    if estoques[produto_id] - baixa.get(produto_id, 0) < quantidade
+                ]
+                if faltando:
+                    if not nomes:
+                        nomes.update(Produto.objects.filter(pk__in=produto_ids).values_list('pk', 'nome'))
+                    resultados.append({
+                        'id': pk,
+                        'status': 'rejeitada',
+                        'erros': [f"Estoque insuficiente para re-ativar venda: {nomes[produto_id]}" for produto_id in faltando],
+                    })
+                    continue
+                for produto_id, quantidade in pedido.items():
+                    baixa[produto_id] = baixa.get(produto_id, 0) + quantidade
+            resultados.append({'id': pk, 'status': 'atualizada'})
+            alteradas[pk] = True
+
+        baixa = {produto_id: quantidade for produto_id, quantidade in baixa.items() if quantidade}
+        if baixa:
+            self._baixar_estoque(baixa, "Estoque insuficiente para re-ativar venda", ja_travados=True)
+        movimentos = []
+        for pk in alteradas:
+            if pk in cancelar:
+                movimentos += movimentos_dos_itens(itens_por_venda.get(pk, []), MovimentoEstoque.Tipo.DEVOLUCAO, +1)
+            elif pk in reativar:
+                movimentos += movimentos_dos_itens(itens_por_venda.get(pk, []), MovimentoEstoque.Tipo.REATIVACAO, -1)
+        registrar_movimentos(movimentos)
+        if movimentos:
+            registrar_alteracao_catalogo(produto_ids)
 
+        # Resumo diário: cada venda alterada sai da linha do status antigo e entra na do novo.
+        # Os itens das canceladas/re-ativadas já foram lidos; os das demais são somados no banco.
+        quantidade_itens = {pk: sum(item.quantidade for item in itens) for pk, itens in itens_por_venda.items()}
+        itens_lidos = cancelar | reativar
+        sem_itens_lidos = [pk for pk in alteradas if pk not in itens_lidos]
+        if sem_itens_lidos:
+            quantidade_itens.update(
+                ItemVenda.objects.filter(venda_id__in=sem_itens_lidos)
+                .values('venda_id')
+                .annotate(total=Sum('quantidade'))
+                .values_list('venda_id', 'total')
+            )
+        variacoes = {}
+        for pk in alteradas:
+            venda = vendas[pk]
+            itens = quantidade_itens.get(pk, 0)
+            somar_venda(variacoes, venda['data'], venda['status'], venda['total'], itens, sinal=-1)
+            somar_venda(variacoes, venda['data'], novo_status, venda['total'], itens)
+        registrar_no_resumo(variacoes)
+
+        Venda.objects.filter(pk__in=list(alteradas)).update(status=novo_status)
+        return resultados
+
+
+    @orcamento_consultas(9)
+    @medido('criar_venda')
     @transaction.atomic 
     def criar_venda(self, venda_form, itens_formset, request_files):
         
@@ -72,12 +296,14 @@ class VendaFacade:
         # Se a venda já nasce 'Cancelada', não processa itens,
         # não mexe no estoque e o total fica zero.
         if venda.status == Venda.StatusVenda.CANCELADA:
+            variacoes = {}
+            somar_venda(variacoes, venda.data, venda.status, venda.total, 0)
+            registrar_no_resumo(variacoes)
             return venda # Retorna a venda salva com total 0.00
 
         # --- Se a venda não for cancelada, continua o fluxo normal ---
         
         itens_para_salvar = []
-        produtos_para_atualizar_estoque = []
 
         # 4. Itera sobre os itens do formset
         for form in itens_formset:
@@ -86,9 +312,8 @@ class VendaFacade:
                 quantidade = form.cleaned_data.get('quantidade')
                 
                 if produto and quantidade and quantidade > 0:
-                    # 5. Verifica estoque
-                    if produto.estoque < quantidade:
-                        raise Exception(f"Estoque insuficiente para o produto: {produto.nome}")
+                    # 5. O estoque é verificado no banco, na baixa (passo 9):
+                    # o valor carregado pelo formulário pode já estar desatualizado
 
                     # 6. Calcula o subtotal e o total
                     preco_unitario_venda = produto.preco
@@ -104,19 +329,173 @@ class VendaFacade:
                     )
                     itens_para_salvar.append(item)
 
-                    # 7. Prepara a baixa de estoque (otimizado)
-                    produto.estoque = F('estoque') - quantidade
-                    produtos_para_atualizar_estoque.append(produto)
-
-        # 8. Salva os Itens e atualiza o Estoque
+        # 7. Salva os Itens
         if not itens_para_salvar:
              raise Exception("Uma venda (não cancelada) precisa ter pelo menos um item.")
              
         ItemVenda.objects.bulk_create(itens_para_salvar)
-        Produto.objects.bulk_update(produtos_para_atualizar_estoque, ['estoque'])
 
-        # 9. Atualiza a Venda com o total final
+        # 8. Atualiza a Venda com o total final
         venda.total = self.total_venda_calculado
         venda.save(update_fields=['total'])
+
+        # 9. Baixa o estoque por último: as linhas dos produtos (as mais disputadas)
+        # ficam travadas só até o commit, e não durante o resto da venda
+        quantidades = self._quantidades_por_produto(itens_para_salvar)
+        self._baixar_estoque(quantidades, "Estoque insuficiente")
+        registrar_movimentos(movimentos_dos_itens(itens_para_salvar, MovimentoEstoque.Tipo.VENDA, -1))
+        # O estoque faz parte da exportação do catálogo
+        registrar_alteracao_catalogo(quantidades)
+
+        # 10. Resumo diário do dashboard (na mesma transação)
+        variacoes = {}
+        somar_venda(variacoes, venda.data, venda.status, venda.total, sum(item.quantidade for item in itens_para_salvar))
+        registrar_no_resumo(variacoes)
         
-        return venda
\ No newline at end of file
+        return venda
+
+    @orcamento_consultas(7)
+    @medido('criar_vendas_em_lote')
+    @transaction.atomic
+    def criar_vendas_em_lote(self, vendas: list) -> list:
+        """
+        Registra um lote de vendas (sincronização offline das lojas) com as
+        mesmas regras de 'criar_venda', mas em um número fixo de consultas:
+        1. Valida todas as vendas e soma a demanda por produto do lote inteiro;
+        2. Trava e lê os produtos envolvidos de uma vez (em ordem de pk);
+        3. Aceita as vendas na ordem recebida enquanto houver estoque;
+           as demais são rejeitadas com o motivo, sem afetar as outras;
+        4. Grava Vendas e Itens com bulk_create e baixa o estoque com um único UPDATE.
+
+        Cada venda é um dict: {'cliente', 'status' (opcional), 'data' (opcional,
+        ISO 8601), 'itens': [{'produto': id, 'quantidade': n}, ...]}.
+        Devolve um resultado por venda, na mesma ordem.
+        """
+        if len(vendas) > MAX_VENDAS_POR_LOTE:
+            raise ValueError(f"Lote muito grande: máximo de {MAX_VENDAS_POR_LOTE} vendas por chamada.")
+
+        resultados = []
+        validas = []
+        for indice, dados in enumerate(vendas):
+            erros, venda = self.validar_dados_venda(dados)
+            if erros:
+                resultados.append({'indice': indice, 'status': 'rejeitada', 'erros': erros})
+            else:
+                resultados.append({'indice': indice})
+                validas.append((indice, venda))
+
+        produto_ids = {pk for _, venda in validas for pk in venda['itens']}
+        produtos = {
+            produto['pk']: produto
+            for produto in Produto.objects.select_for_update()
+            .filter(pk__in=produto_ids)
+            .order_by('pk')
+            .values('pk', 'nome', 'preco', 'estoque')
+        }
+
+        # Reserva o estoque venda a venda, na ordem do lote
+        disponivel = {pk: produto['estoque'] for pk, produto in produtos.items()}
+        quantidades = {}
+        aceitas = []
+        for indice, venda in validas:
+            erros = []
+            for pk, quantidade in venda['itens'].items():
+                if pk not in produtos:
+                    erros.append(f"Produto {pk} não encontrado.")
+                elif disponivel[pk] < quantidade:
+                    erros.append(
+                        f"Estoque insuficiente para o produto: {produtos[pk]['nome']} "
+                        f"(disponível: {disponivel[pk]}, pedido: {quantidade})"
+                    )
+            if erros:
+                resultados[indice].update(status='rejeitada', erros=erros)
+                continue
+            for pk, quantidade in venda['itens'].items():
+                disponivel[pk] -= quantidade
+                quantidades[pk] = quantidades.get(pk, 0) + quantidade
+            aceitas.append((indice, venda))
+
+        objetos_venda = []
+        for _, venda in aceitas:
+            total = sum(
+                (produtos[pk]['preco'] * quantidade for pk, quantidade in venda['itens'].items()),
+                Decimal('0.00'),
+            )
+            objetos_venda.append(Venda(cliente=venda['cliente'], status=venda['status'], data=venda['data'], total=total))
+        Venda.objects.bulk_create(objetos_venda, batch_size=1000)
+
+        itens = [
+            ItemVenda(venda=objeto, produto_id=pk, quantidade=quantidade, preco_unitario=produtos[pk]['preco'])
+            for (_, venda), objeto in zip(aceitas, objetos_venda)
+            for pk, quantidade in venda['itens'].items()
+        ]
+        ItemVenda.objects.bulk_create(itens, batch_size=1000)
+
+        if quantidades:
+            self._baixar_estoque(quantidades, "Estoque insuficiente", ja_travados=True)
+            registrar_movimentos(movimentos_dos_itens(itens, MovimentoEstoque.Tipo.VENDA, -1))
+            registrar_alteracao_catalogo(quantidades)
+
+        variacoes = {}
+        for (_, venda), objeto in zip(aceitas, objetos_venda):
+            somar_venda(variacoes, objeto.data, objeto.status, objeto.total, sum(venda['itens'].values()))
+        registrar_no_resumo(variacoes)
+
+        for (indice, _), objeto in zip(aceitas, objetos_venda):
+            resultados[indice].update(status='criada', id=objeto.pk, total=str(objeto.total))
+        return resultados
+
+    def validar_dados_venda(self, dados) -> tuple:
+        """Devolve (erros, venda normalizada); itens repetidos do mesmo produto são somados."""
+        if not isinstance(dados, dict):
+            return ["Cada venda deve ser um objeto."], None
+
+        erros = []
+        cliente = str(dados.get('cliente') or '').strip()
+        if not cliente:
+            erros.append("O campo 'cliente' é obrigatório.")
+        elif len(cliente) > Venda._meta.get_field('cliente').max_length:
+            erros.append("O campo 'cliente' é muito longo.")
+
+        status = dados.get('status') or Venda.StatusVenda.PENDENTE
+        if status not in Venda.StatusVenda.values:
+            erros.append(f"Status inválido: {status!r}.")
+
+        data = timezone.now()
+        if dados.get('data'):
+            try:
+                # ValueError: formato certo mas data impossível ('2024-02-30T10:00:00')
+                data = parse_datetime(str(dados['data']))
+            except (ValueError, OverflowError):
+                data = None
+            if data is None:
+                erros.append(f"Data inválida: {dados['data']!r}.")
+            elif not ANO_MINIMO_VENDA <= data.year <= ANO_MAXIMO_VENDA:
+                erros.append(
+                    f"Data fora do intervalo aceito ({ANO_MINIMO_VENDA} a {ANO_MAXIMO_VENDA}): {dados['data']!r}."
+                )
+            elif timezone.is_naive(data):
+                data = timezone.make_aware(data)
+
+        itens = {}
+        # Uma venda que já nasce cancelada não tem itens nem mexe no estoque
+        if status != Venda.StatusVenda.CANCELADA:
+            linhas = dados.get('itens')
+            if not isinstance(linhas, list) or not linhas:
+                erros.append("Uma venda (não cancelada) precisa ter pelo menos um item.")
+                linhas = []
+            for numero, linha in enumerate(linhas, start=1):
+                try:
+                    produto = int(linha['produto'])
+                    quantidade = int(linha['quantidade'])
+                except (KeyError, TypeError, ValueError):
+                    erros.append(f"Item {numero}: 'produto' e 'quantidade' devem ser números inteiros.")
+                    continue
+                if quantidade <= 0:
+                    erros.append(f"Item {numero}: a quantidade deve ser maior que zero.")
+                    continue
+                itens[produto] = itens.get(produto, 0) + quantidade
+
+        if erros:
+            return erros, None
+        return [], {'cliente': cliente, 'status': status, 'data': data, 'itens': itens}
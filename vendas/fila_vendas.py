@@ -0,0 +1,92 @@
+import logging
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .facades import EstoqueInsuficiente, VendaFacade
+from .metricas import medido
+from .models import PedidoVenda
+
+logger = logging.getLogger(__name__)
+
+# Número fixo de partições da fila. Os workers dividem as partições entre si
+# (com até PARTICOES workers), então mudar o número de workers não muda este valor.
+PARTICOES = 8
+# Pedidos processados por transação
+LOTE = 200
+# Erros causados pelos dados de um pedido: rejeitam só esse pedido. Erros de banco
+# (DatabaseError, OperationalError) não estão aqui: sobem, o lote é desfeito e os
+# pedidos continuam AGUARDANDO até a próxima passada do worker.
+ERROS_DO_PEDIDO = (ValidationError, EstoqueInsuficiente, ValueError, TypeError, KeyError, OverflowError)
+
+
+def particao_da_venda(dados: dict) -> int:
+    """
+    Partição pelo menor id de produto da venda: vendas de um mesmo produto
+    (o caso das promoções) caem sempre na mesma partição e portanto no mesmo
+    worker, que baixa o estoque desse produto sem disputar o lock com ninguém.
+    Vendas com vários produtos podem cruzar partições; nesse caso a baixa
+    com guarda continua impedindo estoque negativo, só com alguma espera.
+    """
+    produto_ids = []
+    for item in dados.get('itens') or []:
+        try:
+            produto_ids.append(int(item['produto']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return min(produto_ids) % PARTICOES if produto_ids else 0
+
+
+def enfileirar_venda(dados: dict) -> PedidoVenda:
+    return PedidoVenda.objects.create(dados=dados, particao=particao_da_venda(dados))
+
+
+def particoes_do_worker(indice: int, total_workers: int) -> list:
+    return [particao for particao in range(PARTICOES) if particao % total_workers == indice]
+
+
+@medido('fila_vendas_lote')
+def processar_pedidos(particoes: list, limite: int = LOTE) -> int:
+    """
+    Processa um lote de pedidos das partições dadas com 'criar_vendas_em_lote'.
+    O resultado de cada pedido é gravado na mesma transação das vendas,
+    então um pedido nunca é processado duas vezes.
+    Se o lote falhar por causa dos dados de algum pedido, os pedidos são refeitos
+    um a um e só o que falhar é rejeitado, para não travar a partição.
+    Devolve quantos pedidos foram processados (0 = fila vazia).
+    """
+    with transaction.atomic():
+        pedidos = list(
+            PedidoVenda.objects.select_for_update(skip_locked=True)
+            .filter(status=PedidoVenda.Status.AGUARDANDO, particao__in=particoes)
+            .order_by('pk')[:limite]
+        )
+        if not pedidos:
+            return 0
+
+        try:
+            with transaction.atomic():
+                resultados = VendaFacade().criar_vendas_em_lote([pedido.dados for pedido in pedidos])
+        except ERROS_DO_PEDIDO:
+            logger.exception("Falha no lote de %d pedidos de venda; processando um a um", len(pedidos))
+            resultados = [_processar_pedido(pedido) for pedido in pedidos]
+        agora = timezone.now()
+        for pedido, resultado in zip(pedidos, resultados):
+            pedido.processado_em = agora
+            if resultado['status'] == 'criada':
+                pedido.status = PedidoVenda.Status.CONCLUIDO
+                pedido.venda_id = resultado['id']
+            else:
+                pedido.status = PedidoVenda.Status.REJEITADO
+                pedido.erros = resultado['erros']
+        PedidoVenda.objects.bulk_update(pedidos, ['status', 'venda', 'erros', 'processado_em'])
+        return len(pedidos)
+
+
+def _processar_pedido(pedido: PedidoVenda) -> dict:
+    """Resultado de um único pedido, no seu próprio savepoint; um erro nos dados o rejeita."""
+    try:
+        with transaction.atomic():
+            return VendaFacade().criar_vendas_em_lote([pedido.dados])[0]
+    except ERROS_DO_PEDIDO as e:
+        logger.exception("Pedido de venda %s rejeitado por erro inesperado", pedido.pk)
+        return {'status': 'rejeitada', 'erros': [f"Erro ao processar o pedido: {e}"]}
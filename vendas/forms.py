@@ -1,5 +1,8 @@
+from datetime import datetime, time, timedelta
 from django import forms
-from django.forms import inlineformset_factory
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.urls import reverse_lazy
+from django.utils import timezone
 from .models import Produto, Categoria, Venda, ItemVenda
 
 # --- Formulário de Produto (sem alteração) ---
@@ -37,10 +40,85 @@ class VendaForm(forms.ModelForm):
             'comprovante': forms.FileInput(attrs={'class': 'form-control-file'}),
         }
 
+class FiltroVendasForm(forms.Form):
+    """Filtros opcionais da lista de vendas (status e intervalo de datas)."""
+    status = forms.ChoiceField(
+        choices=[('', 'Todos os status')] + Venda.StatusVenda.choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control form-control-sm'}),
+    )
+    de = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    ate = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+
+    def filtrar(self, queryset):
+        """Aplica os filtros válidos; os campos com erro são ignorados."""
+        self.is_valid()
+        dados = getattr(self, 'cleaned_data', {})
+        if dados.get('status'):
+            queryset = queryset.filter(status=dados['status'])
+        # Intervalo pelo início de cada dia no fuso local, para usar o índice de 'data'
+        if dados.get('de'):
+            queryset = queryset.filter(data__gte=timezone.make_aware(datetime.combine(dados['de'], time.min)))
+        if dados.get('ate'):
+            fim = timezone.make_aware(datetime.combine(dados['ate'] + timedelta(days=1), time.min))
+            queryset = queryset.filter(data__lt=fim)
+        return queryset
+
+class ProdutoChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField que, validando dentro do ItemVendaFormSet, procura o produto
+    entre os já carregados pelo formset em vez de fazer uma consulta por item.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.carregados = None
+
+    def to_python(self, value):
+        if self.carregados is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.carregados[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+
+class ProdutoAutocompleteWidget(forms.Select):
+    """
+    Select do produto que só renderiza a opção escolhida: as demais vêm do
+    endpoint de autocomplete (select2 com AJAX) enquanto o usuário digita.
+    Assim o HTML de cada item não depende do tamanho do catálogo.
+    """
+    def __init__(self, attrs=None):
+        super().__init__(attrs)
+        self.carregados = None
+
+    def optgroups(self, name, value, attrs=None):
+        ids = set()
+        for valor in value:
+            try:
+                ids.add(int(valor))
+            except (TypeError, ValueError):
+                continue
+        if self.carregados is not None:
+            # Re-renderização de um POST: os produtos já foram carregados pelo formset
+            produtos = {pk: self.carregados[pk] for pk in ids if pk in self.carregados}
+        else:
+            produtos = self.choices.queryset.in_bulk(ids) if ids else {}
+        opcoes = [self.create_option(name, '', '', not produtos, 0)]
+        for indice, produto in enumerate(produtos.values(), start=1):
+            label = self.choices.field.label_from_instance(produto)
+            opcoes.append(self.create_option(name, produto.pk, label, True, indice, attrs=attrs))
+        return [(None, opcoes, 0)]
+
 class ItemVendaForm(forms.ModelForm):
-    produto = forms.ModelChoiceField(
+    produto = ProdutoChoiceField(
         queryset=Produto.objects.filter(estoque__gt=0).order_by('nome'),
-        widget=forms.Select(attrs={'class': 'form-control select2'}), 
+        widget=ProdutoAutocompleteWidget(attrs={
+            'class': 'form-control select2',
+            'data-placeholder': 'Busque um produto...',
+            'data-ajax--url': reverse_lazy('produto_autocomplete'),
+        }),
         required=True
     )
     class Meta:
@@ -59,10 +137,29 @@ class ItemVendaForm(forms.ModelForm):
                 self.add_error('quantidade', forms.ValidationError(error_msg))
         return cleaned_data
 
+class BaseItemVendaFormSet(BaseInlineFormSet):
+    """Carrega os produtos de todos os itens com uma única consulta antes de validar."""
+    def full_clean(self):
+        if self.is_bound:
+            produto_ids = set()
+            for form in self.forms:
+                try:
+                    produto_ids.add(int(form.data.get(form.add_prefix('produto'))))
+                except (TypeError, ValueError):
+                    continue
+            if self.forms:
+                # O queryset do campo (só produtos com estoque) continua valendo
+                produtos = self.forms[0].fields['produto'].queryset.in_bulk(produto_ids)
+                for form in self.forms:
+                    form.fields['produto'].carregados = produtos
+                    form.fields['produto'].widget.carregados = produtos
+        super().full_clean()
+
 ItemVendaFormSet = inlineformset_factory(
     Venda,
     ItemVenda,
     form=ItemVendaForm,
+    formset=BaseItemVendaFormSet,
     extra=0,
     can_delete=True,
     min_num=1,
@@ -0,0 +1,76 @@
+import hashlib
+from datetime import timedelta
+from typing import Callable
+from django.db import transaction
+from django.http import HttpRequest
+from django.utils import timezone
+from .models import ChaveIdempotencia
+
+# Por quanto tempo uma repetição devolve o resultado original
+VALIDADE = timedelta(hours=24)
+# A chave vem no cabeçalho (integrações) ou em um campo do formulário (navegador)
+CABECALHO = 'Idempotency-Key'
+CAMPO = 'idempotency_key'
+
+
+class ConflitoIdempotencia(Exception):
+    """A mesma chave foi reutilizada com um conteúdo diferente."""
+
+
+def chave_da_requisicao(request: HttpRequest):
+    chave = request.headers.get(CABECALHO) or request.POST.get(CAMPO)
+    return chave.strip()[:200] if chave else None
+
+
+def hash_da_requisicao(request: HttpRequest) -> str:
+    conteudo = hashlib.sha256()
+    if request.content_type == 'application/json':
+        conteudo.update(request.body)
+    else:
+        for campo in sorted(request.POST):
+            if campo not in ('csrfmiddlewaretoken', CAMPO):
+                conteudo.update(repr((campo, request.POST.getlist(campo))).encode('utf-8'))
+        for campo in sorted(request.FILES):
+            arquivo = request.FILES[campo]
+            conteudo.update(repr((campo, arquivo.name, arquivo.size)).encode('utf-8'))
+    return conteudo.hexdigest()
+
+
+def executar_uma_vez(request: HttpRequest, escopo: str, operacao: Callable[[], dict]) -> tuple:
+    """
+    Executa 'operacao' uma única vez por chave de idempotência.
+    A chave é gravada na mesma transação da operação: se a operação falha,
+    a chave some junto e o cliente pode repetir. Uma repetição concorrente
+    espera no índice único até a primeira terminar e então recebe o resultado dela.
+
+    Devolve (resposta, repetida). Sem chave na requisição, só executa.
+    """
+    chave = chave_da_requisicao(request)
+    if not chave:
+        return operacao(), False
+
+    hash_requisicao = hash_da_requisicao(request)
+    with transaction.atomic():
+        agora = timezone.now()
+        # Uma chave expirada é tratada como nova
+        ChaveIdempotencia.objects.filter(escopo=escopo, chave=chave, expira_em__lte=agora).delete()
+        registro, criada = ChaveIdempotencia.objects.get_or_create(
+            escopo=escopo,
+            chave=chave,
+            defaults={'hash_requisicao': hash_requisicao, 'expira_em': agora + VALIDADE},
+        )
+        if not criada:
+            if registro.hash_requisicao != hash_requisicao:
+                raise ConflitoIdempotencia(
+                    f"A chave de idempotência '{chave}' já foi usada com outro conteúdo."
+                )
+            return registro.resposta, True
+
+        registro.resposta = operacao()
+        registro.save(update_fields=['resposta'])
+        return registro.resposta, False
+
+
+def limpar_chaves_expiradas() -> int:
+    apagadas, _ = ChaveIdempotencia.objects.filter(expira_em__lte=timezone.now()).delete()
+    return apagadas
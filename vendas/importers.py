@@ -0,0 +1,586 @@
+import codecs
+import csv
+import json
+import xml.etree.ElementTree as ET
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Callable, Iterable, Iterator
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+from .catalogo import registrar_alteracao_catalogo
+from .db import copy_disponivel
+from .estoque import registrar_movimentos
+from .metricas import medido
+from .models import Produto, Categoria, ImportJob, MovimentoEstoque
+
+# Quantas mensagens de erro guardamos em cada ImportJob
+MAX_ERROS_REGISTRADOS = 100
+
+# Limites das colunas de Produto: valores acima delas fariam o banco recusar
+# o lote inteiro (DataError); com a checagem antes, só a linha conta como erro
+_campo_preco = Produto._meta.get_field('preco')
+PRECO_MAXIMO = Decimal(10) ** (_campo_preco.max_digits - _campo_preco.decimal_places)
+ESTOQUE_MAXIMO = 2147483647
+
+
+class ResultadoImportacao:
+    """Contadores de uma importação de produtos."""
+
+    def __init__(self):
+        self.processados = 0
+        self.criados = 0
+        self.atualizados = 0
+        self.inalterados = 0
+        self.total_erros = 0
+        # Só as primeiras MAX_ERROS_REGISTRADOS mensagens são guardadas
+        self.erros = []
+
+    def registrar_erro(self, mensagem: str):
+        self.total_erros += 1
+        if len(self.erros) < MAX_ERROS_REGISTRADOS:
+            self.erros.append(mensagem)
+
+    def __str__(self):
+        return (
+            f"{self.processados} produtos processados "
+            f"({self.criados} criados, {self.atualizados} atualizados, "
+            f"{self.inalterados} ignorados por não terem alteração, {self.total_erros} com erro)"
+        )
+
+
+class ProdutoImporter:
+    """
+    Motor de importação em lote (set-based).
+    As linhas são gravadas em lotes de 'batch_size', cada um em sua própria transação:
+    1. Resolve as categorias do lote com uma única consulta (case-insensitive);
+    2. Cria as categorias que faltam com um único bulk_create;
+    3. Lê os produtos existentes do lote e compara com as linhas do arquivo;
+    4. Faz o upsert com bulk_create(update_conflicts=True) pela chave 'nome',
+       só das linhas novas ou alteradas: as idênticas ao banco não geram escrita.
+    """
+    batch_size = 1000
+    campos_atualizados = ['descricao', 'preco', 'estoque', 'categoria']
+
+    def __init__(self, batch_size: int = None, ao_gravar_lote: Callable[[ResultadoImportacao], None] = None):
+        if batch_size:
+            self.batch_size = batch_size
+        # Chamado após cada lote gravado (usado para registrar o progresso)
+        self.ao_gravar_lote = ao_gravar_lote
+        self.resultado = ResultadoImportacao()
+        # Cache nome da categoria (em minúsculas) -> id, válido durante a importação
+        self._categorias = {}
+
+    @medido('importacao')
+    def importar(self, linhas: Iterable[dict]) -> ResultadoImportacao:
+        lote = []
+        for numero, linha in enumerate(linhas, start=1):
+            try:
+                lote.append(self._normalizar(linha))
+            except (ValueError, TypeError) as e:
+                self.resultado.registrar_erro(f"Produto {numero}: {e}")
+                continue
+            if len(lote) >= self.batch_size:
+                self._gravar_lote(lote)
+                lote = []
+        if lote:
+            self._gravar_lote(lote)
+        return self.resultado
+
+    def _normalizar(self, linha: dict) -> dict:
+        """Converte uma linha do arquivo nos valores que serão gravados."""
+        if not isinstance(linha, dict):
+            raise ValueError("cada produto deve ser um objeto.")
+        nome = linha.get('nome')
+        if not nome:
+            raise ValueError("o campo 'nome' é obrigatório.")
+        nome = str(nome)
+        if len(nome) > Produto._meta.get_field('nome').max_length:
+            raise ValueError(f"nome muito longo: {nome[:30]}...")
+
+        try:
+            # Arredonda como o numeric do PostgreSQL (metade para longe do zero), igual ao COPY
+            preco = Decimal(str(linha.get('preco') or 0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        except InvalidOperation:
+            raise ValueError(f"preço inválido para '{nome}': {linha.get('preco')!r}")
+        if not preco.is_finite() or preco >= PRECO_MAXIMO:
+            raise ValueError(f"preço inválido para '{nome}': {linha.get('preco')!r}")
+        if preco < 0:
+            raise ValueError(f"preço negativo para '{nome}'.")
+        try:
+            estoque = int(linha.get('estoque') or 0)
+        except OverflowError:
+            raise ValueError(f"estoque inválido para '{nome}': {linha.get('estoque')!r}")
+        if estoque < 0:
+            raise ValueError(f"estoque negativo para '{nome}'.")
+        if estoque > ESTOQUE_MAXIMO:
+            raise ValueError(f"estoque acima do máximo ({ESTOQUE_MAXIMO}) para '{nome}'.")
+
+        descricao = linha.get('descricao', '')
+        if descricao is not None and not isinstance(descricao, str):
+            raise ValueError(f"descrição inválida para '{nome}': {descricao!r}")
+
+        categoria = linha.get('categoria')
+        return {
+            'nome': nome,
+            'descricao': descricao,
+            'preco': preco,
+            'estoque': estoque,
+            'categoria': str(categoria) if categoria else None,
+        }
+
+    def _resolver_categorias(self, nomes: set):
+        """Busca (e cria, se preciso) as categorias ainda não vistas nesta importação."""
+        pendentes = {nome.lower(): nome for nome in nomes if nome.lower() not in self._categorias}
+        if not pendentes:
+            return
+
+        def buscar():
+            encontradas = Categoria.objects.annotate(
+                nome_lower=Lower('nome')
+            ).filter(nome_lower__in=pendentes).values_list('nome_lower', 'id')
+            self._categorias.update(encontradas)
+
+        buscar()
+        faltando = [nome for chave, nome in pendentes.items() if chave not in self._categorias]
+        if faltando:
+            Categoria.objects.bulk_create(
+                [Categoria(nome=nome.capitalize()) for nome in faltando],
+                ignore_conflicts=True,
+            )
+            # bulk_create com ignore_conflicts não devolve os ids
+            buscar()
+
+    def _gravar_lote(self, lote: list):
+        with transaction.atomic():
+            # Se o mesmo nome aparece mais de uma vez, a última ocorrência vence
+            # (mesmo efeito que o update_or_create linha a linha tinha)
+            por_nome = {linha['nome']: linha for linha in lote}
+
+            self._resolver_categorias({linha['categoria'] for linha in por_nome.values() if linha['categoria']})
+
+            # Travados até o fim do lote, para a comparação continuar válida na escrita
+            existentes = {
+                produto['nome']: produto
+                for produto in Produto.objects.select_for_update().filter(nome__in=por_nome).values(
+                    'nome', 'descricao', 'preco', 'estoque', 'categoria_id'
+                )
+            }
+
+            # Só entram no upsert as linhas novas ou alteradas
+            produtos = []
+            for nome, linha in por_nome.items():
+                categoria_id = self._categorias.get(linha['categoria'].lower()) if linha['categoria'] else None
+                novo = {
+                    'nome': nome,
+                    'descricao': linha['descricao'],
+                    'preco': linha['preco'],
+                    'estoque': linha['estoque'],
+                    'categoria_id': categoria_id,
+                }
+                atual = existentes.get(nome)
+                if atual == novo:
+                    self.resultado.inalterados += 1
+                    continue
+                if atual is None:
+                    self.resultado.criados += 1
+                else:
+                    self.resultado.atualizados += 1
+                produtos.append(Produto(**novo))
+
+            if produtos:
+                Produto.objects.bulk_create(
+                    produtos,
+                    update_conflicts=True,
+                    unique_fields=['nome'],
+                    update_fields=self.campos_atualizados,
+                )
+                # Diferença de estoque de cada produto vai para o extrato
+                # (o bulk_create com update_conflicts preenche o pk dos objetos)
+                registrar_movimentos([
+                    MovimentoEstoque(produto_id=produto.pk, tipo=MovimentoEstoque.Tipo.IMPORTACAO, quantidade=diferenca)
+                    for produto in produtos
+                    if produto.pk and (diferenca := produto.estoque - existentes.get(produto.nome, {}).get('estoque', 0))
+                ])
+                registrar_alteracao_catalogo()
+            self.resultado.processados += len(lote)
+
+        if self.ao_gravar_lote:
+            self.ao_gravar_lote(self.resultado)
+
+
+# --- Leitores incrementais ---
+# Geram uma linha (dict) por produto sem carregar o arquivo inteiro em memória;
+# o ProdutoImporter consome as linhas e grava em lotes de 'batch_size'.
+
+def iter_json_array(arquivo, tamanho_leitura: int = 64 * 1024, tamanho_maximo_item: int = 16 * 1024 * 1024) -> Iterator:
+    """
+    Parser incremental de um array JSON: lê o arquivo em blocos e decodifica
+    um elemento por vez com JSONDecoder.raw_decode.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    fim_arquivo = False
+
+    def ler_mais():
+        nonlocal buffer, pos, fim_arquivo
+        bruto = arquivo.read(tamanho_leitura)
+        if not bruto:
+            fim_arquivo = True
+        bloco = utf8.decode(bruto, final=fim_arquivo) if isinstance(bruto, bytes) else bruto
+        # Descarta o que já foi consumido para o buffer não crescer
+        buffer = buffer[pos:] + bloco
+        pos = 0
+
+    def proximo_caractere() -> str:
+        """Pula espaços em branco e devolve o próximo caractere ('' no fim do arquivo)."""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or fim_arquivo:
+                return buffer[pos:pos + 1]
+            ler_mais()
+
+    if proximo_caractere() != '[':
+        raise ValueError("JSON deve ser uma lista (array) de produtos.")
+    pos += 1
+    if proximo_caractere() == ']':
+        return
+
+    while True:
+        # Se nem um bloco bem grande forma um elemento, o arquivo está inválido
+        limite_atingido = fim_arquivo or len(buffer) - pos > tamanho_maximo_item
+        try:
+            item, fim = decoder.raw_decode(buffer, pos)
+            # Um número no fim do buffer pode estar cortado ("1." de "1.5"):
+            # só aceita o elemento se o que vem depois dele já foi lido
+            completo = limite_atingido or (fim < len(buffer) and buffer[fim] in ' \t\r\n,]')
+        except json.JSONDecodeError:
+            if limite_atingido:
+                raise
+            completo = False
+        if not completo:
+            ler_mais()
+            continue
+        pos = fim
+        yield item
+
+        separador = proximo_caractere()
+        pos += 1
+        if separador == ']':
+            return
+        if separador != ',':
+            raise ValueError(f"JSON inválido: esperado ',' ou ']' e encontrado {separador or 'fim do arquivo'!r}.")
+        proximo_caractere()
+
+
+def iter_produtos_json(arquivo) -> Iterator[dict]:
+    for item in iter_json_array(arquivo):
+        if not isinstance(item, dict):
+            yield item
+            continue
+        yield {
+            'nome': item.get('nome'),
+            'preco': item.get('preco', 0),
+            'estoque': item.get('estoque', 0),
+            'descricao': item.get('descricao', ''),
+            # Aceita também 'categoria__nome' (formato gerado pela exportação)
+            'categoria': item.get('categoria', item.get('categoria__nome')),
+        }
+
+
+def iter_produtos_xml(arquivo) -> Iterator[dict]:
+    """
+    Lê <produtos><produto>...</produto></produtos> com ET.iterparse.
+    Cada <produto> é convertido e descartado (clear) assim que termina,
+    então só um elemento fica em memória por vez.
+    """
+    def texto(produto_node, *tags):
+        for tag in tags:
+            node = produto_node.find(tag)
+            if node is not None:
+                # <descricao type="str"/> é texto vazio; type="null" (ou sem tipo) é None
+                if node.text is None and node.get('type') == 'str':
+                    return ''
+                return node.text
+        return None
+
+    root = None
+    profundidade = 0
+    for evento, elem in ET.iterparse(arquivo, events=('start', 'end')):
+        if evento == 'start':
+            if root is None:
+                root = elem
+            profundidade += 1
+            continue
+
+        profundidade -= 1
+        if profundidade == 1 and elem.tag == 'produto':
+            yield {
+                'nome': texto(elem, 'nome'),
+                'preco': texto(elem, 'preco'),
+                'estoque': texto(elem, 'estoque'),
+                'descricao': texto(elem, 'descricao') if elem.find('descricao') is not None else '',
+                # Aceita tanto <categoria> quanto <categoria__nome> (formato gerado pela exportação)
+                'categoria': texto(elem, 'categoria', 'categoria__nome'),
+            }
+            elem.clear()
+            root.clear()
+
+
+
+def _linha_produto(item: dict) -> dict:
+    return {
+        'nome': item.get('nome'),
+        'preco': item.get('preco', 0),
+        'estoque': item.get('estoque', 0),
+        'descricao': item.get('descricao', ''),
+        'categoria': item.get('categoria', item.get('categoria__nome')),
+    }
+
+
+def iter_produtos_csv(arquivo) -> Iterator[dict]:
+    """CSV com cabeçalho (nome, descricao, categoria, preco, estoque), lido linha a linha."""
+    for item in csv.DictReader(codecs.iterdecode(arquivo, 'utf-8-sig')):
+        linha = _linha_produto(item)
+        # No CSV um campo vazio é ausência de valor
+        linha['categoria'] = linha['categoria'] or None
+        yield linha
+
+
+def iter_produtos_ndjson(arquivo) -> Iterator:
+    """Um objeto JSON por linha; linhas em branco são ignoradas."""
+    for numero, texto in enumerate(codecs.iterdecode(arquivo, 'utf-8-sig'), start=1):
+        if not texto.strip():
+            continue
+        try:
+            item = json.loads(texto)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"NDJSON inválido na linha {numero}: {e}")
+        yield _linha_produto(item) if isinstance(item, dict) else item
+
+
+# Leitor de cada formato aceito em /produtos/import/ (pela extensão do arquivo)
+LEITORES = {
+    'json': iter_produtos_json,
+    'xml': iter_produtos_xml,
+    'csv': iter_produtos_csv,
+    'ndjson': iter_produtos_ndjson,
+}
+
+
+class CopyProdutoImporter(ProdutoImporter):
+    """
+    Fast path do PostgreSQL para os formatos orientados a linha (CSV e NDJSON).
+    O arquivo vai direto para uma tabela temporária com COPY ... FROM STDIN e
+    categorias e produtos são gravados com poucos comandos SQL set-based,
+    sem passar cada linha pelo ORM.
+    """
+    formatos = ('csv', 'ndjson')
+    colunas = ('nome', 'descricao', 'categoria', 'preco', 'estoque')
+
+    # Linhas cujos valores não convertem para os tipos de Produto contam como erro,
+    # com os mesmos limites de ProdutoImporter._normalizar (o preço é arredondado
+    # antes da comparação). O CASE garante que só texto numérico chega ao cast.
+    validacao_sql = (
+        "nome IS NOT NULL AND nome <> '' AND length(nome) <= 200 AND descricao_valida"
+        " AND CASE WHEN coalesce(preco, '') ~ '^(\\s*[+-]?(\\d+(\\.\\d*)?|\\.\\d+)\\s*)?$'"
+        " THEN round(coalesce(nullif(btrim(preco), ''), '0')::numeric, 2)"
+        f" <@ numrange(0, {PRECO_MAXIMO}) ELSE false END"
+        " AND CASE WHEN coalesce(estoque, '') ~ '^(\\s*[+-]?\\d+\\s*)?$'"
+        " THEN coalesce(nullif(btrim(estoque), ''), '0')::numeric"
+        f" <@ numrange(0, {ESTOQUE_MAXIMO}, '[]') ELSE false END"
+    )
+
+    @medido('importacao_copy')
+    def importar_arquivo(self, arquivo, formato: str) -> ResultadoImportacao:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE tmp_importacao_produtos ("
+                "ordem bigserial, nome text, descricao text, categoria text, preco text, estoque text,"
+                " descricao_valida boolean NOT NULL DEFAULT true"
+                ") ON COMMIT DROP"
+            )
+            if formato == 'csv':
+                self._copiar_csv(cursor, arquivo)
+            else:
+                self._copiar_ndjson(cursor, arquivo)
+            self._registrar_erros(cursor)
+            self._criar_categorias(cursor)
+            self._upsert_produtos(cursor)
+            if self.resultado.criados or self.resultado.atualizados:
+                registrar_alteracao_catalogo()
+
+        if self.ao_gravar_lote:
+            self.ao_gravar_lote(self.resultado)
+        return self.resultado
+
+    def _copiar_csv(self, cursor, arquivo):
+        cabecalho = next(csv.reader([arquivo.readline().decode('utf-8-sig')]), [])
+        destino = []
+        for posicao, coluna in enumerate(cabecalho):
+            coluna = coluna.strip().lower()
+            if coluna == 'categoria__nome':
+                coluna = 'categoria'
+            if coluna not in self.colunas or coluna in destino:
+                # Colunas que não importam (ex: o 'id' da exportação) são descartadas
+                coluna = f'ignorada_{posicao}'
+                cursor.execute(f"ALTER TABLE tmp_importacao_produtos ADD COLUMN {coluna} text")
+            destino.append(coluna)
+        if 'nome' not in destino:
+            raise ValueError("O CSV precisa de uma coluna 'nome'.")
+        cursor.copy_expert(
+            f"COPY tmp_importacao_produtos ({', '.join(destino)}) FROM STDIN WITH (FORMAT csv)",
+            arquivo,
+        )
+
+    def _copiar_ndjson(self, cursor, arquivo):
+        cursor.execute("CREATE TEMP TABLE tmp_importacao_json (ordem bigserial, dados text) ON COMMIT DROP")
+        # QUOTE/DELIMITER com caracteres de controle: cada linha entra inteira, sem escapes
+        cursor.copy_expert(
+            "COPY tmp_importacao_json (dados) FROM STDIN "
+            "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')",
+            arquivo,
+        )
+        cursor.execute(
+            "INSERT INTO tmp_importacao_produtos (nome, descricao, categoria, preco, estoque, descricao_valida) "
+            "SELECT d->>'nome', coalesce(d->>'descricao', ''), coalesce(d->>'categoria', d->>'categoria__nome'), "
+            "d->>'preco', d->>'estoque', coalesce(jsonb_typeof(d->'descricao'), 'null') IN ('string', 'null') "
+            "FROM (SELECT ordem, ltrim(dados, U&'\\FEFF')::jsonb AS d FROM tmp_importacao_json "
+            "      WHERE btrim(coalesce(dados, '')) <> '') AS linhas "
+            "ORDER BY ordem"
+        )
+
+    def _registrar_erros(self, cursor):
+        cursor.execute(
+            f"SELECT count(*) FILTER (WHERE {self.validacao_sql}), count(*) FROM tmp_importacao_produtos"
+        )
+        validas, total = cursor.fetchone()
+        self.resultado.processados = validas
+        if validas == total:
+            return
+        cursor.execute(
+            f"SELECT ordem, nome FROM tmp_importacao_produtos WHERE NOT coalesce({self.validacao_sql}, false) "
+            "ORDER BY ordem LIMIT %s",
+            [MAX_ERROS_REGISTRADOS],
+        )
+        for ordem, nome in cursor.fetchall():
+            self.resultado.registrar_erro(f"Produto {ordem}: valores inválidos para '{nome or ''}'.")
+        self.resultado.total_erros = total - validas
+
+    def _criar_categorias(self, cursor):
+        categoria = connection.ops.quote_name(Categoria._meta.db_table)
+        cursor.execute(
+            f"INSERT INTO {categoria} (nome) "
+            "SELECT DISTINCT ON (lower(cat)) upper(left(cat, 1)) || lower(substr(cat, 2)) "
+            "FROM (SELECT nullif(categoria, '') AS cat FROM tmp_importacao_produtos "
+            f"      WHERE {self.validacao_sql}) AS linhas "
+            f"WHERE cat IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {categoria} c WHERE lower(c.nome) = lower(cat)) "
+            "ON CONFLICT (nome) DO NOTHING"
+        )
+
+    def _upsert_produtos(self, cursor):
+        produto = connection.ops.quote_name(Produto._meta.db_table)
+        categoria = connection.ops.quote_name(Categoria._meta.db_table)
+        movimento = connection.ops.quote_name(MovimentoEstoque._meta.db_table)
+        # Estoque de antes do upsert, para o extrato de estoque. As linhas ficam travadas
+        # até o commit (nenhuma venda muda esses produtos entre esta leitura e o upsert) e
+        # a chave primária permite ao upsert buscar cada produto gravado pelo índice:
+        # o planner não tem estatísticas das CTEs e um join com elas vira nested loop quadrático.
+        cursor.execute(
+            "CREATE TEMP TABLE tmp_importacao_anteriores (id bigint PRIMARY KEY, estoque integer) ON COMMIT DROP"
+        )
+        cursor.execute(
+            "INSERT INTO tmp_importacao_anteriores (id, estoque) "
+            f"SELECT p.id, p.estoque FROM {produto} p "
+            "WHERE p.nome IN (SELECT nome FROM tmp_importacao_produtos) "
+            "ORDER BY p.id FOR UPDATE"
+        )
+        # DISTINCT ON (nome) ... ORDER BY ordem DESC: a última ocorrência de cada nome vence.
+        # A diferença de estoque de cada produto gravado vai para o extrato.
+        cursor.execute(
+            "WITH validas AS ("
+            "  SELECT DISTINCT ON (nome) nome, coalesce(descricao, '') AS descricao, nullif(categoria, '') AS categoria,"
+            "         coalesce(nullif(btrim(preco), ''), '0')::numeric(10, 2) AS preco,"
+            "         coalesce(nullif(btrim(estoque), ''), '0')::integer AS estoque"
+            f"  FROM tmp_importacao_produtos WHERE {self.validacao_sql}"
+            "  ORDER BY nome, ordem DESC"
+            "), gravados AS ("
+            f"INSERT INTO {produto} AS p (nome, descricao, preco, estoque, categoria_id) "
+            "SELECT v.nome, v.descricao, v.preco, v.estoque, "
+            f"       (SELECT c.id FROM {categoria} c WHERE lower(c.nome) = lower(v.categoria) ORDER BY c.id LIMIT 1) "
+            "FROM validas v "
+            "ON CONFLICT (nome) DO UPDATE SET "
+            "  descricao = EXCLUDED.descricao, preco = EXCLUDED.preco,"
+            "  estoque = EXCLUDED.estoque, categoria_id = EXCLUDED.categoria_id "
+            "WHERE (p.descricao, p.preco, p.estoque, p.categoria_id) "
+            "      IS DISTINCT FROM (EXCLUDED.descricao, EXCLUDED.preco, EXCLUDED.estoque, EXCLUDED.categoria_id) "
+            "RETURNING p.id, p.estoque, (xmax = 0) AS inserido"
+            "), movimentos AS ("
+            f"  INSERT INTO {movimento} (produto_id, tipo, quantidade, criado_em) "
+            "  SELECT g.id, %s, g.estoque - coalesce(a.estoque, 0), %s "
+            "  FROM gravados g LEFT JOIN tmp_importacao_anteriores a ON a.id = g.id "
+            "  WHERE g.estoque <> coalesce(a.estoque, 0)"
+            ") "
+            "SELECT inserido FROM gravados",
+            [MovimentoEstoque.Tipo.IMPORTACAO, timezone.now()],
+        )
+        gravados = [inserido for (inserido,) in cursor.fetchall()]
+        self.resultado.criados = sum(1 for inserido in gravados if inserido)
+        self.resultado.atualizados = len(gravados) - self.resultado.criados
+
+        cursor.execute(
+            f"SELECT count(DISTINCT nome) FROM tmp_importacao_produtos WHERE {self.validacao_sql}"
+        )
+        self.resultado.inalterados = cursor.fetchone()[0] - len(gravados)
+
+
+def formato_do_arquivo(nome_arquivo: str):
+    """Devolve o formato de importação pela extensão, ou None se não for aceito."""
+    extensao = nome_arquivo.rsplit('.', 1)[-1].lower() if '.' in nome_arquivo else ''
+    return extensao if extensao in LEITORES else None
+
+
+def processar_import_job(job: ImportJob) -> ImportJob:
+    """
+    Executa uma importação enfileirada (chamado pelo worker 'processar_importacoes').
+    O progresso é gravado no próprio ImportJob a cada lote, para a view de status.
+    """
+    def registrar_progresso(resultado: ResultadoImportacao):
+        ImportJob.objects.filter(pk=job.pk).update(
+            processados=resultado.processados,
+            criados=resultado.criados,
+            atualizados=resultado.atualizados,
+            inalterados=resultado.inalterados,
+            total_erros=resultado.total_erros,
+            erros=resultado.erros,
+        )
+
+    usar_copy = job.formato in CopyProdutoImporter.formatos and copy_disponivel()
+    importer_class = CopyProdutoImporter if usar_copy else ProdutoImporter
+    importer = importer_class(ao_gravar_lote=registrar_progresso)
+    try:
+        with job.arquivo.open('rb') as arquivo:
+            if usar_copy:
+                importer.importar_arquivo(arquivo, job.formato)
+            else:
+                importer.importar(LEITORES[job.formato](arquivo))
+        job.status = ImportJob.Status.CONCLUIDA
+    except Exception as e:
+        job.status = ImportJob.Status.FALHOU
+        job.mensagem = f"Erro ao processar o arquivo: {e}"
+
+    resultado = importer.resultado
+    job.processados = resultado.processados
+    job.criados = resultado.criados
+    job.atualizados = resultado.atualizados
+    job.inalterados = resultado.inalterados
+    job.total_erros = resultado.total_erros
+    job.erros = resultado.erros
+    job.finalizado_em = timezone.now()
+    # O arquivo só era necessário para o processamento
+    job.arquivo.delete(save=False)
+    job.save()
+    return job
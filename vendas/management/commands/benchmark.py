@@ -0,0 +1,388 @@
+import csv
+import io
+import json
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from vendas import dashboard
+from vendas.busca import buscar_produtos
+from vendas.catalogo import registrar_alteracao_catalogo
+from vendas.db import copy_disponivel
+from vendas.exporters import ExporterFactory
+from vendas.facades import VendaFacade
+from vendas.forms import ItemVendaFormSet, VendaForm
+from vendas.importers import LEITORES, CopyProdutoImporter, ProdutoImporter
+from vendas.models import Categoria, ItemVenda, Produto, Venda
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark dos caminhos principais (páginas, busca, exportações, importações e vendas) sobre "
+        "uma massa de dados sintética, em um banco de teste criado e apagado pelo próprio comando. "
+        "Gera um relatório JSON e, com --baseline, falha se algum cenário ficou mais lento ou "
+        "passou a fazer mais consultas que o baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=20, help="Quantidade de categorias sintéticas.")
+        parser.add_argument('--produtos', type=int, default=1000, help="Quantidade de produtos sintéticos.")
+        parser.add_argument('--vendas', type=int, default=1000, help="Quantidade de vendas sintéticas.")
+        parser.add_argument('--itens-por-venda', type=int, default=3, help="Itens (produtos distintos) por venda.")
+        parser.add_argument('--linhas-importacao', type=int, default=1000, help="Linhas de cada arquivo importado.")
+        parser.add_argument('--repeticoes', type=int, default=10, help="Execuções medidas de cada cenário.")
+        parser.add_argument('--semente', type=int, default=42, help="Semente do gerador de dados.")
+        parser.add_argument(
+            '--cenarios',
+            help="Executa só os cenários cujo nome começa por um destes prefixos, separados por vírgula "
+                 "(ex.: --cenarios busca,venda_list).",
+        )
+        parser.add_argument('--saida', help="Grava o relatório neste arquivo (padrão: saída do comando).")
+        parser.add_argument('--baseline', help="Relatório anterior usado na comparação.")
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.2,
+            help="Aumento máximo aceito na latência mediana em relação ao baseline (0.2 = 20%%).",
+        )
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError("--repeticoes deve ser pelo menos 1.")
+        if options['produtos'] < max(options['itens_por_venda'], 3):
+            raise CommandError("--produtos deve ser pelo menos 3 e maior ou igual a --itens-por-venda.")
+        baseline = self._ler_baseline(options['baseline']) if options['baseline'] else None
+
+        # Banco descartável: a massa sintética nunca toca os dados reais
+        setup_test_environment()
+        nome_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.rng = random.Random(options['semente'])
+            self.repeticoes = options['repeticoes']
+            self.prefixos = [prefixo.strip() for prefixo in (options['cenarios'] or '').split(',') if prefixo.strip()]
+            inicio = time.perf_counter()
+            self._gerar_dados(options)
+            self.stderr.write(f"Massa de dados gerada em {time.perf_counter() - inicio:.1f}s")
+            cenarios = self._executar_cenarios(options)
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        relatorio = {
+            'banco': connection.vendor,
+            'dados': {
+                chave: options[chave]
+                for chave in ('categorias', 'produtos', 'vendas', 'itens_por_venda', 'linhas_importacao', 'repeticoes')
+            },
+            'cenarios': cenarios,
+        }
+        texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto + '\n')
+            self.stderr.write(f"Relatório gravado em {options['saida']}")
+        else:
+            self.stdout.write(texto)
+
+        if baseline:
+            self._comparar(relatorio, baseline, options['tolerancia'])
+
+    # --- Massa de dados ---
+
+    def _gerar_dados(self, options):
+        categorias = Categoria.objects.bulk_create(
+            Categoria(nome=f"Categoria {i}") for i in range(options['categorias'])
+        )
+        produtos = Produto.objects.bulk_create(
+            (
+                Produto(
+                    nome=f"Produto {i}",
+                    descricao=f"Descrição do produto {i}" if i % 3 else None,
+                    preco=Decimal(self.rng.randint(100, 100_000)) / 100,
+                    # Estoque alto: os cenários de venda nunca esbarram em estoque insuficiente
+                    estoque=10 ** 6,
+                    categoria=self.rng.choice(categorias) if categorias and i % 10 else None,
+                )
+                for i in range(options['produtos'])
+            ),
+            batch_size=1000,
+        )
+
+        agora = timezone.now()
+        vendas = Venda.objects.bulk_create(
+            (
+                Venda(
+                    cliente=f"Cliente {i % 500}",
+                    data=agora - timedelta(minutes=self.rng.randint(0, 90 * 24 * 60)),
+                    status=self.rng.choice(Venda.StatusVenda.values),
+                )
+                for i in range(options['vendas'])
+            ),
+            batch_size=1000,
+        )
+        itens = []
+        for venda in vendas:
+            venda.total = Decimal('0.00')
+            for produto in self.rng.sample(produtos, options['itens_por_venda']):
+                quantidade = self.rng.randint(1, 5)
+                itens.append(ItemVenda(venda=venda, produto=produto, quantidade=quantidade, preco_unitario=produto.preco))
+                venda.total += produto.preco * quantidade
+        ItemVenda.objects.bulk_create(itens, batch_size=1000)
+        Venda.objects.bulk_update(vendas, ['total'], batch_size=1000)
+        self.produtos = produtos
+
+    # --- Cenários ---
+
+    def _executar_cenarios(self, options) -> dict:
+        cliente = Client()
+        cenarios = {}
+
+        def pagina(url):
+            resposta = cliente.get(url)
+            if resposta.status_code != 200:
+                raise CommandError(f"GET {url} respondeu {resposta.status_code}.")
+            # Respostas em streaming só são geradas quando consumidas
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+
+        for nome in ('home', 'produto_list', 'venda_list'):
+            if self._incluir(nome):
+                cenarios[nome] = self._medir(
+                    lambda nome=nome: pagina(reverse(nome)),
+                    # Sem o contexto do dashboard em cache: mede as consultas da home, não o cache
+                    preparar=_limpar_cache_dashboard if nome == 'home' else None,
+                )
+        if self._incluir('home_em_cache'):
+            # A execução de aquecimento guarda o contexto; as medidas são acertos no cache
+            cenarios['home_em_cache'] = self._medir(lambda: pagina(reverse('home')))
+
+        # Busca de produtos: o nome completo de um produto e só o número dele (prefixo)
+        termos = [
+            termo
+            for i in (self.rng.randrange(options['produtos']) for _ in range(self.repeticoes + 1))
+            for termo in (f"Produto {i}", str(i))
+        ]
+        if self._incluir('busca_produtos'):
+            # O que a lista de produtos faz com ?q=: COUNT e a primeira página
+            def buscar(termo):
+                resultados = buscar_produtos(termo)
+                resultados.count()
+                list(resultados[:50])
+
+            fila = list(termos)
+            cenarios['busca_produtos'] = self._medir(lambda: buscar(fila.pop()))
+        if self._incluir('busca_produtos_pagina'):
+            fila = list(termos)
+            cenarios['busca_produtos_pagina'] = self._medir(
+                lambda: pagina(f"{reverse('produto_list')}?q={quote(fila.pop())}")
+            )
+
+        for formato in ExporterFactory.exporters:
+            if not self._incluir(f'exportacao_{formato}'):
+                continue
+            url = f"{reverse('produto_export')}?format={formato}"
+            # Uma nova versão do catálogo antes de cada execução: mede a exportação, não o cache
+            cenarios[f'exportacao_{formato}'] = self._medir(
+                lambda url=url: pagina(url), preparar=registrar_alteracao_catalogo,
+            )
+
+        for formato in LEITORES:
+            if not self._incluir(f'importacao_{formato}'):
+                continue
+            arquivos = [
+                self._arquivo_importacao(formato, options['linhas_importacao'], versao)
+                for versao in range(self.repeticoes + 1)
+            ]
+            cenarios[f'importacao_{formato}'] = self._medir(
+                lambda arquivos=arquivos, formato=formato: self._importar(arquivos.pop(), formato),
+                linhas=options['linhas_importacao'],
+            )
+
+        facade = VendaFacade()
+        if self._incluir('criar_venda'):
+            cenarios['criar_venda'] = self._medir(lambda: facade.criar_venda(*self._formularios_venda(), {}))
+
+        if self._incluir('atualizar_status_venda'):
+            self._cenario_atualizar_status_venda(cenarios, facade)
+        if self._incluir('atualizar_status_em_lote'):
+            self._cenario_atualizar_status_em_lote(cenarios, facade)
+        return cenarios
+
+    def _cenario_atualizar_status_venda(self, cenarios: dict, facade: VendaFacade):
+        # Cada execução cancela uma venda pendente diferente (devolução de estoque)
+        pendentes = list(
+            Venda.objects.filter(status=Venda.StatusVenda.PENDENTE).order_by('pk')[:self.repeticoes + 1]
+        )
+        if len(pendentes) > self.repeticoes:
+            cenarios['atualizar_status_venda'] = self._medir(
+                lambda: facade.atualizar_status_venda(
+                    pendentes.pop(), Venda.StatusVenda.PENDENTE, Venda.StatusVenda.CANCELADA
+                )
+            )
+        else:
+            self.stderr.write("Vendas pendentes insuficientes para 'atualizar_status_venda'; aumente --vendas.")
+
+    def _cenario_atualizar_status_em_lote(self, cenarios: dict, facade: VendaFacade):
+        # Lotes (de até 100) das vendas pendentes restantes marcados como pagos
+        ids_pendentes = list(
+            Venda.objects.filter(status=Venda.StatusVenda.PENDENTE).order_by('pk').values_list('pk', flat=True)
+        )
+        tamanho_lote = min(100, len(ids_pendentes) // (self.repeticoes + 1))
+        if tamanho_lote:
+            lotes = [ids_pendentes[i:i + tamanho_lote] for i in range(0, len(ids_pendentes), tamanho_lote)]
+            cenarios['atualizar_status_em_lote'] = self._medir(
+                lambda: facade.atualizar_status_em_lote(lotes.pop(0), Venda.StatusVenda.PAGA), linhas=tamanho_lote,
+            )
+        else:
+            self.stderr.write("Vendas pendentes insuficientes para 'atualizar_status_em_lote'; aumente --vendas.")
+
+    def _incluir(self, nome: str) -> bool:
+        return not self.prefixos or any(nome.startswith(prefixo) for prefixo in self.prefixos)
+
+    def _medir(self, funcao, preparar=None, linhas: int = None) -> dict:
+        """Uma execução de aquecimento e 'repeticoes' execuções medidas (tempo e consultas)."""
+        tempos = []
+        consultas = []
+        for execucao in range(self.repeticoes + 1):
+            if preparar:
+                preparar()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                funcao()
+                duracao = time.perf_counter() - inicio
+            if execucao:
+                tempos.append(duracao)
+                consultas.append(len(capturadas))
+
+        media = statistics.mean(tempos)
+        resultado = {
+            'operacoes_por_segundo': round(1 / media, 2),
+            'latencia_ms': {
+                'p50': _percentil(tempos, 50),
+                'p90': _percentil(tempos, 90),
+                'p99': _percentil(tempos, 99),
+                'max': round(max(tempos) * 1000, 2),
+            },
+            'consultas': max(consultas),
+        }
+        if linhas:
+            resultado['linhas_por_segundo'] = round(linhas / media, 1)
+        return resultado
+
+    def _formularios_venda(self):
+        itens = self.rng.sample(self.produtos, 3)
+        dados = {
+            'cliente': 'Cliente Benchmark',
+            'status': Venda.StatusVenda.PENDENTE,
+            'itens-TOTAL_FORMS': str(len(itens)),
+            'itens-INITIAL_FORMS': '0',
+            'itens-MIN_NUM_FORMS': '1',
+            'itens-MAX_NUM_FORMS': '1000',
+        }
+        for i, produto in enumerate(itens):
+            dados[f'itens-{i}-produto'] = str(produto.pk)
+            dados[f'itens-{i}-quantidade'] = '1'
+        form = VendaForm(dados)
+        formset = ItemVendaFormSet(dados, prefix='itens')
+        if not (form.is_valid() and formset.is_valid()):
+            raise CommandError(f"Venda sintética inválida: {form.errors} {formset.errors}")
+        return form, formset
+
+    def _arquivo_importacao(self, formato: str, linhas: int, versao: int) -> bytes:
+        """
+        Metade das linhas são produtos existentes com preço novo a cada versão
+        (atualizações) e metade são produtos novos daquela versão (inserções).
+        """
+        produtos = [
+            {
+                'nome': f"Produto {i}" if i % 2 else f"Importado {formato} {versao}-{i}",
+                'descricao': f"Importação {versao}",
+                'categoria': f"Categoria {i % 20}",
+                'preco': f"{10 + versao + i % 100}.90",
+                'estoque': str(100 + i % 50),
+            }
+            for i in range(linhas)
+        ]
+        if formato == 'json':
+            return json.dumps(produtos).encode('utf-8')
+        if formato == 'ndjson':
+            return ''.join(json.dumps(produto) + '\n' for produto in produtos).encode('utf-8')
+        if formato == 'csv':
+            saida = io.StringIO()
+            writer = csv.DictWriter(saida, fieldnames=list(produtos[0]))
+            writer.writeheader()
+            writer.writerows(produtos)
+            return saida.getvalue().encode('utf-8')
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><produtos>'
+            + ''.join(
+                '<produto>' + ''.join(f'<{campo}>{escape(valor)}</{campo}>' for campo, valor in produto.items()) + '</produto>'
+                for produto in produtos
+            )
+            + '</produtos>'
+        ).encode('utf-8')
+
+    @staticmethod
+    def _importar(conteudo: bytes, formato: str):
+        # Mesmo caminho de processar_import_job (COPY para CSV/NDJSON no PostgreSQL)
+        arquivo = io.BytesIO(conteudo)
+        if formato in CopyProdutoImporter.formatos and copy_disponivel():
+            resultado = CopyProdutoImporter().importar_arquivo(arquivo, formato)
+        else:
+            resultado = ProdutoImporter().importar(LEITORES[formato](arquivo))
+        if resultado.total_erros:
+            raise CommandError(f"Importação {formato} com erros: {resultado.erros[:3]}")
+
+    # --- Baseline ---
+
+    @staticmethod
+    def _ler_baseline(caminho: str) -> dict:
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Não foi possível ler o baseline {caminho}: {e}")
+
+    def _comparar(self, relatorio: dict, baseline: dict, tolerancia: float):
+        if baseline.get('dados') != relatorio['dados'] or baseline.get('banco') != relatorio['banco']:
+            self.stderr.write(self.style.WARNING(
+                "O baseline foi gerado com outra massa de dados ou outro banco; a comparação pode não ser válida."
+            ))
+
+        regressoes = []
+        for nome, atual in relatorio['cenarios'].items():
+            anterior = baseline.get('cenarios', {}).get(nome)
+            if anterior is None:
+                continue
+            limite = anterior['latencia_ms']['p50'] * (1 + tolerancia)
+            if atual['latencia_ms']['p50'] > limite:
+                regressoes.append(
+                    f"{nome}: p50 {atual['latencia_ms']['p50']}ms (baseline {anterior['latencia_ms']['p50']}ms)"
+                )
+            # O número de consultas não depende da máquina: qualquer aumento é regressão
+            if atual['consultas'] > anterior['consultas']:
+                regressoes.append(f"{nome}: {atual['consultas']} consultas (baseline {anterior['consultas']})")
+
+        if regressoes:
+            raise CommandError("Regressões em relação ao baseline:\n  " + "\n  ".join(regressoes))
+        self.stderr.write(self.style.SUCCESS(f"Sem regressões em relação ao baseline (tolerância {tolerancia:.0%})."))
+
+
+def _limpar_cache_dashboard():
+    cache.delete_many([dashboard.CHAVE_CONTEXTO, dashboard.CHAVE_VERSAO, dashboard.CHAVE_TRAVA])
+
+
+def _percentil(valores: list, percentil: int) -> float:
+    """Percentil pelo método nearest-rank, em milissegundos."""
+    ordenados = sorted(valores)
+    posicao = max(math.ceil(percentil / 100 * len(ordenados)) - 1, 0)
+    return round(ordenados[posicao] * 1000, 2)
@@ -0,0 +1,83 @@
+import time
+import tracemalloc
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from vendas.exporters import XmlIncrementalWriter
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a exportação XML antiga (dicttoxml + minidom) com o "
+        "XmlIncrementalWriter sobre uma lista sintética de produtos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100_000, help="Quantidade de produtos sintéticos.")
+        parser.add_argument(
+            '--memoria', action='store_true',
+            help="Mede também o pico de memória (tracemalloc deixa as execuções bem mais lentas).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from dicttoxml import dicttoxml
+            from xml.dom.minidom import parseString
+        except ImportError:
+            raise CommandError("O benchmark precisa do pacote 'dicttoxml' para medir o caminho antigo.")
+
+        dados = [
+            {
+                'id': i,
+                'nome': f"Produto {i} & Cia",
+                'descricao': None if i % 3 else f"Descrição <{i}>",
+                'categoria__nome': f"Categoria {i % 50}",
+                'preco': Decimal(i % 1000) + Decimal('0.99'),
+                'estoque': i % 500,
+            }
+            for i in range(options['produtos'])
+        ]
+
+        def caminho_antigo():
+            xml_data = dicttoxml(dados, custom_root='produtos', item_func=lambda x: 'produto')
+            return parseString(xml_data).toprettyxml(indent="  ")
+
+        def caminho_incremental():
+            # Simula o envio em streaming: cada <produto> é descartado após ser escrito
+            writer = XmlIncrementalWriter()
+            tamanho = len(writer.cabecalho())
+            for item in dados:
+                tamanho += len(writer.elemento(item))
+            return tamanho + len(writer.rodape())
+
+        antigo, tempo_antigo = self._cronometrar(caminho_antigo)
+        tamanho_novo, tempo_novo = self._cronometrar(caminho_incremental)
+
+        writer = XmlIncrementalWriter()
+        novo = writer.cabecalho() + ''.join(writer.elemento(item) for item in dados) + writer.rodape()
+        if novo != antigo:
+            raise CommandError("O XML incremental difere do gerado por dicttoxml + minidom.")
+        del antigo, novo
+
+        self.stdout.write(f"Produtos: {len(dados)} ({tamanho_novo / 1024 / 1024:.1f} MB de XML)")
+        self.stdout.write(f"dicttoxml + minidom:  {tempo_antigo:8.2f}s")
+        self.stdout.write(f"XmlIncrementalWriter: {tempo_novo:8.2f}s")
+
+        if options['memoria']:
+            self.stdout.write(f"Pico de memória (dicttoxml + minidom):  {self._pico_memoria(caminho_antigo):8.1f} MB")
+            self.stdout.write(f"Pico de memória (XmlIncrementalWriter): {self._pico_memoria(caminho_incremental):8.1f} MB")
+
+        self.stdout.write(self.style.SUCCESS(f"Saída idêntica; {tempo_antigo / tempo_novo:.1f}x mais rápido."))
+
+    @staticmethod
+    def _cronometrar(funcao):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        return resultado, time.perf_counter() - inicio
+
+    @staticmethod
+    def _pico_memoria(funcao) -> float:
+        tracemalloc.start()
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return pico / 1024 / 1024
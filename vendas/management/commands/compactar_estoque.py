@@ -0,0 +1,32 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from vendas.estoque import compactar_extrato, divergencias_do_extrato
+
+
+class Command(BaseCommand):
+    help = (
+        "Compacta o extrato de estoque: movimentos mais antigos que --dias são somados "
+        "ao saldo de cada produto (SaldoEstoque) e removidos. Rodar periodicamente (ex.: cron diário)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help="Movimentos mais recentes que isso ficam no extrato.")
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help="Lista os produtos cujo estoque não bate com saldo compactado + movimentos pendentes.",
+        )
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+        compactados = compactar_extrato(antes_de)
+        self.stdout.write(f"{compactados} movimentos compactados (anteriores a {antes_de:%d/%m/%Y %H:%M}).")
+
+        if options['verificar']:
+            divergentes = 0
+            for produto in divergencias_do_extrato().order_by('nome').iterator():
+                divergentes += 1
+                self.stdout.write(
+                    f"  {produto.nome}: estoque {produto.estoque}, extrato {produto.saldo_extrato}"
+                )
+            self.stdout.write(f"{divergentes} produtos com divergência.")
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from vendas.idempotencia import limpar_chaves_expiradas
+
+
+class Command(BaseCommand):
+    help = "Remove as chaves de idempotência expiradas. Rodar periodicamente (ex.: cron de hora em hora)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{limpar_chaves_expiradas()} chaves expiradas removidas.")
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from vendas.importers import processar_import_job
+from vendas.metricas import registro
+from vendas.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker que processa as importações de produtos enfileiradas em /produtos/import/. "
+        "A fila é a própria tabela ImportJob (sem broker externo); vários workers podem rodar ao mesmo tempo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help="Processa o que estiver na fila e termina.")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos entre consultas à fila vazia.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Aguardando importações...")
+        while True:
+            close_old_connections()
+            job = self._reservar_proximo()
+            if job is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f"Processando {job} ({job.arquivo.name})")
+            job = processar_import_job(job)
+            self.stdout.write(
+                f"{job}: {job.processados} linhas, {job.total_erros} erros, "
+                f"{job.linhas_por_segundo:.0f} linhas/s"
+            )
+            registro.gravar(forcar=True)
+
+    def _reservar_proximo(self):
+        """
+        Marca a importação pendente mais antiga como 'PROCESSANDO'.
+        SKIP LOCKED faz cada worker pegar uma importação diferente.
+        """
+        with transaction.atomic():
+            job = (
+                ImportJob.objects.select_for_update(skip_locked=True)
+                .filter(status=ImportJob.Status.PENDENTE)
+                .order_by('criado_em')
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = ImportJob.Status.PROCESSANDO
+            job.iniciado_em = timezone.now()
+            job.save(update_fields=['status', 'iniciado_em'])
+            return job
@@ -0,0 +1,79 @@
+import logging
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from vendas.fila_vendas import PARTICOES, particoes_do_worker, processar_pedidos
+from vendas.metricas import registro
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Workers da fila de vendas (/vendas/fila/). Cada worker cuida de um conjunto fixo de "
+        f"partições (de {PARTICOES}), ou seja, de um conjunto fixo de produtos: as baixas de "
+        "estoque de um mesmo produto são feitas sempre pelo mesmo processo, em sequência."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help=f"Total de workers (1 a {PARTICOES}).")
+        parser.add_argument(
+            '--worker', type=int,
+            help="Roda só o worker com este índice (0 a --workers - 1), para subir cada um por um supervisor.",
+        )
+        parser.add_argument('--uma-vez', action='store_true', help="Processa o que estiver na fila e termina.")
+        parser.add_argument('--intervalo', type=float, default=0.5, help="Segundos entre consultas à fila vazia.")
+
+    def handle(self, *args, **options):
+        total = options['workers']
+        if not 1 <= total <= PARTICOES:
+            raise CommandError(f"--workers deve estar entre 1 e {PARTICOES}.")
+
+        if options['worker'] is not None:
+            if not 0 <= options['worker'] < total:
+                raise CommandError("--worker deve estar entre 0 e --workers - 1.")
+            self._executar(options['worker'], total, options['uma_vez'], options['intervalo'])
+            return
+        if total == 1:
+            self._executar(0, 1, options['uma_vez'], options['intervalo'])
+            return
+
+        # Conexões abertas não podem ser compartilhadas com os processos filhos
+        connections.close_all()
+        processos = [
+            multiprocessing.Process(
+                target=self._executar, args=(indice, total, options['uma_vez'], options['intervalo'])
+            )
+            for indice in range(total)
+        ]
+        for processo in processos:
+            processo.start()
+        try:
+            for processo in processos:
+                processo.join()
+        except KeyboardInterrupt:
+            for processo in processos:
+                processo.terminate()
+
+    def _executar(self, indice: int, total: int, uma_vez: bool, intervalo: float):
+        particoes = particoes_do_worker(indice, total)
+        self.stdout.write(f"Worker {indice}: partições {particoes}")
+        while True:
+            close_old_connections()
+            try:
+                processados = processar_pedidos(particoes)
+            except Exception:
+                # Banco fora do ar, conexão perdida...: o worker tenta de novo no próximo ciclo
+                logger.exception("Worker %d: erro ao processar a fila", indice)
+                if uma_vez:
+                    raise
+                time.sleep(intervalo)
+                continue
+            if processados:
+                self.stdout.write(f"Worker {indice}: {processados} pedidos processados")
+                registro.gravar()
+                continue
+            if uma_vez:
+                break
+            time.sleep(intervalo)
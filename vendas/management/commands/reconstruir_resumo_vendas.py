@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from vendas.resumo import reconstruir_resumo
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula o resumo diário de vendas (ResumoVendasDia) a partir de todas as vendas. "
+        "A VendaFacade mantém o resumo atualizado; use após alterações feitas por fora dela "
+        "(admin, SQL manual) ou para conferir o resumo."
+    )
+
+    def handle(self, *args, **options):
+        linhas = reconstruir_resumo()
+        self.stdout.write(self.style.SUCCESS(f"Resumo reconstruído: {linhas} linhas (dia x status)."))
@@ -0,0 +1,276 @@
+"""
+Métricas do caminho quente (vendas, exportações, importações e views) no
+formato texto do Prometheus, expostas em /metrics.
+
+Cada processo mantém contadores e histogramas em memória. Com vários workers
+do gunicorn, defina METRICAS_DIR (um diretório compartilhado e vazio a cada
+deploy): cada processo grava um arquivo <pid>.json com os seus valores e o
+/metrics soma os arquivos de todos os processos.
+"""
+import atexit
+import bisect
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Intervalo mínimo entre gravações do arquivo do processo (modo multiprocesso)
+INTERVALO_GRAVACAO = 1.0
+
+
+class Metrica:
+    tipo = ''
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, valores: dict) -> tuple:
+        return tuple(str(valores[rotulo]) for rotulo in self.rotulos)
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, quantidade: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self.series[chave] = self.series.get(chave, 0) + quantidade
+
+    def exportar(self) -> list:
+        with self._lock:
+            return [[list(chave), valor] for chave, valor in self.series.items()]
+
+    @staticmethod
+    def somar(atual, outro):
+        return (atual or 0) + outro
+
+
+class Histograma(Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple, buckets: tuple):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = buckets
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self.series.get(chave)
+            if serie is None:
+                # Contagem por bucket (não cumulativa) + o bucket +Inf no final
+                serie = self.series[chave] = {'buckets': [0] * (len(self.buckets) + 1), 'soma': 0.0, 'contagem': 0}
+            serie['buckets'][bisect.bisect_left(self.buckets, valor)] += 1
+            serie['soma'] += valor
+            serie['contagem'] += 1
+
+    def exportar(self) -> list:
+        with self._lock:
+            return [[list(chave), dict(serie, buckets=list(serie['buckets']))] for chave, serie in self.series.items()]
+
+    @staticmethod
+    def somar(atual, outro):
+        if atual is None:
+            return dict(outro, buckets=list(outro['buckets']))
+        atual['buckets'] = [a + b for a, b in zip(atual['buckets'], outro['buckets'])]
+        atual['soma'] += outro['soma']
+        atual['contagem'] += outro['contagem']
+        return atual
+
+
+class Registro:
+    """Conjunto das métricas do processo, com gravação/leitura dos arquivos do modo multiprocesso."""
+
+    def __init__(self):
+        self.metricas = {}
+        self._ultima_gravacao = 0.0
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        self.metricas[metrica.nome] = metrica
+        return metrica
+
+    @property
+    def diretorio(self):
+        return getattr(settings, 'METRICAS_DIR', None)
+
+    def valores(self) -> dict:
+        return {nome: metrica.exportar() for nome, metrica in self.metricas.items()}
+
+    def gravar(self, forcar: bool = False):
+        """Grava o arquivo deste processo (no máximo a cada INTERVALO_GRAVACAO segundos)."""
+        diretorio = self.diretorio
+        agora = time.monotonic()
+        if not diretorio or (not forcar and agora - self._ultima_gravacao < INTERVALO_GRAVACAO):
+            return
+        self._ultima_gravacao = agora
+        try:
+            # Escrita atômica: o /metrics de outro processo nunca lê um arquivo pela metade
+            with tempfile.NamedTemporaryFile('w', dir=diretorio, suffix='.tmp', delete=False) as arquivo:
+                json.dump(self.valores(), arquivo)
+            os.replace(arquivo.name, os.path.join(diretorio, f'{os.getpid()}.json'))
+        except OSError:
+            logger.exception("Não foi possível gravar as métricas em %s", diretorio)
+
+    def agregado(self) -> dict:
+        """Valores deste processo somados aos gravados pelos outros processos."""
+        totais = {nome: {} for nome in self.metricas}
+        fontes = [self.valores()]
+        if self.diretorio and os.path.isdir(self.diretorio):
+            proprio = f'{os.getpid()}.json'
+            for nome_arquivo in os.listdir(self.diretorio):
+                if not nome_arquivo.endswith('.json') or nome_arquivo == proprio:
+                    continue
+                try:
+                    with open(os.path.join(self.diretorio, nome_arquivo)) as arquivo:
+                        fontes.append(json.load(arquivo))
+                except (OSError, ValueError):
+                    continue
+
+        for fonte in fontes:
+            for nome, series in fonte.items():
+                metrica = self.metricas.get(nome)
+                if metrica is None:
+                    continue
+                for chave, valor in series:
+                    chave = tuple(chave)
+                    totais[nome][chave] = metrica.somar(totais[nome].get(chave), valor)
+        return totais
+
+    def texto_prometheus(self) -> str:
+        linhas = []
+        for nome, series in self.agregado().items():
+            metrica = self.metricas[nome]
+            linhas.append(f'# HELP {nome} {metrica.ajuda}')
+            linhas.append(f'# TYPE {nome} {metrica.tipo}')
+            for chave, valor in sorted(series.items()):
+                rotulos = list(zip(metrica.rotulos, chave))
+                if metrica.tipo == 'counter':
+                    linhas.append(f'{nome}{_rotulos(rotulos)} {_numero(valor)}')
+                    continue
+                acumulado = 0
+                for limite, quantidade in zip(metrica.buckets + ('+Inf',), valor['buckets']):
+                    acumulado += quantidade
+                    linhas.append(f'{nome}_bucket{_rotulos(rotulos + [("le", limite)])} {acumulado}')
+                linhas.append(f'{nome}_sum{_rotulos(rotulos)} {_numero(valor["soma"])}')
+                linhas.append(f'{nome}_count{_rotulos(rotulos)} {valor["contagem"]}')
+        return '\n'.join(linhas) + '\n'
+
+
+def _rotulos(pares: list) -> str:
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+registro = Registro()
+atexit.register(registro.gravar, forcar=True)
+
+requisicoes = registro.registrar(Contador(
+    'vendas_http_requisicoes_total', "Requisições atendidas pelas views do app vendas.", ('view', 'metodo', 'status'),
+))
+duracao_requisicoes = registro.registrar(Histograma(
+    'vendas_http_duracao_segundos', "Tempo de resposta por view (sem o envio do corpo em streaming).", ('view',),
+    BUCKETS_DURACAO,
+))
+consultas_requisicoes = registro.registrar(Histograma(
+    'vendas_http_consultas', "Consultas SQL por requisição.", ('view',), BUCKETS_CONSULTAS,
+))
+duracao_operacoes = registro.registrar(Histograma(
+    'vendas_operacao_duracao_segundos', "Duração das operações de venda, exportação e importação.", ('operacao',),
+    BUCKETS_DURACAO,
+))
+consultas_operacoes = registro.registrar(Histograma(
+    'vendas_operacao_consultas', "Consultas SQL por operação.", ('operacao',), BUCKETS_CONSULTAS,
+))
+erros_operacoes = registro.registrar(Contador(
+    'vendas_operacao_erros_total', "Operações que terminaram com exceção.", ('operacao',),
+))
+
+
+class _ContadorConsultas:
+    """execute_wrapper que conta as consultas feitas na conexão padrão."""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def medir(operacao: str):
+    """Mede duração e número de consultas de um trecho de código."""
+    contador = _ContadorConsultas()
+    inicio = time.perf_counter()
+    try:
+        with connection.execute_wrapper(contador):
+            yield
+    except BaseException:
+        erros_operacoes.incrementar(operacao=operacao)
+        raise
+    finally:
+        duracao_operacoes.observar(time.perf_counter() - inicio, operacao=operacao)
+        consultas_operacoes.observar(contador.total, operacao=operacao)
+
+
+def medido(operacao: str):
+    """Decorator: @medido('criar_venda')."""
+    def decorator(funcao):
+        @functools.wraps(funcao)
+        def wrapper(*args, **kwargs):
+            with medir(operacao):
+                return funcao(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def medir_iteracao(operacao: str, pedacos: Iterator) -> Iterator:
+    """Mede um gerador do início ao fim do consumo (respostas em streaming)."""
+    with medir(operacao):
+        yield from pedacos
+
+
+class MetricasMiddleware:
+    """Mede todas as views do app vendas: duração, consultas e status por view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            response = self.get_response(request)
+        duracao = time.perf_counter() - inicio
+
+        match = request.resolver_match
+        if match is not None and match.func.__module__.startswith('vendas.'):
+            view = match.url_name or match.view_name
+            requisicoes.incrementar(view=view, metodo=request.method, status=response.status_code)
+            duracao_requisicoes.observar(duracao, view=view)
+            consultas_requisicoes.observar(contador.total, view=view)
+            registro.gravar()
+        return response
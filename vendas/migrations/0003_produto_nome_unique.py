@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:13
+
+from django.db import migrations, models
+
+
+def renomear_produtos_duplicados(apps, schema_editor):
+    """
+    Antes de tornar 'nome' único, renomeia duplicatas já existentes
+    acrescentando o id (ex: "Caneta (#42)"). Não apagamos nada porque
+    ItemVenda protege os produtos já vendidos.
+    """
+    Produto = apps.get_model('vendas', 'Produto')
+    duplicados = (
+        Produto.objects.values('nome')
+        .annotate(total=models.Count('id'))
+        .filter(total__gt=1)
+        .values_list('nome', flat=True)
+    )
+    for nome in list(duplicados):
+        # Mantém o nome original no produto mais antigo
+        for produto in Produto.objects.filter(nome=nome).order_by('id')[1:]:
+            sufixo = f" (#{produto.pk})"
+            produto.nome = nome[:200 - len(sufixo)] + sufixo
+            produto.save(update_fields=['nome'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0002_venda_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(renomear_produtos_duplicados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='produto',
+            name='nome',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0003_produto_nome_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('arquivo', models.FileField(upload_to='importacoes/')),
+                ('formato', models.CharField(max_length=10)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=12)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('processados', models.PositiveIntegerField(default=0)),
+                ('criados', models.PositiveIntegerField(default=0)),
+                ('atualizados', models.PositiveIntegerField(default=0)),
+                ('inalterados', models.PositiveIntegerField(default=0)),
+                ('total_erros', models.PositiveIntegerField(default=0)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('mensagem', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Importação',
+                'verbose_name_plural': 'Importações',
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='vendas_impo_status_499bfa_idx')],
+            },
+        ),
+    ]
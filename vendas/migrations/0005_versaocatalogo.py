@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def criar_versao_inicial(apps, schema_editor):
+    VersaoCatalogo = apps.get_model('vendas', 'VersaoCatalogo')
+    VersaoCatalogo.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.BigIntegerField(default=1)),
+                ('atualizado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Versão do Catálogo',
+                'verbose_name_plural': 'Versão do Catálogo',
+            },
+        ),
+        migrations.RunPython(criar_versao_inicial, migrations.RunPython.noop),
+    ]
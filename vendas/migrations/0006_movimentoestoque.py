@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def saldo_inicial(apps, schema_editor):
+    # O estoque atual de cada produto é o ponto de partida do extrato
+    Produto = apps.get_model('vendas', 'Produto')
+    SaldoEstoque = apps.get_model('vendas', 'SaldoEstoque')
+    saldos = (
+        SaldoEstoque(produto_id=pk, saldo=estoque)
+        for pk, estoque in Produto.objects.values_list('pk', 'estoque').iterator(chunk_size=2000)
+    )
+    SaldoEstoque.objects.bulk_create(saldos, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0005_versaocatalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoEstoque',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo_estoque', serialize=False, to='vendas.produto')),
+                ('saldo', models.IntegerField(default=0)),
+                ('compactado_em', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Saldo de Estoque',
+                'verbose_name_plural': 'Saldos de Estoque',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimentoEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('VENDA', 'Venda'), ('DEVOLUCAO', 'Devolução (venda cancelada)'), ('REATIVACAO', 'Venda re-ativada'), ('IMPORTACAO', 'Ajuste por importação'), ('AJUSTE', 'Ajuste manual')], max_length=10)),
+                ('quantidade', models.IntegerField()),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item_venda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='vendas.itemvenda')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos', to='vendas.produto')),
+                ('venda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos_estoque', to='vendas.venda')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Estoque',
+                'verbose_name_plural': 'Movimentos de Estoque',
+                'indexes': [models.Index(fields=['produto', 'criado_em'], name='vendas_movi_produto_a8b4a3_idx'), models.Index(fields=['criado_em'], name='vendas_movi_criado__1dfffd_idx')],
+            },
+        ),
+        migrations.RunPython(saldo_inicial, migrations.RunPython.noop),
+    ]
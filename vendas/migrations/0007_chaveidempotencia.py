@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0006_movimentoestoque'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escopo', models.CharField(max_length=50)),
+                ('chave', models.CharField(max_length=200)),
+                ('hash_requisicao', models.CharField(max_length=64)),
+                ('resposta', models.JSONField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Chave de Idempotência',
+                'verbose_name_plural': 'Chaves de Idempotência',
+                'constraints': [models.UniqueConstraint(fields=('escopo', 'chave'), name='chave_idempotencia_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0007_chaveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoVenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dados', models.JSONField()),
+                ('particao', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('AGUARDANDO', 'Aguardando'), ('CONCLUIDO', 'Concluído'), ('REJEITADO', 'Rejeitado')], default='AGUARDANDO', max_length=10)),
+                ('erros', models.JSONField(blank=True, default=list)),
+                ('criado_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+                ('venda', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='vendas.venda')),
+            ],
+            options={
+                'verbose_name': 'Pedido de Venda',
+                'verbose_name_plural': 'Pedidos de Venda',
+                'indexes': [models.Index(fields=['status', 'particao', 'id'], name='vendas_pedi_status_016551_idx')],
+            },
+        ),
+    ]
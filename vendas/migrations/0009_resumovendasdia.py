@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def resumo_inicial(apps, schema_editor):
+    # Mesmo cálculo de vendas.resumo.resumo_das_vendas, com os modelos históricos
+    Venda = apps.get_model('vendas', 'Venda')
+    ItemVenda = apps.get_model('vendas', 'ItemVenda')
+    ResumoVendasDia = apps.get_model('vendas', 'ResumoVendasDia')
+    itens_da_venda = (
+        ItemVenda.objects.filter(venda=OuterRef('pk'))
+        .values('venda')
+        .annotate(quantidade=Sum('quantidade'))
+        .values('quantidade')
+    )
+    linhas = (
+        Venda.objects.annotate(
+            dia=TruncDate('data'),
+            quantidade_itens=Coalesce(Subquery(itens_da_venda, output_field=IntegerField()), 0),
+        )
+        .values('status', 'dia')
+        .annotate(receita=Sum('total'), itens=Sum('quantidade_itens'), vendas=Count('pk'))
+        .order_by('status', 'dia')
+    )
+    ResumoVendasDia.objects.bulk_create((ResumoVendasDia(**linha) for linha in linhas.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0008_pedidovenda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVendasDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PAGA', 'Paga'), ('CANCELADA', 'Cancelada')], max_length=10)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('itens', models.BigIntegerField(default=0)),
+                ('vendas', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumo de Vendas do Dia',
+                'verbose_name_plural': 'Resumos de Vendas por Dia',
+                'constraints': [models.UniqueConstraint(fields=('status', 'dia'), name='resumo_vendas_status_dia_unico')],
+            },
+        ),
+        migrations.RunPython(resumo_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0009_resumovendasdia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['-data', '-id'], name='venda_data_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['status', '-data', '-id'], name='venda_status_data_id_idx'),
+        ),
+    ]
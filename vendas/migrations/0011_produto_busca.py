@@ -0,0 +1,77 @@
+from django.db import migrations, transaction
+from django.db.utils import DatabaseError
+
+# Só no PostgreSQL (vendas/busca.py usa icontains nos outros bancos).
+# 'busca' é uma coluna gerada: o banco a recalcula a cada INSERT/UPDATE de
+# nome ou descrição, inclusive nas importações em lote por SQL. Ela não é um
+# campo do modelo Produto; só a busca a consulta.
+
+
+def _criar_extensao(schema_editor, nome: str):
+    """Cria a extensão se ela existir no servidor; devolve o schema dela ou None."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", [nome])
+        if cursor.fetchone() is None:
+            return None
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {nome}")
+        except DatabaseError:
+            # Sem permissão para criar a extensão: a busca funciona sem ela
+            return None
+        cursor.execute(
+            "SELECT n.nspname FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace WHERE e.extname = %s",
+            [nome],
+        )
+        return cursor.fetchone()[0]
+
+
+def criar_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    schema_unaccent = _criar_extensao(schema_editor, 'unaccent')
+    trigramas = _criar_extensao(schema_editor, 'pg_trgm') is not None
+
+    # Minúsculas e sem acentos (quando há 'unaccent'). IMMUTABLE para poder ser
+    # usada na coluna gerada e nos índices: o dicionário vai explícito na chamada.
+    if schema_unaccent:
+        corpo = f"SELECT lower({quote(schema_unaccent)}.unaccent('{schema_unaccent}.unaccent'::regdictionary, texto))"
+    else:
+        corpo = "SELECT lower(texto)"
+    schema_editor.execute(
+        "CREATE OR REPLACE FUNCTION vendas_normalizar(texto text) RETURNS text "
+        f"LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $${corpo}$$"
+    )
+    # Nome com peso A e descrição com peso B no ts_rank; configuração 'simple'
+    # (sem stemming) para a busca por prefixo funcionar com qualquer palavra
+    schema_editor.execute(
+        "ALTER TABLE vendas_produto ADD COLUMN busca tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple'::regconfig, vendas_normalizar(nome)), 'A') || "
+        "setweight(to_tsvector('simple'::regconfig, vendas_normalizar(coalesce(descricao, ''))), 'B')"
+        ") STORED"
+    )
+    schema_editor.execute("CREATE INDEX produto_busca_gin ON vendas_produto USING gin (busca)")
+    if trigramas:
+        schema_editor.execute(
+            "CREATE INDEX produto_nome_trgm ON vendas_produto USING gin (vendas_normalizar(nome) gin_trgm_ops)"
+        )
+
+
+def remover_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS produto_nome_trgm")
+    schema_editor.execute("ALTER TABLE vendas_produto DROP COLUMN IF EXISTS busca")
+    schema_editor.execute("DROP FUNCTION IF EXISTS vendas_normalizar(text)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0010_venda_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_busca, remover_busca),
+    ]
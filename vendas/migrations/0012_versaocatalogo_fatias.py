@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# Mesmo valor de FATIAS_VERSAO em vendas/catalogo.py (fixo aqui, como toda migração).
+# A linha 1 já existe (0005); a soma das versões só cresce com as novas linhas.
+FATIAS_VERSAO = 16
+
+
+def criar_fatias(apps, schema_editor):
+    VersaoCatalogo = apps.get_model('vendas', 'VersaoCatalogo')
+    for pk in range(1, FATIAS_VERSAO + 1):
+        VersaoCatalogo.objects.get_or_create(pk=pk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0011_produto_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_fatias, migrations.RunPython.noop),
+    ]
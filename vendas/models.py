@@ -15,7 +15,8 @@ class Categoria(models.Model):
 # Modelo Produto
 class Produto(models.Model):
     # Requisito: Índice em campo de busca frequente
-    nome = models.CharField(max_length=200, db_index=True)
+    # (unique: o nome é a chave do upsert em lote da importação)
+    nome = models.CharField(max_length=200, unique=True)
     descricao = models.TextField(blank=True, null=True)
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     estoque = models.PositiveIntegerField(default=0)
@@ -58,6 +59,12 @@ class Venda(models.Model):
     class Meta:
         verbose_name = "Venda"
         verbose_name_plural = "Vendas"
+        indexes = [
+            # Paginação por cursor da lista de vendas (vendas/paginacao.py): ORDER BY data DESC, id DESC
+            models.Index(fields=['-data', '-id'], name='venda_data_id_idx'),
+            # A mesma lista filtrada por status
+            models.Index(fields=['status', '-data', '-id'], name='venda_status_data_id_idx'),
+        ]
 
     # --- __str__ ATUALIZADO ---
     def __str__(self):
@@ -81,4 +88,192 @@ class ItemVenda(models.Model):
         unique_together = ('venda', 'produto') 
 
     def __str__(self):
-        return f"{self.quantidade} x {self.produto.nome} (Venda {self.venda.id})"
\ No newline at end of file
+        # venda_id: não carrega a venda só para mostrar o número
+        return f"{self.quantidade} x {self.produto.nome} (Venda {self.venda_id})"
+
+    def clean_fields(self, exclude=None):
+        # Com o produto já carregado (ex.: pelo ItemVendaFormSet) a existência dele
+        # já foi verificada; sem isto a validação faria um SELECT por item
+        exclude = set(exclude or ())
+        if ItemVenda.produto.is_cached(self):
+            exclude.add('produto')
+        super().clean_fields(exclude=exclude)
+
+# Modelo ImportJob (fila de importações processadas em segundo plano)
+class ImportJob(models.Model):
+
+    class Status(models.TextChoices):
+        PENDENTE = 'PENDENTE', 'Pendente'
+        PROCESSANDO = 'PROCESSANDO', 'Processando'
+        CONCLUIDA = 'CONCLUIDA', 'Concluída'
+        FALHOU = 'FALHOU', 'Falhou'
+
+    arquivo = models.FileField(upload_to='importacoes/')
+    formato = models.CharField(max_length=10)
+    status = models.CharField(max_length=12, choices=Status.choices, default=Status.PENDENTE)
+    criado_em = models.DateTimeField(default=timezone.now)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+
+    # Progresso (atualizado a cada lote gravado)
+    processados = models.PositiveIntegerField(default=0)
+    criados = models.PositiveIntegerField(default=0)
+    atualizados = models.PositiveIntegerField(default=0)
+    inalterados = models.PositiveIntegerField(default=0)
+    total_erros = models.PositiveIntegerField(default=0)
+    erros = models.JSONField(default=list, blank=True)
+    mensagem = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Importação"
+        verbose_name_plural = "Importações"
+        indexes = [
+            # O worker busca a próxima importação pendente por ordem de chegada
+            models.Index(fields=['status', 'criado_em']),
+        ]
+
+    def __str__(self):
+        return f"Importação {self.id} ({self.get_status_display()})"
+
+    @property
+    def linhas_por_segundo(self) -> float:
+        if not self.iniciado_em:
+            return 0.0
+        duracao = ((self.finalizado_em or timezone.now()) - self.iniciado_em).total_seconds()
+        return self.processados / duracao if duracao > 0 else 0.0
+
+
+# Modelo VersaoCatalogo (uma linha por fatia; a versão do catálogo é a soma delas, ver catalogo.py)
+class VersaoCatalogo(models.Model):
+    versao = models.BigIntegerField(default=1)
+    atualizado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Versão do Catálogo"
+        verbose_name_plural = "Versão do Catálogo"
+
+    def __str__(self):
+        return f"Catálogo v{self.versao}"
+
+
+# Modelo MovimentoEstoque (extrato de estoque: só recebe inserções)
+class MovimentoEstoque(models.Model):
+    """
+    Cada entrada ou saída de estoque vira uma linha nova (nunca alterada).
+    Produto.estoque continua sendo o saldo usado na venda; o extrato é a
+    trilha de auditoria e, somado ao SaldoEstoque, permite conferir esse saldo.
+    """
+
+    class Tipo(models.TextChoices):
+        VENDA = 'VENDA', 'Venda'
+        DEVOLUCAO = 'DEVOLUCAO', 'Devolução (venda cancelada)'
+        REATIVACAO = 'REATIVACAO', 'Venda re-ativada'
+        IMPORTACAO = 'IMPORTACAO', 'Ajuste por importação'
+        AJUSTE = 'AJUSTE', 'Ajuste manual'
+
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name='movimentos')
+    tipo = models.CharField(max_length=10, choices=Tipo.choices)
+    # Positivo: entrada; negativo: saída
+    quantidade = models.IntegerField()
+    venda = models.ForeignKey(Venda, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos_estoque')
+    item_venda = models.ForeignKey(ItemVenda, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    criado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Movimento de Estoque"
+        verbose_name_plural = "Movimentos de Estoque"
+        indexes = [
+            # Saldo pendente por produto e compactação por data
+            models.Index(fields=['produto', 'criado_em']),
+            models.Index(fields=['criado_em']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.quantidade:+d} ({self.produto_id})"
+
+
+# Modelo SaldoEstoque (snapshot compactado do extrato, um por produto)
+class SaldoEstoque(models.Model):
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, primary_key=True, related_name='saldo_estoque')
+    # Soma de todos os movimentos já compactados (e removidos do extrato)
+    saldo = models.IntegerField(default=0)
+    compactado_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Saldo de Estoque"
+        verbose_name_plural = "Saldos de Estoque"
+
+    def __str__(self):
+        return f"{self.produto_id}: {self.saldo}"
+
+
+# Modelo ChaveIdempotencia (resultado de uma criação já feita, para repetições do cliente)
+class ChaveIdempotencia(models.Model):
+    escopo = models.CharField(max_length=50)
+    chave = models.CharField(max_length=200)
+    # Hash do conteúdo da requisição: a mesma chave com outro conteúdo é um erro do cliente
+    hash_requisicao = models.CharField(max_length=64)
+    resposta = models.JSONField(null=True, blank=True)
+    criado_em = models.DateTimeField(default=timezone.now)
+    expira_em = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Chave de Idempotência"
+        verbose_name_plural = "Chaves de Idempotência"
+        constraints = [
+            models.UniqueConstraint(fields=['escopo', 'chave'], name='chave_idempotencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.escopo}:{self.chave}"
+
+
+# Modelo PedidoVenda (fila persistente de vendas, processada pelo comando 'processar_vendas')
+class PedidoVenda(models.Model):
+
+    class Status(models.TextChoices):
+        AGUARDANDO = 'AGUARDANDO', 'Aguardando'
+        CONCLUIDO = 'CONCLUIDO', 'Concluído'
+        REJEITADO = 'REJEITADO', 'Rejeitado'
+
+    # Mesmo formato de uma venda do lote em /vendas/lote/
+    dados = models.JSONField()
+    # Partição da fila (definida pelos produtos da venda); cada worker cuida de algumas
+    particao = models.PositiveSmallIntegerField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.AGUARDANDO)
+    venda = models.ForeignKey(Venda, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    erros = models.JSONField(default=list, blank=True)
+    criado_em = models.DateTimeField(default=timezone.now)
+    processado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Pedido de Venda"
+        verbose_name_plural = "Pedidos de Venda"
+        indexes = [
+            # Cada worker busca os pedidos aguardando das suas partições, por ordem de chegada
+            models.Index(fields=['status', 'particao', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Pedido {self.id} ({self.get_status_display()})"
+
+
+# Modelo ResumoVendasDia (totais por dia e status, mantidos pela VendaFacade para o dashboard)
+class ResumoVendasDia(models.Model):
+    # Dia local (TIME_ZONE) da data da venda, o mesmo critério de 'data__date'
+    dia = models.DateField()
+    status = models.CharField(max_length=10, choices=Venda.StatusVenda.choices)
+    receita = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    itens = models.BigIntegerField(default=0)
+    vendas = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumo de Vendas do Dia"
+        verbose_name_plural = "Resumos de Vendas por Dia"
+        constraints = [
+            # Também é o índice das leituras do dashboard (por status, e o dia de hoje)
+            models.UniqueConstraint(fields=['status', 'dia'], name='resumo_vendas_status_dia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y} {self.get_status_display()}: {self.vendas} vendas, R$ {self.receita}"
@@ -0,0 +1,37 @@
+"""
+Orçamento de consultas SQL das views e dos métodos da VendaFacade.
+
+Cada view registrada em vendas/urls.py e cada método público da facade
+declara com @orcamento_consultas quantas consultas pode fazer. Os testes
+(OrcamentoConsultasTests) executam todas as rotas com 10 e com 1000 linhas
+de dados e falham se alguma rota não declarar orçamento, se passar do
+orçamento ou se o número de consultas crescer com o volume de dados (N+1).
+
+Os INSERTs de um mesmo bulk_create que o backend divide em lotes contam
+como um só comando.
+"""
+from typing import Callable, Union
+
+Orcamento = Union[int, Callable[[dict], int]]
+
+
+def orcamento_consultas(maximo: Orcamento):
+    """
+    Declara o máximo de consultas de uma view (função ou classe) ou método.
+    'maximo' é um inteiro, quando o número de consultas não pode depender do
+    volume de dados, ou uma função que recebe o volume dos dados
+    ({'categorias': ..., 'produtos': ..., 'vendas': ...}) e devolve o máximo.
+    """
+    def decorator(alvo):
+        alvo.orcamento_consultas = maximo
+        return alvo
+    return decorator
+
+
+def orcamento_da_view(view) -> Orcamento:
+    """Orçamento de uma view do URLconf (função, ou a classe por trás de as_view())."""
+    return getattr(getattr(view, 'view_class', view), 'orcamento_consultas', None)
+
+
+def consultas_permitidas(orcamento: Orcamento, dados: dict) -> int:
+    return orcamento(dados) if callable(orcamento) else orcamento
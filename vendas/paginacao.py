@@ -0,0 +1,71 @@
+"""
+Paginação por cursor (keyset) das vendas, na ordem (-data, -id).
+
+Em vez de OFFSET, que faz o banco ler e descartar todas as linhas das
+páginas anteriores, cada página começa logo depois da última venda da
+página anterior: WHERE (data, id) < (cursor) ORDER BY data DESC, id DESC
+LIMIT n, respondido pelo índice (data, id) de Venda. O custo de uma página
+é o mesmo na primeira e na milésima.
+
+O cursor é a (data, id) de uma venda, codificada em base64 para a URL.
+"""
+import base64
+import binascii
+from datetime import datetime
+from django.db.models import Q
+from django.utils import timezone
+
+TAMANHO_PAGINA = 50
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(venda) -> str:
+    bruto = f"{venda.data.isoformat()}|{venda.pk}".encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        data, pk = bruto.split('|')
+        data, pk = datetime.fromisoformat(data), int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise CursorInvalido(f"Cursor inválido: {cursor!r}.")
+    if timezone.is_naive(data):
+        raise CursorInvalido(f"Cursor inválido: {cursor!r}.")
+    return data, pk
+
+
+def pagina_por_cursor(queryset, depois: str = None, antes: str = None, tamanho: int = TAMANHO_PAGINA) -> dict:
+    """
+    Uma página de 'queryset' na ordem (-data, -id).
+    'depois': vendas mais antigas que o cursor (próxima página);
+    'antes': vendas mais novas que o cursor (página anterior).
+    Devolve {'itens': [...], 'proximo': cursor ou None, 'anterior': cursor ou None}.
+    Lê tamanho + 1 linhas para saber se há mais uma página, sem COUNT.
+    """
+    if antes:
+        data, pk = decodificar_cursor(antes)
+        # 'data__gte' dá ao índice o início do intervalo; o OR desempata pelo id
+        linhas = list(
+            queryset.filter(data__gte=data)
+            .filter(Q(data__gt=data) | Q(data=data, pk__gt=pk))
+            .order_by('data', 'id')[:tamanho + 1]
+        )
+        tem_anterior, tem_proximo = len(linhas) > tamanho, True
+        itens = linhas[:tamanho][::-1]
+    else:
+        if depois:
+            data, pk = decodificar_cursor(depois)
+            queryset = queryset.filter(data__lte=data).filter(Q(data__lt=data) | Q(data=data, pk__lt=pk))
+        linhas = list(queryset.order_by('-data', '-id')[:tamanho + 1])
+        tem_anterior, tem_proximo = bool(depois), len(linhas) > tamanho
+        itens = linhas[:tamanho]
+    return {
+        'itens': itens,
+        'proximo': codificar_cursor(itens[-1]) if tem_proximo and itens else None,
+        'anterior': codificar_cursor(itens[0]) if tem_anterior and itens else None,
+    }
@@ -0,0 +1,93 @@
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .dashboard import invalidar_dashboard
+from .models import ItemVenda, ResumoVendasDia, Venda
+
+# Linhas por INSERT ... ON CONFLICT (5 parâmetros cada; o SQLite aceita 999 por comando)
+LINHAS_POR_COMANDO = 100
+
+
+def somar_venda(variacoes: dict, data, status: str, total, itens: int, sinal: int = 1):
+    """
+    Acumula em 'variacoes' ({(status, dia): (receita, itens, vendas)}) uma venda
+    (sinal +1) ou a saída dela (sinal -1) do resumo do seu dia e status.
+    """
+    chave = (status, timezone.localdate(data))
+    receita, quantidade, vendas = variacoes.get(chave, (Decimal('0.00'), 0, 0))
+    # O default do campo total é um float (0.00) até a venda ser recarregada
+    total = Decimal(str(total))
+    variacoes[chave] = (receita + sinal * total, quantidade + sinal * itens, vendas + sinal)
+
+
+def registrar_no_resumo(variacoes: dict):
+    """
+    Soma as variações ao resumo diário com INSERT ... ON CONFLICT DO UPDATE
+    (PostgreSQL e SQLite), dentro da transação que altera as vendas.
+    As linhas são gravadas em ordem de (status, dia), a mesma em todas as
+    transações, então duas vendas concorrentes não entram em deadlock.
+    Toda escrita de vendas da VendaFacade passa por aqui, então é aqui também
+    que o cache do dashboard é invalidado.
+    """
+    operacoes = connection.ops
+    linhas = [
+        (status, operacoes.adapt_datefield_value(dia), operacoes.adapt_decimalfield_value(receita, 14, 2), itens, vendas)
+        for (status, dia), (receita, itens, vendas) in sorted(variacoes.items())
+        if receita or itens or vendas
+    ]
+    if not linhas:
+        return
+    invalidar_dashboard()
+    tabela = connection.ops.quote_name(ResumoVendasDia._meta.db_table)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(linhas), LINHAS_POR_COMANDO):
+            lote = linhas[inicio:inicio + LINHAS_POR_COMANDO]
+            cursor.execute(
+                f"INSERT INTO {tabela} (status, dia, receita, itens, vendas) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(lote))} "
+                "ON CONFLICT (status, dia) DO UPDATE SET "
+                f"receita = {tabela}.receita + EXCLUDED.receita, "
+                f"itens = {tabela}.itens + EXCLUDED.itens, "
+                f"vendas = {tabela}.vendas + EXCLUDED.vendas",
+                [valor for linha in lote for valor in linha],
+            )
+
+
+def resumo_das_vendas():
+    """Resumo por (status, dia) calculado direto das vendas (usado na reconstrução)."""
+    itens_da_venda = (
+        ItemVenda.objects.filter(venda=OuterRef('pk'))
+        .values('venda')
+        .annotate(quantidade=Sum('quantidade'))
+        .values('quantidade')
+    )
+    return (
+        Venda.objects.annotate(
+            dia=TruncDate('data'),
+            quantidade_itens=Coalesce(Subquery(itens_da_venda, output_field=IntegerField()), 0),
+        )
+        .values('status', 'dia')
+        .annotate(receita=Sum('total'), itens=Sum('quantidade_itens'), vendas=Count('pk'))
+        .order_by('status', 'dia')
+    )
+
+
+def reconstruir_resumo() -> int:
+    """Apaga e recalcula o resumo inteiro a partir das vendas. Devolve o número de linhas."""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Vendas concorrentes esperam no upsert do resumo até o fim da reconstrução:
+            # as que a leitura abaixo não enxerga somam as suas variações depois dela.
+            # (No SQLite a escrita já trava o banco inteiro.)
+            tabela = connection.ops.quote_name(ResumoVendasDia._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {tabela} IN EXCLUSIVE MODE")
+        ResumoVendasDia.objects.all().delete()
+        linhas = ResumoVendasDia.objects.bulk_create(
+            (ResumoVendasDia(**linha) for linha in resumo_das_vendas().iterator()),
+            batch_size=1000,
+        )
+        invalidar_dashboard()
+    return len(linhas)
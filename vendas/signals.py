@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .catalogo import registrar_alteracao_catalogo
+from .dashboard import invalidar_dashboard
+from .estoque import registrar_ajuste
+from .models import Categoria, Produto
+
+
+# Qualquer escrita individual em Produto/Categoria (CRUD, admin, facade)
+# invalida as exportações em cache. Os caminhos em lote chamam
+# registrar_alteracao_catalogo() diretamente.
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def catalogo_alterado(sender, instance, **kwargs):
+    registrar_alteracao_catalogo([instance.pk] if sender is Produto else ())
+
+
+# O dashboard mostra o total de produtos: criar ou excluir um produto
+# (CRUD, admin) invalida o contexto em cache da home.
+@receiver(post_save, sender=Produto)
+def produto_salvo(sender, created, **kwargs):
+    if created:
+        invalidar_dashboard()
+
+
+@receiver(post_delete, sender=Produto)
+def produto_excluido(sender, **kwargs):
+    invalidar_dashboard()
+
+
+# Escritas individuais de estoque (CRUD, admin, shell) entram no extrato como
+# ajuste manual, para o extrato não se afastar de Produto.estoque. A facade e a
+# importação gravam em lote (sem signals) e registram os próprios movimentos.
+@receiver(pre_save, sender=Produto)
+def guardar_estoque_anterior(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._estoque_anterior = None
+    if raw or (update_fields is not None and 'estoque' not in update_fields):
+        return
+    if not isinstance(instance.estoque, int):
+        # F() e outras expressões: o valor final só existe no banco
+        return
+    if instance._state.adding:
+        instance._estoque_anterior = 0
+        return
+    produtos = Produto.objects.filter(pk=instance.pk)
+    if transaction.get_connection().in_atomic_block:
+        # Trava a linha: uma venda concorrente não muda o estoque entre a leitura e o save
+        produtos = produtos.select_for_update()
+    instance._estoque_anterior = produtos.values_list('estoque', flat=True).first() or 0
+
+
+@receiver(post_save, sender=Produto)
+def registrar_ajuste_de_estoque(sender, instance, **kwargs):
+    if getattr(instance, '_estoque_anterior', None) is not None:
+        registrar_ajuste(instance.pk, instance.estoque - instance._estoque_anterior)
@@ -1,3 +1,1310 @@
-from django.test import TestCase
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import re
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import busca, dashboard, urls
+from .busca import buscar_produtos
+from .catalogo import CacheExportacoes, fatia_da_versao, registrar_alteracao_catalogo, versao_catalogo
+from .db import copy_disponivel
+from .estoque import compactar_extrato, divergencias_do_extrato, produtos_com_saldo_do_extrato, registrar_ajuste
+from .exportacao_zip import ExportacaoZip, VagaExportacao
+from .exporters import CAMPOS_EXPORTACAO, ExporterFactory
+from .facades import EstoqueInsuficiente, VendaFacade
+from .fila_vendas import PARTICOES, enfileirar_venda, particao_da_venda, processar_pedidos
+from .forms import ItemVendaFormSet, VendaForm
+from .importers import LEITORES, CopyProdutoImporter, ProdutoImporter, iter_json_array, iter_produtos_xml
+from .metricas import registro
+from .models import (
+    Categoria, ChaveIdempotencia, ImportJob, ItemVenda, MovimentoEstoque, PedidoVenda, Produto, ResumoVendasDia,
+    SaldoEstoque, Venda, VersaoCatalogo,
+)
+from .orcamentos import consultas_permitidas, orcamento_da_view
+from .resumo import reconstruir_resumo
 
-# Create your tests here.
+
+def dados_venda(*itens, status=Venda.StatusVenda.PENDENTE):
+    """Dados de POST do formulário de venda com os itens [(produto, quantidade), ...]."""
+    dados = {
+        'cliente': 'Cliente Teste',
+        'status': status,
+        'itens-TOTAL_FORMS': str(len(itens)),
+        'itens-INITIAL_FORMS': '0',
+        'itens-MIN_NUM_FORMS': '1',
+        'itens-MAX_NUM_FORMS': '1000',
+    }
+    for i, (produto, quantidade) in enumerate(itens):
+        dados[f'itens-{i}-produto'] = str(produto.pk)
+        dados[f'itens-{i}-quantidade'] = str(quantidade)
+    return dados
+
+
+def formularios_venda(*itens):
+    dados = dados_venda(*itens)
+    form = VendaForm(dados)
+    formset = ItemVendaFormSet(dados, prefix='itens')
+    assert form.is_valid() and formset.is_valid(), (form.errors, formset.errors)
+    return form, formset
+
+
+def criar_venda(*itens):
+    return VendaFacade().criar_venda(*formularios_venda(*itens), {})
+
+
+class ExportacaoProdutosTests(TestCase):
+    def setUp(self):
+        # Cada teste começa com o cache de exportações vazio (as versões se repetem entre testes)
+        patcher = patch('vendas.views.cache_exportacoes', CacheExportacoes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        eletronicos = Categoria.objects.create(nome='Eletrônicos')
+        self.produtos = [
+            Produto.objects.create(nome='Teclado', descricao='ABNT2 & <USB>', preco=Decimal('100.00'), estoque=3, categoria=eletronicos),
+            Produto.objects.create(nome='Caderno', descricao='', preco=Decimal('12.50'), estoque=0),
+            Produto.objects.create(nome='Mouse', descricao=None, preco=Decimal('50.00'), estoque=7, categoria=eletronicos),
+        ]
+
+    def exportar(self, **parametros):
+        url = reverse('produto_export')
+        if parametros:
+            url += '?' + '&'.join(f'{chave}={valor}' for chave, valor in parametros.items())
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta
+
+    def test_json_em_streaming_igual_ao_json_dumps(self):
+        resposta = self.exportar(format='json')
+        self.assertTrue(resposta.streaming)
+        esperado = list(
+            Produto.objects.order_by('nome').values('id', 'nome', 'descricao', 'categoria__nome', 'preco', 'estoque')
+        )
+        corpo = b''.join(resposta.streaming_content).decode()
+        self.assertEqual(corpo, json.dumps(esperado, indent=4, ensure_ascii=False, default=str))
+        self.assertIn('attachment; filename="produtos.json"', resposta['Content-Disposition'])
+
+    def test_leitura_em_blocos_do_cursor(self):
+        queryset = Produto.objects.order_by('nome')
+        # Blocos menores que o catálogo: o resultado não muda
+        exporter_class = ExporterFactory.exporters['txt']
+        pequeno = exporter_class(queryset, chunk_size=1).export().content
+        self.assertEqual(pequeno, exporter_class(queryset).export().content)
+        self.assertIn('Total de Itens:   3', pequeno.decode())
+
+    def test_xml_igual_ao_dicttoxml_com_minidom(self):
+        from xml.dom.minidom import parseString
+        from dicttoxml import dicttoxml
+
+        lista = list(Produto.objects.order_by('nome').values(*CAMPOS_EXPORTACAO))
+        esperado = parseString(
+            dicttoxml(lista, custom_root='produtos', item_func=lambda _: 'produto')
+        ).toprettyxml(indent='  ')
+        corpo = b''.join(self.exportar(format='xml').streaming_content).decode()
+        self.assertEqual(corpo, esperado)
+
+        Produto.objects.all().delete()
+        vazio = b''.join(self.exportar(format='xml').streaming_content).decode()
+        self.assertEqual(vazio, parseString(dicttoxml([], custom_root='produtos')).toprettyxml(indent='  '))
+
+    def test_xml_exportado_volta_na_importacao(self):
+        campos = ('nome', 'descricao', 'categoria__nome', 'preco', 'estoque')
+        antes = list(Produto.objects.order_by('nome').values(*campos))
+        corpo = b''.join(self.exportar(format='xml').streaming_content)
+        Produto.objects.all().delete()
+
+        resultado = ProdutoImporter().importar(iter_produtos_xml(io.BytesIO(corpo)))
+        self.assertEqual((resultado.criados, resultado.total_erros), (3, 0))
+        self.assertEqual(list(Produto.objects.order_by('nome').values(*campos)), antes)
+
+    def test_csv_e_ndjson(self):
+        linhas = list(csv.reader(io.StringIO(b''.join(self.exportar(format='csv').streaming_content).decode())))
+        self.assertEqual(linhas[0], ['id', 'nome', 'descricao', 'categoria', 'preco', 'estoque'])
+        self.assertEqual(
+            linhas[1:],
+            [[str(p.pk), p.nome, p.descricao or '', p.categoria.nome if p.categoria else '', str(p.preco), str(p.estoque)]
+             for p in Produto.objects.select_related('categoria').order_by('nome')],
+        )
+
+        resposta = self.exportar(format='ndjson')
+        self.assertEqual(resposta['Content-Type'], 'application/x-ndjson')
+        objetos = [json.loads(linha) for linha in b''.join(resposta.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            objetos,
+            [dict(item, preco=str(item['preco']))
+             for item in Produto.objects.order_by('nome').values(*CAMPOS_EXPORTACAO)],
+        )
+
+    def ida_e_volta(self, formato: str):
+        def produtos():
+            # Descrição nula pode voltar como texto vazio (o CSV não distingue os dois)
+            campos = ('nome', 'descricao', 'categoria__nome', 'preco', 'estoque')
+            return [dict(item, descricao=item['descricao'] or '') for item in Produto.objects.order_by('nome').values(*campos)]
+
+        antes = produtos()
+        corpo = b''.join(self.exportar(format=formato).streaming_content)
+        Produto.objects.all().delete()
+        # Mesmo caminho do worker: COPY no PostgreSQL com psycopg2, ORM nos demais
+        if copy_disponivel():
+            resultado = CopyProdutoImporter().importar_arquivo(io.BytesIO(corpo), formato)
+        else:
+            resultado = ProdutoImporter().importar(LEITORES[formato](io.BytesIO(corpo)))
+        self.assertEqual((resultado.criados, resultado.total_erros), (3, 0))
+        self.assertEqual(produtos(), antes)
+
+    def test_csv_exportado_volta_na_importacao(self):
+        self.ida_e_volta('csv')
+
+    def test_ndjson_exportado_volta_na_importacao(self):
+        self.ida_e_volta('ndjson')
+
+    def test_etag_e_304_ate_o_catalogo_mudar(self):
+        resposta = self.exportar(format='json')
+        etag = resposta['ETag']
+        corpo = b''.join(resposta.streaming_content)
+        self.assertIn('no-cache', resposta['Cache-Control'])
+
+        resposta = self.client.get(reverse('produto_export') + '?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        # Outro formato é outra representação
+        self.assertNotEqual(self.exportar(format='csv')['ETag'], etag)
+
+        # Qualquer alteração de produto muda a versão do catálogo
+        self.produtos[0].estoque = 2
+        self.produtos[0].save()
+        resposta = self.client.get(reverse('produto_export') + '?format=json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        self.assertNotEqual(b''.join(resposta.streaming_content), corpo)
+
+    def test_corpo_repetido_vem_do_cache(self):
+        primeiro = b''.join(self.exportar(format='xml').streaming_content)
+        # Só a leitura da versão do catálogo
+        with self.assertNumQueries(1):
+            resposta = self.exportar(format='xml')
+        self.assertEqual(resposta.content, primeiro)
+
+    def test_cache_lru_por_tamanho(self):
+        cache_lru = CacheExportacoes(max_bytes=10, max_bytes_por_item=6)
+        cache_lru.set('a', b'aaaa')
+        cache_lru.set('b', b'bbbb')
+        cache_lru.get('a')
+        # Passa de 10 bytes: sai o usado há mais tempo ('b')
+        cache_lru.set('c', b'cccc')
+        self.assertEqual((cache_lru.get('a'), cache_lru.get('b'), cache_lru.get('c')), (b'aaaa', None, b'cccc'))
+        # Maior que um item: nem entra
+        cache_lru.set('d', b'ddddddd')
+        self.assertIsNone(cache_lru.get('d'))
+
+        self.assertEqual(b''.join(cache_lru.armazenar_ao_final('e', iter([b'ee', b'e']))), b'eee')
+        self.assertEqual(cache_lru.get('e'), b'eee')
+        self.assertEqual(b''.join(cache_lru.armazenar_ao_final('f', iter([b'fff', b'ffff']))), b'fffffff')
+        self.assertIsNone(cache_lru.get('f'))
+        # Resposta interrompida no meio não é guardada
+        parcial = cache_lru.armazenar_ao_final('g', iter([b'g', b'g']))
+        next(parcial)
+        parcial.close()
+        self.assertIsNone(cache_lru.get('g'))
+
+    def test_gzip_negociado_pelo_accept_encoding(self):
+        normal = self.exportar(format='json').getvalue()
+        url = reverse('produto_export') + '?format=json'
+
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resposta['Vary'])
+        self.assertEqual(resposta['Content-Type'], 'application/json')
+        self.assertEqual(gzip.decompress(resposta.getvalue()), normal)
+
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(resposta.has_header('Content-Encoding'))
+        self.assertEqual(resposta.getvalue(), normal)
+
+    def test_compressao_pedida_vira_download(self):
+        normal = self.exportar(format='csv').getvalue()
+        for compressao, descomprimir, content_type in (
+            ('gzip', gzip.decompress, 'application/gzip'),
+            ('bz2', bz2.decompress, 'application/x-bzip2'),
+            ('xz', lzma.decompress, 'application/x-xz'),
+        ):
+            with self.subTest(compressao=compressao):
+                resposta = self.exportar(format='csv', compress=compressao)
+                self.assertFalse(resposta.has_header('Content-Encoding'))
+                self.assertEqual(resposta['Content-Type'], content_type)
+                self.assertIn(f'produtos.csv.{compressao if compressao != "gzip" else "gz"}"', resposta['Content-Disposition'])
+                self.assertEqual(descomprimir(resposta.getvalue()), normal)
+        self.assertEqual(self.client.get(reverse('produto_export') + '?compress=zip').status_code, 404)
+
+    def test_modo_compacto(self):
+        dados = list(Produto.objects.order_by('nome').values(*CAMPOS_EXPORTACAO))
+        compacto = self.exportar(format='json', compact=1).getvalue().decode()
+        self.assertEqual(compacto, json.dumps(dados, ensure_ascii=False, default=str, separators=(',', ':')))
+
+        xml = self.exportar(format='xml', compact=1).getvalue().decode()
+        indentado = self.exportar(format='xml').getvalue().decode()
+        self.assertNotIn('\n  <', xml)
+        self.assertEqual(ET.tostring(ET.fromstring(xml)), ET.tostring(ET.fromstring(
+            re.sub(r'>\s+<', '><', indentado.split('\n', 1)[1])
+        )))
+
+
+class ImportacaoProdutosTests(TestCase):
+    def test_contagens_da_importacao_em_lotes(self):
+        Categoria.objects.create(nome='Periféricos')
+        Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=5)
+        Produto.objects.create(nome='Mouse', descricao='', preco=Decimal('50.00'), estoque=2)
+        lotes = []
+        importer = ProdutoImporter(batch_size=2, ao_gravar_lote=lambda resultado: lotes.append(resultado.processados))
+
+        resultado = importer.importar([
+            {'nome': 'Teclado', 'preco': '120.00', 'estoque': 5, 'categoria': 'periféricos'},
+            {'nome': 'Mouse', 'preco': '50', 'estoque': 2, 'descricao': ''},
+            {'nome': 'Monitor', 'preco': '800', 'estoque': 1, 'categoria': 'Vídeo'},
+            {'nome': '', 'preco': '1'},
+            {'nome': 'Cabo', 'preco': 'abc'},
+            {'nome': 'Cabo', 'preco': '9.90', 'estoque': 'x'},
+            # O mesmo nome repetido: a última ocorrência vence
+            {'nome': 'Monitor', 'preco': '750', 'estoque': 3, 'categoria': 'Vídeo'},
+        ])
+
+        self.assertEqual(
+            (resultado.processados, resultado.criados, resultado.atualizados, resultado.inalterados, resultado.total_erros),
+            (4, 1, 1, 1, 3),
+        )
+        self.assertEqual(len(resultado.erros), 3)
+        self.assertEqual(lotes, [2, 4])
+        teclado = Produto.objects.select_related('categoria').get(nome='Teclado')
+        self.assertEqual((teclado.preco, teclado.categoria.nome), (Decimal('120.00'), 'Periféricos'))
+        monitor = Produto.objects.get(nome='Monitor')
+        self.assertEqual((monitor.preco, monitor.estoque), (Decimal('750.00'), 3))
+        self.assertEqual(Categoria.objects.filter(nome__iexact='vídeo').count(), 1)
+        # Estoque novo (e diferenças de estoque) vão para o extrato
+        self.assertEqual(divergencias_do_extrato().filter(nome='Monitor').count(), 0)
+
+    def test_linhas_iguais_ao_banco_nao_geram_escrita(self):
+        linhas = [
+            {'nome': 'Teclado', 'preco': '100.00', 'estoque': 5, 'descricao': 'ABNT2', 'categoria': 'Periféricos'},
+            {'nome': 'Mouse', 'preco': '50.00', 'estoque': 2},
+        ]
+        ProdutoImporter().importar(linhas)
+
+        with CaptureQueriesContext(connection) as capturadas:
+            resultado = ProdutoImporter().importar(linhas)
+        self.assertEqual((resultado.criados, resultado.atualizados, resultado.inalterados), (0, 0, 2))
+        escritas = [q['sql'] for q in capturadas if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(escritas, [])
+
+        # Qualquer campo diferente (inclusive a categoria) faz a linha ser gravada
+        alteradas = [
+            dict(linhas[0], categoria='Teclados'),
+            dict(linhas[1], descricao='Sem fio'),
+        ]
+        resultado = ProdutoImporter().importar(alteradas + [dict(linhas[1], nome='Monitor')])
+        self.assertEqual((resultado.criados, resultado.atualizados, resultado.inalterados), (1, 2, 0))
+        self.assertEqual(Produto.objects.get(nome='Teclado').categoria.nome, 'Teclados')
+
+    def test_linhas_iguais_ao_banco_no_copy(self):
+        if not copy_disponivel():
+            self.skipTest("COPY só no PostgreSQL com psycopg2.")
+        conteudo = 'nome,preco,estoque,categoria\nTeclado,100.00,5,Periféricos\nMouse,50,2,\n'.encode()
+        CopyProdutoImporter().importar_arquivo(io.BytesIO(conteudo), 'csv')
+        movimentos = MovimentoEstoque.objects.count()
+        # As tabelas temporárias (ON COMMIT DROP) ficariam até o fim da transação do teste
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE tmp_importacao_produtos, tmp_importacao_anteriores")
+
+        resultado = CopyProdutoImporter().importar_arquivo(io.BytesIO(conteudo), 'csv')
+        self.assertEqual((resultado.criados, resultado.atualizados, resultado.inalterados), (0, 0, 2))
+        self.assertEqual(MovimentoEstoque.objects.count(), movimentos)
+
+    def test_valores_fora_das_colunas_contam_como_erro_da_linha(self):
+        resultado = ProdutoImporter().importar([
+            {'nome': 'Teclado', 'preco': '99999999.99', 'estoque': 2147483647},
+            {'nome': 'Caro', 'preco': '100000000'},
+            {'nome': 'Infinito', 'preco': 'Infinity'},
+            {'nome': 'Sem fim', 'preco': '1', 'estoque': float('inf')},
+            {'nome': 'Muito', 'preco': '1', 'estoque': 2147483648},
+        ])
+        self.assertEqual((resultado.criados, resultado.total_erros), (1, 4))
+        self.assertEqual(list(Produto.objects.values_list('nome', flat=True)), ['Teclado'])
+
+    def test_descricao_que_nao_e_texto_conta_como_erro_da_linha(self):
+        linhas = [
+            {'nome': 'Teclado', 'descricao': 'ABNT2'},
+            {'nome': 'Mouse', 'descricao': None},
+            {'nome': 'Monitor', 'descricao': 24},
+            {'nome': 'Cabo', 'descricao': ['USB', 'HDMI']},
+        ]
+        resultado = ProdutoImporter().importar(linhas)
+        self.assertEqual((resultado.criados, resultado.total_erros), (2, 2))
+        self.assertIn("descrição inválida para 'Monitor'", resultado.erros[0])
+
+        if copy_disponivel():
+            Produto.objects.all().delete()
+            conteudo = ''.join(json.dumps(linha) + '\n' for linha in linhas).encode()
+            resultado = CopyProdutoImporter().importar_arquivo(io.BytesIO(conteudo), 'ndjson')
+            self.assertEqual((resultado.criados, resultado.total_erros), (2, 2))
+        self.assertEqual(list(Produto.objects.order_by('nome').values_list('nome', flat=True)), ['Mouse', 'Teclado'])
+
+    def test_copy_aceita_e_recusa_as_mesmas_linhas_que_o_orm(self):
+        if not copy_disponivel():
+            self.skipTest("COPY só no PostgreSQL com psycopg2.")
+        linhas = [
+            ('Teclado', '99999999.99', '2147483647'),
+            ('Arredondado', ' 99999999.994', '+5'),
+            ('Meio centavo', '0.125', ''),
+            ('Zeros', '000000001.5', '0000000005'),
+            ('Estoura', '99999999.995', '1'),
+            ('Caro', '100000000', ''),
+            ('Negativo', '-1', ''),
+            ('Muito', '1', '2147483648'),
+            ('Devolvido', '1', '-1'),
+            ('Decimal', '1', '1.5'),
+        ]
+        ProdutoImporter().importar({'nome': nome, 'preco': preco, 'estoque': estoque} for nome, preco, estoque in linhas)
+        pelo_orm = list(Produto.objects.order_by('nome').values_list('nome', 'preco', 'estoque'))
+        self.assertEqual(len(pelo_orm), 4)
+        Produto.objects.all().delete()
+
+        conteudo = 'nome,preco,estoque\n' + ''.join(f'{nome},{preco},{estoque}\n' for nome, preco, estoque in linhas)
+        resultado = CopyProdutoImporter().importar_arquivo(io.BytesIO(conteudo.encode()), 'csv')
+        self.assertEqual((resultado.criados, resultado.total_erros), (4, 6))
+        self.assertEqual(list(Produto.objects.order_by('nome').values_list('nome', 'preco', 'estoque')), pelo_orm)
+
+
+@patch.object(ExportacaoZip, '_em_paralelo', return_value=False)
+class ExportacaoZipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=1)
+
+    @override_settings(EXPORTACAO_ZIP_SIMULTANEAS=1)
+    def test_uma_exportacao_por_vez(self, _):
+        vaga = VagaExportacao.reservar()
+        resposta = self.client.get(reverse('produto_export_zip'))
+        self.assertEqual(resposta.status_code, 503)
+        self.assertIn('Retry-After', resposta)
+
+        vaga.liberar()
+        resposta = self.client.get(reverse('produto_export_zip'))
+        self.assertEqual(resposta.status_code, 200)
+        # Ocupada enquanto o ZIP é enviado; livre de novo quando a resposta termina
+        # (o cliente de teste chama close() ao fim do conteúdo)
+        self.assertIsNone(VagaExportacao.reservar())
+        b''.join(resposta.streaming_content)
+        self.assertIsNotNone(VagaExportacao.reservar())
+
+    def test_uma_parte_por_categoria_com_manifest(self, _):
+        for nome in ('Áudio', 'Vídeo'):
+            categoria = Categoria.objects.create(nome=nome)
+            for numero in range(3):
+                Produto.objects.create(nome=f'{nome} {numero}', preco=Decimal('10.00'), estoque=numero, categoria=categoria)
+
+        resposta = self.client.get(reverse('produto_export_zip') + '?format=ndjson')
+        self.assertEqual(resposta['Content-Type'], 'application/zip')
+        arquivo = zipfile.ZipFile(io.BytesIO(resposta.getvalue()))
+        manifesto = json.loads(arquivo.read('manifest.json'))
+        self.assertEqual((manifesto['formato'], manifesto['modo'], manifesto['total_linhas']), ('ndjson', 'categoria', 7))
+
+        nomes = {}
+        for parte in manifesto['partes']:
+            conteudo = arquivo.read(parte['arquivo'])
+            self.assertEqual(hashlib.sha256(conteudo).hexdigest(), parte['sha256'])
+            linhas = gzip.decompress(conteudo).decode().splitlines()
+            self.assertEqual(len(linhas), parte['linhas'])
+            nomes[parte['arquivo']] = sorted(json.loads(linha)['nome'] for linha in linhas)
+        categorias = {categoria.nome: categoria.pk for categoria in Categoria.objects.all()}
+        self.assertEqual(nomes, {
+            f"produtos-categoria-{categorias['Áudio']}.ndjson.gz": ['Áudio 0', 'Áudio 1', 'Áudio 2'],
+            f"produtos-categoria-{categorias['Vídeo']}.ndjson.gz": ['Vídeo 0', 'Vídeo 1', 'Vídeo 2'],
+            'produtos-sem-categoria.ndjson.gz': ['Teclado'],
+        })
+
+    def test_partes_por_faixa_de_ids(self, _):
+        for numero in range(4):
+            Produto.objects.create(nome=f'Cabo {numero}', preco=Decimal('5.00'))
+        exportacao = ExportacaoZip('csv', Produto.objects.order_by('pk'), modo='faixa', tamanho_faixa=2, compressao=None)
+        self.assertEqual(len(exportacao.shards), 3)
+        arquivo = zipfile.ZipFile(io.BytesIO(b''.join(exportacao.iter_bytes())))
+        manifesto = json.loads(arquivo.read('manifest.json'))
+        self.assertEqual([parte['linhas'] for parte in manifesto['partes']], [2, 2, 1])
+        ids = [
+            int(linha[0])
+            for parte in manifesto['partes']
+            for linha in list(csv.reader(io.StringIO(arquivo.read(parte['arquivo']).decode())))[1:]
+        ]
+        self.assertEqual(sorted(ids), list(Produto.objects.order_by('pk').values_list('pk', flat=True)))
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def enviar(self, nome: str, conteudo: bytes):
+        return self.client.post(
+            reverse('produto_import'),
+            {'arquivo_importacao': SimpleUploadedFile(nome, conteudo)},
+            HTTP_ACCEPT='application/json',
+        )
+
+    def processar_fila(self) -> str:
+        saida = io.StringIO()
+        # close_old_connections fecharia a conexão da transação do teste (fora do autocommit)
+        with patch('vendas.management.commands.processar_importacoes.close_old_connections'):
+            call_command('processar_importacoes', '--uma-vez', stdout=saida)
+        return saida.getvalue()
+
+    def test_importacao_enfileirada_e_processada_pelo_worker(self):
+        produtos = [{'nome': 'Teclado', 'preco': '100.00', 'estoque': 3}, {'nome': 'Mouse'}, {'preco': '1'}]
+        resposta = self.enviar('produtos.json', json.dumps(produtos).encode())
+        self.assertEqual(resposta.status_code, 202)
+        status_url = resposta.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], ImportJob.Status.PENDENTE)
+        self.assertFalse(Produto.objects.exists())
+
+        self.assertIn('2 linhas, 1 erros', self.processar_fila())
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], ImportJob.Status.CONCLUIDA)
+        self.assertEqual((status['processados'], status['criados'], status['total_erros']), (2, 2, 1))
+        self.assertIsNotNone(status['finalizado_em'])
+        # O arquivo enviado é apagado depois do processamento
+        job = ImportJob.objects.get()
+        self.assertFalse(job.arquivo and job.arquivo.storage.exists(job.arquivo.name))
+        # Nada mais na fila
+        self.assertNotIn('Processando', self.processar_fila())
+
+    def test_arquivo_invalido_marca_a_importacao_como_falha(self):
+        self.enviar('produtos.json', b'{"nome": "x"}')
+        self.processar_fila()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.Status.FALHOU)
+        self.assertIn('lista', job.mensagem)
+
+    def test_formato_nao_aceito(self):
+        resposta = self.enviar('produtos.pdf', b'%PDF')
+        self.assertEqual(resposta.status_code, 302)
+        self.assertFalse(ImportJob.objects.exists())
+
+
+class LeitoresIncrementaisTests(TestCase):
+    def test_array_json_lido_em_blocos_pequenos(self):
+        itens = [{'nome': 'Caneta ✓', 'preco': 1.5, 'tags': [1, {'a': '[,]'}]}, 12.75, 'texto, com ] e \\"', None, []]
+        bruto = ('\ufeff \n' + json.dumps(itens, ensure_ascii=False, indent=2)).encode('utf-8')
+        # Blocos de 3 bytes cortam números, strings e caracteres UTF-8 no meio
+        for tamanho in (1, 3, 7, 64 * 1024):
+            with self.subTest(tamanho=tamanho):
+                self.assertEqual(list(iter_json_array(io.BytesIO(bruto), tamanho_leitura=tamanho)), itens)
+        self.assertEqual(list(iter_json_array(io.BytesIO(b' [ ] '))), [])
+
+    def test_array_json_invalido(self):
+        for bruto in (b'{"nome": "x"}', b'[{"a": 1} {"b": 2}]', b'[{"a": 1},', b'[{"a": '):
+            with self.subTest(bruto=bruto), self.assertRaises(ValueError):
+                list(iter_json_array(io.BytesIO(bruto), tamanho_leitura=4))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(b'["' + b'x' * 100 + b'"]'), tamanho_leitura=8, tamanho_maximo_item=32))
+
+    def test_xml_um_produto_por_vez(self):
+        bruto = (
+            '<?xml version="1.0" ?>\n<produtos>'
+            '<produto type="dict"><nome type="str">Teclado</nome><descricao type="str"/>'
+            '<categoria__nome type="str">Periféricos</categoria__nome><preco type="number">100.00</preco>'
+            '<estoque type="int">3</estoque></produto>'
+            '<produto><nome>Mouse</nome><descricao type="null"/><categoria>Acessórios</categoria>'
+            '<preco>50</preco><extra><produto><nome>Interno</nome></produto></extra></produto>'
+            '</produtos>'
+        ).encode('utf-8')
+        self.assertEqual(list(iter_produtos_xml(io.BytesIO(bruto))), [
+            {'nome': 'Teclado', 'preco': '100.00', 'estoque': '3', 'descricao': '', 'categoria': 'Periféricos'},
+            {'nome': 'Mouse', 'preco': '50', 'estoque': None, 'descricao': None, 'categoria': 'Acessórios'},
+        ])
+
+
+class BaixaEstoqueTests(TestCase):
+    def setUp(self):
+        self.teclado = Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=10)
+        self.mouse = Produto.objects.create(nome='Mouse', preco=Decimal('50.00'), estoque=5)
+
+    def test_baixa_todos_os_itens(self):
+        venda = criar_venda((self.teclado, 3), (self.mouse, 5))
+        self.teclado.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.teclado.estoque, self.mouse.estoque), (7, 0))
+        self.assertEqual(venda.total, Decimal('550.00'))
+
+    def test_estoque_alterado_depois_do_formulario(self):
+        form, formset = formularios_venda((self.teclado, 2), (self.mouse, 4))
+        # Outra venda consome o estoque entre a validação e a gravação
+        Produto.objects.filter(pk=self.mouse.pk).update(estoque=1)
+
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            VendaFacade().criar_venda(form, formset, {})
+        self.assertEqual(len(erro.exception.produtos), 1)
+        self.assertIn('Mouse', str(erro.exception))
+        # Nada foi baixado: nem o item que tinha estoque
+        self.teclado.refresh_from_db()
+        self.assertEqual(self.teclado.estoque, 10)
+        self.assertFalse(Venda.objects.exists())
+
+    def test_venda_muda_a_versao_do_catalogo_na_propria_transacao(self):
+        produto = Produto.objects.create(nome='Caneta', preco=Decimal('2.00'), estoque=10)
+        fatia = VersaoCatalogo.objects.get(pk=fatia_da_versao([produto.pk]))
+        antes = versao_catalogo().versao
+        # Sem captureOnCommitCallbacks: a versão muda antes do commit, junto com o estoque
+        criar_venda((produto, 1))
+        self.assertEqual(versao_catalogo().versao, antes + 1)
+        # Só a linha da fatia do produto
+        self.assertEqual(VersaoCatalogo.objects.get(pk=fatia.pk).versao, fatia.versao + 1)
+
+
+class TransicaoStatusTests(TestCase):
+    def setUp(self):
+        self.produtos = [
+            Produto.objects.create(nome=f'Produto {i}', preco=Decimal('1.00'), estoque=10)
+            for i in range(20)
+        ]
+        self.venda = criar_venda(*[(produto, 2) for produto in self.produtos])
+
+    def estoques(self):
+        return list(Produto.objects.order_by('pk').values_list('estoque', flat=True))
+
+    def consultas(self, funcao, *args):
+        # SAVEPOINT/RELEASE do @transaction.atomic não contam
+        with CaptureQueriesContext(connection) as contexto:
+            funcao(*args)
+        return [q['sql'] for q in contexto.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_cancelar_e_reativar_em_consultas_fixas(self):
+        facade = VendaFacade()
+        # Leitura dos itens + lock + UPDATE + INSERT no extrato + versão do catálogo,
+        # qualquer que seja o número de itens
+        self.assertEqual(len(self.consultas(facade._devolver_estoque, self.venda)), 5)
+        self.assertEqual(self.estoques(), [10] * 20)
+        self.assertEqual(len(self.consultas(facade._retirar_estoque, self.venda)), 5)
+        self.assertEqual(self.estoques(), [8] * 20)
+
+    def test_reativar_informa_todos_os_produtos_sem_estoque(self):
+        VendaFacade().atualizar_status_venda(self.venda, Venda.StatusVenda.PENDENTE, Venda.StatusVenda.CANCELADA)
+        Produto.objects.filter(pk__in=[self.produtos[3].pk, self.produtos[7].pk]).update(estoque=1)
+
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            VendaFacade().atualizar_status_venda(self.venda, Venda.StatusVenda.CANCELADA, Venda.StatusVenda.PAGA)
+        self.assertEqual(len(erro.exception.produtos), 2)
+        self.assertIn('Produto 3', str(erro.exception))
+        self.assertIn('Produto 7', str(erro.exception))
+        # Nenhum produto foi baixado
+        self.assertEqual(self.estoques().count(10), 18)
+
+
+class StatusEmLoteTests(TestCase):
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Fone', preco=Decimal('30.00'), estoque=10)
+        self.vendas = [criar_venda((self.produto, 3)) for _ in range(3)]
+
+    def enviar(self, ids, status):
+        resposta = self.client.post(
+            reverse('venda_status_lote'), json.dumps({'ids': ids, 'status': status}), content_type='application/json'
+        )
+        self.assertEqual(resposta.status_code, 200)
+        return [resultado['status'] for resultado in resposta.json()['resultados']]
+
+    def estoque(self):
+        self.produto.refresh_from_db()
+        return self.produto.estoque
+
+    def test_cancelar_e_reativar_em_lote(self):
+        ids = [venda.pk for venda in self.vendas]
+        self.assertEqual(self.estoque(), 1)
+        self.assertEqual(self.enviar(ids + [ids[0], 999], 'CANCELADA'), ['atualizada'] * 3 + ['inalterada', 'nao_encontrada'])
+        self.assertEqual(self.estoque(), 10)
+        self.assertEqual(Venda.objects.filter(status='CANCELADA').count(), 3)
+
+        # Só há estoque para re-ativar duas das três vendas
+        Produto.objects.filter(pk=self.produto.pk).update(estoque=7)
+        self.assertEqual(self.enviar(ids, 'PAGA'), ['atualizada', 'atualizada', 'rejeitada'])
+        self.assertEqual(self.estoque(), 1)
+        self.assertEqual(
+            list(Venda.objects.order_by('pk').values_list('status', flat=True)),
+            ['PAGA', 'PAGA', 'CANCELADA'],
+        )
+
+    def test_transicao_sem_efeito_no_estoque(self):
+        self.assertEqual(self.enviar([self.vendas[0].pk], 'PAGA'), ['atualizada'])
+        self.assertEqual(self.estoque(), 1)
+
+
+class ListaVendasTests(TestCase):
+    def setUp(self):
+        produto = Produto.objects.create(nome='Cabo', preco=Decimal('5.00'), estoque=100)
+        self.vendas = [criar_venda((produto, 1)) for _ in range(7)]
+        # Empates na data: o id desempata
+        agora = timezone.now()
+        Venda.objects.filter(pk__in=[venda.pk for venda in self.vendas[2:5]]).update(data=agora)
+        Venda.objects.filter(pk=self.vendas[0].pk).update(status=Venda.StatusVenda.PAGA, data=agora - timedelta(days=3))
+        self.ordem = list(Venda.objects.order_by('-data', '-id').values_list('pk', flat=True))
+
+    def listar(self, url=None, **parametros):
+        # As URLs de 'proximo'/'anterior' já trazem os parâmetros (filtros, formato e cursor)
+        resposta = self.client.get(url) if url else self.client.get(reverse('venda_list'), {'format': 'json', **parametros})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    @patch('vendas.views.VendaListView.tamanho_pagina', 3)
+    def test_percorre_todas_as_paginas(self):
+        vistos, paginas, url = [], [], None
+        while True:
+            with self.assertNumQueries(3):
+                pagina = self.listar(url)
+            paginas.append(pagina)
+            vistos += [venda['id'] for venda in pagina['vendas']]
+            url = pagina['proximo']
+            if not url:
+                break
+        self.assertEqual(vistos, self.ordem)
+        self.assertEqual([len(pagina['vendas']) for pagina in paginas], [3, 3, 1])
+        # Voltando da última página chega-se à do meio
+        anterior = self.listar(paginas[2]['anterior'])
+        self.assertEqual(anterior['vendas'], paginas[1]['vendas'])
+
+    def test_filtros(self):
+        self.assertEqual([venda['id'] for venda in self.listar(status='PAGA')['vendas']], [self.vendas[0].pk])
+        hoje = timezone.localdate()
+        recentes = self.listar(de=hoje.isoformat(), ate=hoje.isoformat())['vendas']
+        self.assertEqual(len(recentes), 6)
+        antigas = self.listar(ate=(hoje - timedelta(days=1)).isoformat())['vendas']
+        self.assertEqual([venda['id'] for venda in antigas], [self.vendas[0].pk])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(reverse('venda_list'), {'depois': 'x'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('venda_list'), {'depois': 'x', 'format': 'json'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('venda_list')).status_code, 200)
+
+
+class BuscaProdutosTests(TestCase):
+    def setUp(self):
+        Produto.objects.bulk_create([
+            Produto(nome='Teclado Mecânico', descricao='Switches azuis', preco=Decimal('300.00')),
+            Produto(nome='Mouse Sem Fio', descricao='Acompanha teclado compacto', preco=Decimal('80.00')),
+            Produto(nome='Monitor 24', descricao=None, preco=Decimal('900.00')),
+        ])
+
+    def nomes(self, texto, **filtros):
+        return [produto.nome for produto in buscar_produtos(texto, Produto.objects.filter(**filtros))]
+
+    def test_nome_antes_da_descricao(self):
+        self.assertEqual(self.nomes('tecla'), ['Teclado Mecânico', 'Mouse Sem Fio'])
+        self.assertEqual(self.nomes('MOUSE fio'), ['Mouse Sem Fio'])
+        self.assertEqual(self.nomes('tecla', preco__lt=100), ['Mouse Sem Fio'])
+        self.assertEqual(self.nomes('  ?! '), [])
+
+    @patch('vendas.busca.MAX_RESULTADOS', 2)
+    def test_limite_fica_com_os_mais_relevantes(self):
+        # Encontrados antes na tabela, mas só pela descrição
+        Produto.objects.bulk_create(
+            Produto(nome=f'Cabo {i}', descricao='Serve no teclado', preco=Decimal('5.00')) for i in range(5)
+        )
+        Produto.objects.create(nome='Teclado Gamer', preco=Decimal('500.00'))
+        self.assertEqual(self.nomes('teclado'), ['Teclado Gamer', 'Teclado Mecânico'])
+
+    def test_lista_paginada_com_busca(self):
+        Produto.objects.bulk_create(
+            Produto(nome=f'Cabo {i}', preco=Decimal('5.00')) for i in range(60)
+        )
+        resposta = self.client.get(reverse('produto_list'), {'q': 'cabo', 'page': 2})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['produtos']), 10)
+        self.assertIn('q=cabo', resposta.context['parametros'])
+        self.assertEqual(len(self.client.get(reverse('produto_list')).context['produtos']), 50)
+
+
+class AutocompleteProdutosTests(TestCase):
+    def setUp(self):
+        Produto.objects.bulk_create(
+            Produto(nome=f'Cabo {i:02d}', preco=Decimal('5.00'), estoque=i % 5) for i in range(60)
+        )
+
+    def buscar(self, **parametros):
+        resposta = self.client.get(reverse('produto_autocomplete'), parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def test_paginas_so_com_estoque(self):
+        primeira = self.buscar()
+        self.assertEqual(len(primeira['results']), 20)
+        self.assertTrue(primeira['pagination']['more'])
+        self.assertEqual(primeira['results'][0]['text'], 'Cabo 01')
+        ultima = self.buscar(page=3)
+        self.assertEqual(len(ultima['results']), 8)
+        self.assertFalse(ultima['pagination']['more'])
+        self.assertTrue(all(resultado['estoque'] > 0 for resultado in primeira['results'] + ultima['results']))
+        self.assertEqual([resultado['text'] for resultado in self.buscar(q='cabo 07')['results']], ['Cabo 07'])
+
+    def test_formulario_so_renderiza_o_produto_escolhido(self):
+        produto = Produto.objects.get(nome='Cabo 01')
+        html = self.client.get(reverse('venda_create')).content.decode()
+        self.assertNotIn('Cabo 02', html)
+        self.assertIn(reverse('produto_autocomplete'), html)
+
+        # Re-renderização com erro (estoque insuficiente): só a opção escolhida, já selecionada
+        resposta = self.client.post(reverse('venda_create'), dados_venda((produto, 50)))
+        self.assertEqual(resposta.status_code, 200)
+        html = resposta.content.decode()
+        self.assertIn(f'<option value="{produto.pk}" selected>Cabo 01</option>', html)
+        self.assertNotIn('Cabo 02', html)
+
+
+class ExtratoEstoqueTests(TestCase):
+    def test_extrato_acompanha_o_estoque(self):
+        produto = Produto.objects.create(nome='Cabo', preco=Decimal('5.00'), estoque=0)
+        SaldoEstoque.objects.create(produto=produto, saldo=0)
+        Produto.objects.filter(pk=produto.pk).update(estoque=10)
+        registrar_ajuste(produto.pk, 10)
+
+        venda = criar_venda((produto, 4))
+        VendaFacade().atualizar_status_venda(venda, Venda.StatusVenda.PENDENTE, Venda.StatusVenda.CANCELADA)
+        VendaFacade().atualizar_status_venda(venda, Venda.StatusVenda.CANCELADA, Venda.StatusVenda.PAGA)
+
+        self.assertEqual(
+            list(produto.movimentos.order_by('pk').values_list('tipo', 'quantidade')),
+            [('AJUSTE', 10), ('VENDA', -4), ('DEVOLUCAO', 4), ('REATIVACAO', -4)],
+        )
+        self.assertFalse(divergencias_do_extrato().exists())
+
+        # A compactação move tudo para o saldo sem mudar o resultado
+        self.assertEqual(compactar_extrato(timezone.now() + timedelta(seconds=1)), 4)
+        self.assertFalse(produto.movimentos.exists())
+        self.assertEqual(SaldoEstoque.objects.get(produto=produto).saldo, 6)
+        self.assertEqual(produtos_com_saldo_do_extrato().get(pk=produto.pk).saldo_extrato, 6)
+
+    def test_escritas_individuais_entram_no_extrato(self):
+        # Como o admin e o shell: save() direto no produto
+        produto = Produto.objects.create(nome='Cabo', preco=Decimal('5.00'), estoque=7)
+        produto.estoque = 3
+        produto.save()
+        produto.preco = Decimal('6.00')
+        produto.save(update_fields=['preco'])
+        # Como o CRUD: formulário de criação e de edição
+        self.client.post(reverse('produto_create'), {'nome': 'Mouse', 'preco': '50.00', 'estoque': '4'})
+        mouse = Produto.objects.get(nome='Mouse')
+        self.client.post(
+            reverse('produto_update', args=[mouse.pk]), {'nome': 'Mouse', 'preco': '50.00', 'estoque': '9'}
+        )
+
+        self.assertEqual(
+            list(produto.movimentos.order_by('pk').values_list('tipo', 'quantidade')), [('AJUSTE', 7), ('AJUSTE', -4)]
+        )
+        self.assertEqual(list(mouse.movimentos.order_by('pk').values_list('quantidade', flat=True)), [4, 5])
+        self.assertFalse(divergencias_do_extrato().exists())
+
+
+class VendasEmLoteTests(TestCase):
+    def setUp(self):
+        self.teclado = Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=5)
+        self.mouse = Produto.objects.create(nome='Mouse', preco=Decimal('50.00'), estoque=100)
+
+    def enviar(self, vendas):
+        return self.client.post(reverse('venda_lote'), json.dumps(vendas), content_type='application/json')
+
+    def test_demanda_somada_no_lote(self):
+        resposta = self.enviar([
+            {'cliente': 'Loja 1', 'itens': [{'produto': self.teclado.pk, 'quantidade': 3}, {'produto': self.mouse.pk, 'quantidade': 1}]},
+            # Sozinha caberia no estoque, mas somada à venda anterior não
+            {'cliente': 'Loja 2', 'itens': [{'produto': self.teclado.pk, 'quantidade': 3}]},
+            {'cliente': 'Loja 3', 'status': 'PAGA', 'itens': [{'produto': self.teclado.pk, 'quantidade': 2}]},
+            {'cliente': '', 'itens': []},
+            {'cliente': 'Loja 4', 'status': 'CANCELADA'},
+        ])
+        self.assertEqual(resposta.status_code, 200)
+        corpo = resposta.json()
+        self.assertEqual((corpo['criadas'], corpo['rejeitadas']), (3, 2))
+        self.assertEqual(
+            [resultado['status'] for resultado in corpo['resultados']],
+            ['criada', 'rejeitada', 'criada', 'rejeitada', 'criada'],
+        )
+        self.assertIn('Teclado', corpo['resultados'][1]['erros'][0])
+        self.assertEqual(corpo['resultados'][0]['total'], '350.00')
+
+        self.teclado.refresh_from_db()
+        self.mouse.refresh_from_db()
+        self.assertEqual((self.teclado.estoque, self.mouse.estoque), (0, 99))
+        self.assertEqual(Venda.objects.count(), 3)
+        self.assertEqual(ItemVenda.objects.count(), 3)
+
+    def test_data_invalida_rejeita_so_a_venda(self):
+        item = [{'produto': self.mouse.pk, 'quantidade': 1}]
+        resposta = self.enviar([
+            {'cliente': 'Loja 1', 'data': '2024-02-30T10:00:00', 'itens': item},
+            {'cliente': 'Loja 2', 'data': '0001-01-01T00:00:00+14:00', 'itens': item},
+            {'cliente': 'Loja 3', 'data': '9999-12-31T23:59:59-12:00', 'itens': item},
+            {'cliente': 'Loja 4', 'data': '2024-02-29T10:00:00', 'itens': item},
+        ])
+        self.assertEqual(resposta.status_code, 200)
+        resultados = resposta.json()['resultados']
+        self.assertEqual(
+            [resultado['status'] for resultado in resultados],
+            ['rejeitada', 'rejeitada', 'rejeitada', 'criada'],
+        )
+        self.assertIn('Data inválida', resultados[0]['erros'][0])
+        self.assertIn('fora do intervalo', resultados[1]['erros'][0])
+        self.assertEqual(Venda.objects.count(), 1)
+
+    def test_exige_json(self):
+        resposta = self.client.post(reverse('venda_lote'), {'cliente': 'x'})
+        self.assertEqual(resposta.status_code, 415)
+
+
+class FilaVendasTests(TestCase):
+    def test_pedido_processado_pelo_worker_da_particao(self):
+        produto = Produto.objects.create(nome='Cadeira', preco=Decimal('200.00'), estoque=3)
+        urls = []
+        for _ in range(2):
+            resposta = self.client.post(
+                reverse('venda_fila'),
+                json.dumps({'cliente': 'Loja', 'itens': [{'produto': produto.pk, 'quantidade': 2}]}),
+                content_type='application/json',
+            )
+            self.assertEqual(resposta.status_code, 202)
+            urls.append(resposta.json()['status_url'])
+
+        particao = particao_da_venda({'itens': [{'produto': produto.pk}]})
+        outras = [p for p in range(PARTICOES) if p != particao]
+        # Um worker de outras partições não pega esses pedidos
+        self.assertEqual(processar_pedidos(outras), 0)
+        self.assertEqual(processar_pedidos([particao]), 2)
+
+        primeiro, segundo = (self.client.get(url).json() for url in urls)
+        self.assertEqual(primeiro['status'], PedidoVenda.Status.CONCLUIDO)
+        self.assertEqual(segundo['status'], PedidoVenda.Status.REJEITADO)
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque, 1)
+
+    def test_pedido_com_erro_nao_trava_a_particao(self):
+        produto = Produto.objects.create(nome='Cadeira', preco=Decimal('200.00'), estoque=3)
+        item = [{'produto': produto.pk, 'quantidade': 1}]
+        # Um pedido que passou pela validação antiga e estoura no resumo diário
+        ruim = enfileirar_venda({'cliente': 'Loja 1', 'data': '0001-01-01T00:00:00+14:00', 'itens': item})
+        bons = [enfileirar_venda({'cliente': f'Loja {n}', 'itens': item}) for n in (2, 3)]
+
+        with patch('vendas.facades.ANO_MINIMO_VENDA', 1), self.assertLogs('vendas.fila_vendas', 'ERROR'):
+            self.assertEqual(processar_pedidos(list(range(PARTICOES))), 3)
+
+        ruim.refresh_from_db()
+        self.assertEqual(ruim.status, PedidoVenda.Status.REJEITADO)
+        self.assertIn('Erro ao processar', ruim.erros[0])
+        for pedido in bons:
+            pedido.refresh_from_db()
+            self.assertEqual(pedido.status, PedidoVenda.Status.CONCLUIDO)
+        self.assertEqual(Venda.objects.count(), 2)
+        produto.refresh_from_db()
+        self.assertEqual(produto.estoque, 1)
+
+    def test_erro_de_banco_deixa_os_pedidos_para_a_proxima_passada(self):
+        produto = Produto.objects.create(nome='Cadeira', preco=Decimal('200.00'), estoque=3)
+        pedido = enfileirar_venda({'cliente': 'Loja', 'itens': [{'produto': produto.pk, 'quantidade': 1}]})
+
+        with patch.object(VendaFacade, 'criar_vendas_em_lote', side_effect=OperationalError('conexão perdida')):
+            with self.assertRaises(OperationalError):
+                processar_pedidos(list(range(PARTICOES)))
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, PedidoVenda.Status.AGUARDANDO)
+
+        self.assertEqual(processar_pedidos(list(range(PARTICOES))), 1)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, PedidoVenda.Status.CONCLUIDO)
+
+    def test_data_invalida_nao_entra_na_fila(self):
+        produto = Produto.objects.create(nome='Cadeira', preco=Decimal('200.00'), estoque=3)
+        for data in ('2024-02-30T10:00:00', '0001-01-01T00:00:00+14:00'):
+            resposta = self.client.post(
+                reverse('venda_fila'),
+                json.dumps({'cliente': 'Loja', 'data': data, 'itens': [{'produto': produto.pk, 'quantidade': 1}]}),
+                content_type='application/json',
+            )
+            self.assertEqual(resposta.status_code, 400)
+            self.assertEqual(len(resposta.json()['erros']), 1)
+        self.assertFalse(PedidoVenda.objects.exists())
+
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        self.produto = Produto.objects.create(nome='Monitor', preco=Decimal('800.00'), estoque=10)
+
+    def test_reenvio_do_formulario_nao_duplica_a_venda(self):
+        dados = dados_venda((self.produto, 2))
+        dados['idempotency_key'] = 'abc-123'
+        for _ in range(3):
+            resposta = self.client.post(reverse('venda_create'), dados)
+            self.assertRedirects(resposta, reverse('venda_list'), fetch_redirect_response=False)
+        self.assertEqual(Venda.objects.count(), 1)
+        self.produto.refresh_from_db()
+        self.assertEqual(self.produto.estoque, 8)
+
+    def test_lote_repetido_devolve_a_resposta_original(self):
+        corpo = json.dumps([{'cliente': 'Loja', 'itens': [{'produto': self.produto.pk, 'quantidade': 1}]}])
+        enviar = lambda corpo: self.client.post(
+            reverse('venda_lote'), corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='lote-1'
+        )
+        primeira = enviar(corpo)
+        repetida = enviar(corpo)
+        self.assertEqual(primeira.json(), repetida.json())
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(Venda.objects.count(), 1)
+        # Mesma chave com outro conteúdo
+        self.assertEqual(enviar(corpo.replace('Loja', 'Outra')).status_code, 422)
+
+    def test_chave_expirada_vale_como_nova(self):
+        corpo = json.dumps([{'cliente': 'Loja', 'itens': [{'produto': self.produto.pk, 'quantidade': 1}]}])
+        self.client.post(reverse('venda_lote'), corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='k')
+        ChaveIdempotencia.objects.update(expira_em=timezone.now())
+        self.client.post(reverse('venda_lote'), corpo, content_type='application/json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(Venda.objects.count(), 2)
+
+
+class MetricasTests(TestCase):
+    def test_metrics_no_formato_prometheus(self):
+        produto = Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=5)
+        self.client.post(reverse('venda_create'), dados_venda((produto, 1)))
+        resposta = self.client.get(reverse('metricas'))
+        self.assertTrue(resposta['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = resposta.content.decode()
+        self.assertIn('# TYPE vendas_operacao_duracao_segundos histogram', texto)
+        self.assertIn('vendas_operacao_duracao_segundos_count{operacao="criar_venda"}', texto)
+        self.assertIn('vendas_http_requisicoes_total{view="venda_create",metodo="POST",status="302"}', texto)
+
+    def test_soma_os_arquivos_dos_outros_processos(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(METRICAS_DIR=diretorio):
+            self.client.get(reverse('produto_list'))
+            registro.gravar(forcar=True)
+            antes = registro.agregado()['vendas_http_requisicoes_total']
+            # Outro worker com os mesmos valores
+            with open(os.path.join(diretorio, f'{os.getpid()}.json')) as arquivo:
+                valores = arquivo.read()
+            with open(os.path.join(diretorio, '1.json'), 'w') as arquivo:
+                arquivo.write(valores)
+            depois = registro.agregado()['vendas_http_requisicoes_total']
+        chave = ('produto_list', 'GET', '200')
+        self.assertEqual(depois[chave], 2 * antes[chave])
+
+
+def _consultas(capturadas) -> int:
+    """Consultas capturadas, sem os SAVEPOINTs dos atomic() aninhados na transação do teste."""
+    return sum('SAVEPOINT' not in consulta['sql'] for consulta in capturadas.captured_queries)
+
+
+class ResumoVendasTests(TestCase):
+    """O resumo mantido pela facade é igual ao recalculado a partir das vendas."""
+    def setUp(self):
+        self.teclado = Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=50)
+        self.mouse = Produto.objects.create(nome='Mouse', preco=Decimal('50.00'), estoque=50)
+
+    def resumo(self):
+        return sorted(ResumoVendasDia.objects.exclude(vendas=0).values_list('status', 'dia', 'receita', 'itens', 'vendas'))
+
+    def assertResumoConfere(self):
+        mantido = self.resumo()
+        reconstruir_resumo()
+        self.assertEqual(mantido, self.resumo())
+
+    def test_resumo_acompanha_as_vendas(self):
+        facade = VendaFacade()
+        vendas = [criar_venda((self.teclado, 2), (self.mouse, 1)) for _ in range(3)]
+        ontem = criar_venda((self.mouse, 4))
+        self.assertResumoConfere()
+        # Mudança de data fora da facade: só a reconstrução coloca a venda no dia certo
+        Venda.objects.filter(pk=ontem.pk).update(data=timezone.now() - timedelta(days=1))
+        ontem.refresh_from_db()
+        reconstruir_resumo()
+
+        for venda, novo_status in ((vendas[0], Venda.StatusVenda.PAGA), (ontem, Venda.StatusVenda.CANCELADA)):
+            # Como na VendaUpdateView: a facade aplica as regras e o formulário grava o status
+            facade.atualizar_status_venda(venda, venda.status, novo_status)
+            Venda.objects.filter(pk=venda.pk).update(status=novo_status)
+        self.assertResumoConfere()
+
+        facade.atualizar_status_em_lote([venda.pk for venda in vendas] + [ontem.pk], Venda.StatusVenda.PAGA)
+        facade.criar_vendas_em_lote([{'cliente': 'Loja', 'itens': [{'produto': self.teclado.pk, 'quantidade': 3}]}])
+        self.assertResumoConfere()
+        pagas_hoje = ResumoVendasDia.objects.get(status=Venda.StatusVenda.PAGA, dia=timezone.localdate())
+        self.assertEqual((pagas_hoje.vendas, pagas_hoje.itens, pagas_hoje.receita), (3, 9, Decimal('750.00')))
+
+    def test_home_le_o_resumo(self):
+        cache.clear()
+        paga = criar_venda((self.teclado, 1), (self.mouse, 2))
+        criar_venda((self.mouse, 1))
+        VendaFacade().atualizar_status_em_lote([paga.pk], Venda.StatusVenda.PAGA)
+        resposta = self.client.get(reverse('home'))
+        self.assertEqual(resposta.context['total_vendido_hoje'], Decimal('200.00'))
+        self.assertEqual(resposta.context['itens_vendidos_hoje'], 3)
+        self.assertEqual(resposta.context['receita_total'], Decimal('200.00'))
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.produto = Produto.objects.create(nome='Teclado', preco=Decimal('100.00'), estoque=50)
+
+    def home(self):
+        return self.client.get(reverse('home')).context
+
+    def vender(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            venda = criar_venda((self.produto, 1))
+            VendaFacade().atualizar_status_em_lote([venda.pk], Venda.StatusVenda.PAGA)
+
+    def test_cache_invalidado_pelas_escritas(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.home()['receita_total'], Decimal('0.00'))
+        with self.assertNumQueries(0):
+            self.home()
+
+        self.vender()
+        self.assertEqual(self.home()['receita_total'], Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Produto.objects.create(nome='Mouse', preco=Decimal('50.00'))
+        self.assertEqual(self.home()['total_produtos'], 2)
+
+    def test_valor_antigo_enquanto_outro_worker_recalcula(self):
+        self.home()
+        self.vender()
+        # Outro worker está recalculando: esta requisição serve o valor antigo sem ir ao banco
+        cache.add(dashboard.CHAVE_TRAVA, True)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.home()['receita_total'], Decimal('0.00'))
+        cache.delete(dashboard.CHAVE_TRAVA)
+        self.assertEqual(self.home()['receita_total'], Decimal('100.00'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class OrcamentoConsultasTests(TestCase):
+    """
+    Todas as rotas de vendas/urls.py e os métodos da facade dentro do orçamento
+    declarado (vendas/orcamentos.py), com 10 e com 1000 linhas de dados.
+    Orçamentos inteiros também exigem o mesmo número de consultas nos dois tamanhos.
+    Vendas em lote, ids de status e itens de uma venda vão de 10 a 100 por requisição.
+    """
+    tamanhos = (10, 1000)
+
+    # Requisição de cada rota: (test, itens por requisição) -> resposta
+    requisicoes = {
+        'home': lambda t, n: t.client.get(reverse('home')),
+        'metricas': lambda t, n: t.client.get(reverse('metricas')),
+        'produto_list': lambda t, n: t.client.get(reverse('produto_list')),
+        'produto_create': lambda t, n: t.client.post(reverse('produto_create'), {
+            'nome': 'Novo', 'preco': '10.00', 'estoque': '5', 'categoria': t.categoria.pk,
+        }),
+        'produto_update': lambda t, n: t.client.post(reverse('produto_update', args=[t.avulso.pk]), {
+            'nome': 'Avulso', 'preco': '12.00', 'estoque': '7', 'categoria': t.categoria.pk,
+        }),
+        'produto_delete': lambda t, n: t.client.post(reverse('produto_delete', args=[t.avulso.pk])),
+        'produto_export': lambda t, n: t.client.get(reverse('produto_export'), {'format': 'csv'}),
+        'produto_export_zip': lambda t, n: t.client.get(reverse('produto_export_zip'), {'format': 'csv'}),
+        'produto_import': lambda t, n: t.client.post(reverse('produto_import'), {
+            'arquivo_importacao': SimpleUploadedFile('produtos.csv', b'nome,preco\nA,1\n'),
+        }),
+        'produto_import_status': lambda t, n: t.client.get(reverse('produto_import_status', args=[t.job.pk])),
+        'produto_autocomplete': lambda t, n: t.client.get(reverse('produto_autocomplete'), {'q': 'Produto'}),
+        'categoria_list': lambda t, n: t.client.get(reverse('categoria_list')),
+        'categoria_create': lambda t, n: t.client.post(reverse('categoria_create'), {'nome': 'Nova'}),
+        'categoria_update': lambda t, n: t.client.post(
+            reverse('categoria_update', args=[t.categoria.pk]), {'nome': 'Renomeada'}
+        ),
+        'categoria_delete': lambda t, n: t.client.post(reverse('categoria_delete', args=[t.categoria.pk])),
+        'venda_list': lambda t, n: t.client.get(reverse('venda_list')),
+        'venda_create': lambda t, n: t.client.post(
+            reverse('venda_create'), dados_venda(*[(produto, 1) for produto in t.produtos[:2]])
+        ),
+        'venda_lote': lambda t, n: t.client.post(reverse('venda_lote'), json.dumps([
+            {'cliente': f'Loja {i}', 'itens': [{'produto': t.produtos[i].pk, 'quantidade': 1}]} for i in range(n)
+        ]), content_type='application/json'),
+        'venda_status_lote': lambda t, n: t.client.post(reverse('venda_status_lote'), json.dumps({
+            'ids': [venda.pk for venda in t.vendas[:n]], 'status': Venda.StatusVenda.PAGA,
+        }), content_type='application/json'),
+        'venda_fila': lambda t, n: t.client.post(reverse('venda_fila'), json.dumps(
+            {'cliente': 'Loja', 'itens': [{'produto': t.produtos[0].pk, 'quantidade': 1}]}
+        ), content_type='application/json'),
+        'venda_fila_status': lambda t, n: t.client.get(reverse('venda_fila_status', args=[t.pedido.pk])),
+        'venda_update': lambda t, n: t.client.post(reverse('venda_update', args=[t.vendas[0].pk]), {
+            'cliente': t.vendas[0].cliente, 'status': Venda.StatusVenda.CANCELADA,
+        }),
+    }
+
+    def completar_dados(self, tamanho: int):
+        """Completa o banco até 'tamanho' produtos e vendas (2 itens cada) e tamanho / 10 categorias."""
+        inicio = Categoria.objects.count()
+        Categoria.objects.bulk_create(Categoria(nome=f'Categoria {i}') for i in range(inicio, max(tamanho // 10, 1)))
+        categorias = list(Categoria.objects.order_by('pk'))
+        inicio = Produto.objects.exclude(nome='Avulso').count()
+        Produto.objects.bulk_create(
+            Produto(nome=f'Produto {i}', preco=Decimal('10.00'), estoque=10 ** 6, categoria=categorias[i % len(categorias)])
+            for i in range(inicio, tamanho)
+        )
+        self.produtos = list(Produto.objects.exclude(nome='Avulso').order_by('pk'))
+        inicio = Venda.objects.count()
+        vendas = Venda.objects.bulk_create(
+            Venda(cliente=f'Cliente {i}', total=Decimal('20.00')) for i in range(inicio, tamanho)
+        )
+        ItemVenda.objects.bulk_create(
+            ItemVenda(venda=venda, produto=produto, quantidade=1, preco_unitario=Decimal('10.00'))
+            for i, venda in enumerate(vendas, start=inicio)
+            for produto in (self.produtos[i], self.produtos[(i + 1) % tamanho])
+        )
+        self.vendas = list(Venda.objects.order_by('pk'))
+        self.categoria = categorias[0]
+        self.avulso, _ = Produto.objects.get_or_create(nome='Avulso', defaults={'preco': Decimal('1.00')})
+        self.job, _ = ImportJob.objects.get_or_create(formato='csv', defaults={'arquivo': 'importacoes/x.csv'})
+        self.pedido = PedidoVenda.objects.first() or enfileirar_venda({'cliente': 'Loja', 'itens': []})
+        # Nova versão do catálogo: as exportações não vêm do cache da medição anterior
+        registrar_alteracao_catalogo()
+
+    def volume(self) -> dict:
+        return {
+            'categorias': Categoria.objects.count(),
+            'produtos': Produto.objects.count(),
+            'vendas': Venda.objects.count(),
+        }
+
+    def medir(self, funcao) -> int:
+        """Consultas de 'funcao', desfazendo o que ela gravar."""
+        # Sem o contexto do dashboard em cache: o orçamento vale para o recálculo
+        cache.clear()
+        with transaction.atomic(), CaptureQueriesContext(connection) as capturadas:
+            resposta = funcao()
+            if getattr(resposta, 'streaming', False):
+                b''.join(resposta.streaming_content)
+            transaction.set_rollback(True)
+        self.assertLess(getattr(resposta, 'status_code', 200), 400, resposta)
+        return _consultas(capturadas)
+
+    def test_toda_rota_declara_orcamento(self):
+        for padrao in urls.urlpatterns:
+            with self.subTest(rota=padrao.name):
+                self.assertIsNotNone(orcamento_da_view(padrao.callback), "Declare @orcamento_consultas na view.")
+                self.assertIn(padrao.name, self.requisicoes, "Inclua a rota em OrcamentoConsultasTests.requisicoes.")
+
+    # A exportação ZIP roda em série: consultas feitas em outros processos não seriam contadas
+    @patch.object(ExportacaoZip, '_em_paralelo', return_value=False)
+    def test_rotas_dentro_do_orcamento(self, _):
+        # Feita uma vez por processo: não entra na medição de nenhum dos volumes
+        if connection.vendor == 'postgresql':
+            busca._trigramas_disponiveis()
+        medidas = {}
+        volumes = []
+        for tamanho in self.tamanhos:
+            self.completar_dados(tamanho)
+            volumes.append(self.volume())
+            for padrao in urls.urlpatterns:
+                medidas.setdefault(padrao.name, []).append(
+                    self.medir(lambda: self.requisicoes[padrao.name](self, min(tamanho, 100)))
+                )
+
+        for padrao in urls.urlpatterns:
+            orcamento = orcamento_da_view(padrao.callback)
+            with self.subTest(rota=padrao.name, consultas=medidas[padrao.name]):
+                for volume, consultas in zip(volumes, medidas[padrao.name]):
+                    self.assertLessEqual(consultas, consultas_permitidas(orcamento, volume))
+                if not callable(orcamento):
+                    self.assertEqual(len(set(medidas[padrao.name])), 1)
+
+    def test_facade_dentro_do_orcamento(self):
+        facade = VendaFacade()
+        operacoes = {
+            'criar_venda': lambda n: facade.criar_venda(
+                *formularios_venda(*[(produto, 1) for produto in self.produtos[:n]]), {}
+            ),
+            'criar_vendas_em_lote': lambda n: facade.criar_vendas_em_lote([
+                {'cliente': 'Loja', 'itens': [{'produto': produto.pk, 'quantidade': 1}]} for produto in self.produtos[:n]
+            ]),
+            # Metade das vendas: os 2 movimentos de extrato de cada uma cabem num único INSERT
+            # (o SQLite divide o bulk_create acima de 999 parâmetros)
+            'atualizar_status_em_lote': lambda n: facade.atualizar_status_em_lote(
+                [venda.pk for venda in self.vendas[:n // 2]], Venda.StatusVenda.CANCELADA
+            ),
+            'atualizar_status_venda': lambda n: facade.atualizar_status_venda(
+                self.venda_grande(n), Venda.StatusVenda.PENDENTE, Venda.StatusVenda.CANCELADA
+            ),
+        }
+        medidas = {}
+        for tamanho in self.tamanhos:
+            self.completar_dados(tamanho)
+            for nome, operacao in operacoes.items():
+                medidas.setdefault(nome, []).append(self.medir(lambda: operacao(min(tamanho, 100))))
+
+        for nome in operacoes:
+            orcamento = getattr(VendaFacade, nome).orcamento_consultas
+            with self.subTest(metodo=nome, consultas=medidas[nome]):
+                for consultas in medidas[nome]:
+                    self.assertLessEqual(consultas, orcamento)
+                self.assertEqual(len(set(medidas[nome])), 1)
+
+    def venda_grande(self, itens: int) -> Venda:
+        venda = Venda.objects.create(cliente='Atacado')
+        ItemVenda.objects.bulk_create(
+            ItemVenda(venda=venda, produto=produto, quantidade=1, preco_unitario=produto.preco)
+            for produto in self.produtos[:itens]
+        )
+        return venda
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class BaixaEstoqueConcorrenteTests(TransactionTestCase):
+    """Várias vendas simultâneas do mesmo produto nunca vendem mais que o estoque."""
+    estoque_inicial = 100
+    quantidade_por_venda = 3
+    vendas_simultaneas = 50
+
+    def test_sem_venda_acima_do_estoque(self):
+        produto = Produto.objects.create(nome='Produto Disputado', preco=Decimal('10.00'), estoque=self.estoque_inicial)
+        outro = Produto.objects.create(nome='Outro Produto', preco=Decimal('1.00'), estoque=10 ** 6)
+        largada = threading.Barrier(self.vendas_simultaneas)
+        resultados = []
+
+        def comprar(indice):
+            try:
+                # Metade das vendas lista os produtos na ordem inversa (teste de deadlock)
+                itens = [(produto, self.quantidade_por_venda), (outro, 1)]
+                if indice % 2:
+                    itens.reverse()
+                # Formulários validados antes da largada: todos veem o estoque cheio
+                form, formset = formularios_venda(*itens)
+                largada.wait()
+                VendaFacade().criar_venda(form, formset, {})
+                resultados.append('ok')
+            except EstoqueInsuficiente:
+                resultados.append('sem estoque')
+            except Exception as e:
+                resultados.append(repr(e))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=comprar, args=(i,)) for i in range(self.vendas_simultaneas)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        produto.refresh_from_db()
+        vendidas = self.estoque_inicial // self.quantidade_por_venda
+        self.assertEqual(resultados.count('ok'), vendidas, resultados)
+        self.assertEqual(resultados.count('sem estoque'), self.vendas_simultaneas - vendidas, resultados)
+        self.assertEqual(produto.estoque, self.estoque_inicial - vendidas * self.quantidade_por_venda)
+        self.assertEqual(Venda.objects.count(), vendidas)
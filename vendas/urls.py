@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     # URL da Home
     path('', views.home, name='home'),
+    path('metrics', views.metricas, name='metricas'),
 
     # --- URLs do CRUD de Produtos ---
     path('produtos/', views.ProdutoListView.as_view(), name='produto_list'),
@@ -11,7 +12,10 @@ urlpatterns = [
     path('produtos/<int:pk>/editar/', views.ProdutoUpdateView.as_view(), name='produto_update'),
     path('produtos/<int:pk>/deletar/', views.ProdutoDeleteView.as_view(), name='produto_delete'),
     path('produtos/export/', views.export_produtos, name='produto_export'),
+    path('produtos/export/zip/', views.export_produtos_zip, name='produto_export_zip'),
     path('produtos/import/', views.import_produtos, name='produto_import'),
+    path('produtos/import/<int:pk>/', views.import_status, name='produto_import_status'),
+    path('produtos/autocomplete/', views.autocomplete_produtos, name='produto_autocomplete'),
 
     # --- (NOVO) URLs do CRUD de Categorias ---
     path('categorias/', views.CategoriaListView.as_view(), name='categoria_list'),
@@ -22,5 +26,9 @@ urlpatterns = [
     # --- URLs do CRUD de Vendas ---
     path('vendas/', views.VendaListView.as_view(), name='venda_list'),
     path('vendas/nova/', views.VendaCreateView.as_view(), name='venda_create'),
+    path('vendas/lote/', views.vendas_em_lote, name='venda_lote'),
+    path('vendas/status/', views.status_vendas_em_lote, name='venda_status_lote'),
+    path('vendas/fila/', views.enfileirar_venda_view, name='venda_fila'),
+    path('vendas/fila/<int:pk>/', views.status_pedido_venda, name='venda_fila_status'),
     path('vendas/<int:pk>/editar/', views.VendaUpdateView.as_view(), name='venda_update'),
 ]
\ No newline at end of file
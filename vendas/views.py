@@ -1,80 +1,116 @@
-from django.shortcuts import render, redirect
-from django.urls import reverse_lazy
+import json
+import uuid
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import HttpRequest, HttpResponse, Http404
+from django.http import HttpRequest, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Count, F, DecimalField
-import json
-import xml.etree.ElementTree as ET
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from django.db.models import Sum, Count, F, Q
 from decimal import Decimal, InvalidOperation
 
 # Importamos CategoriaForm
-from .models import Produto, Categoria, Venda, ItemVenda
+from .models import Produto, Categoria, Venda, ImportJob, PedidoVenda, ResumoVendasDia
 from .forms import (
-    ProdutoForm, VendaForm, ItemVendaFormSet, CategoriaForm
+    ProdutoForm, VendaForm, ItemVendaFormSet, CategoriaForm, FiltroVendasForm
 )
+from .busca import buscar_produtos
+from .catalogo import cache_exportacoes, versao_catalogo
+from .dashboard import contexto_dashboard
 from .exporters import ExporterFactory
+from .exportacao_zip import ExportacaoZip, MODO_CATEGORIA, NOVA_TENTATIVA, VagaExportacao
+from .importers import formato_do_arquivo
 from .facades import VendaFacade
+from .fila_vendas import enfileirar_venda
+from .metricas import registro as registro_metricas
+from .orcamentos import orcamento_consultas
+from .paginacao import TAMANHO_PAGINA, CursorInvalido, pagina_por_cursor
+from .idempotencia import ConflitoIdempotencia, chave_da_requisicao, executar_uma_vez
 
 # --- View da Home/Dashboard ---
-def home(request):
+def _calcular_contexto_home() -> dict:
     today = timezone.localdate()
-    vendas_hoje = Venda.objects.filter(
-        data__date=today, 
-        status=Venda.StatusVenda.PAGA
+    # Totais lidos do resumo diário (ResumoVendasDia), mantido pela VendaFacade:
+    # uma linha por dia com vendas pagas, não importa o tamanho da tabela de vendas
+    resumo = ResumoVendasDia.objects.filter(status=Venda.StatusVenda.PAGA).aggregate(
+        total_vendido_hoje=Sum('receita', filter=Q(dia=today)),
+        itens_vendidos_hoje=Sum('itens', filter=Q(dia=today)),
+        receita_total=Sum('receita'),
     )
-    total_vendido_hoje = vendas_hoje.aggregate(
-        total=Sum('total', output_field=DecimalField())
-    )['total'] or Decimal('0.00')
-    itens_vendidos_hoje = ItemVenda.objects.filter(
-        venda__in=vendas_hoje
-    ).aggregate(
-        count=Sum('quantidade')
-    )['count'] or 0
-    receita_total = Venda.objects.filter(
-        status=Venda.StatusVenda.PAGA
-    ).aggregate(
-        total=Sum('total', output_field=DecimalField())
-    )['total'] or Decimal('0.00')
+    total_vendido_hoje = resumo['total_vendido_hoje'] or Decimal('0.00')
+    itens_vendidos_hoje = resumo['itens_vendidos_hoje'] or 0
+    receita_total = resumo['receita_total'] or Decimal('0.00')
     total_produtos = Produto.objects.count()
-    context = {
+    return {
         'total_vendido_hoje': total_vendido_hoje,
         'itens_vendidos_hoje': itens_vendidos_hoje,
         'receita_total': receita_total,
         'total_produtos': total_produtos,
-    } 
+    }
+
+# Orçamento do recálculo; com o contexto em cache (vendas/dashboard.py) a home não consulta o banco
+@orcamento_consultas(2)
+def home(request):
+    context = contexto_dashboard(_calcular_contexto_home)
     return render(request, 'home.html', context)
 
 # --- CRUD de Produtos ---
+# +1 na primeira busca do processo no PostgreSQL (verifica o índice de trigramas)
+@orcamento_consultas(4)
 class ProdutoListView(ListView):
     model = Produto
     template_name = 'produto_list.html'
     context_object_name = 'produtos'
+    paginate_by = 50
     def get_queryset(self):
-        queryset = super().get_queryset().order_by('nome')
+        # select_related: a lista mostra a categoria de cada produto
+        queryset = super().get_queryset().select_related('categoria')
         categoria_id = self.request.GET.get('categoria')
         if categoria_id:
             queryset = queryset.filter(categoria_id=categoria_id)
-        return queryset
+        busca = self.request.GET.get('q', '').strip()
+        if busca:
+            # Resultados por relevância (vendas/busca.py)
+            return buscar_produtos(busca, queryset)
+        return queryset.order_by('nome')
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['categorias'] = Categoria.objects.all().order_by('nome')
+        context['busca'] = self.request.GET.get('q', '').strip()
+        # Filtros e busca repetidos nos links de paginação
+        parametros = self.request.GET.copy()
+        parametros.pop('page', None)
+        context['parametros'] = parametros.urlencode()
         return context
+@orcamento_consultas(6)
 class ProdutoCreateView(SuccessMessageMixin, CreateView):
     model = Produto
     form_class = ProdutoForm
     template_name = 'produto_form.html'
     success_url = reverse_lazy('produto_list') 
     success_message = "Produto criado com sucesso!" 
+    @transaction.atomic
+    def form_valid(self, form):
+        # O estoque inicial entra no extrato (signals.py) na mesma transação do produto
+        return super().form_valid(form)
+@orcamento_consultas(8)
 class ProdutoUpdateView(SuccessMessageMixin, UpdateView):
     model = Produto
     form_class = ProdutoForm
     template_name = 'produto_form.html'
     success_url = reverse_lazy('produto_list')
     success_message = "Produto atualizado com sucesso!"
+    @transaction.atomic
+    def form_valid(self, form):
+        # A diferença para o estoque atual do banco (travado no pre_save, em signals.py)
+        # entra no extrato na mesma transação
+        return super().form_valid(form)
+@orcamento_consultas(6)
 class ProdutoDeleteView(SuccessMessageMixin, DeleteView):
     model = Produto
     template_name = 'produto_confirm_delete.html'
@@ -82,6 +118,7 @@ class ProdutoDeleteView(SuccessMessageMixin, DeleteView):
     # success_message = "Produto deletado com sucesso!" # Requer workaround
 
 # --- (NOVO) CRUD de Categorias ---
+@orcamento_consultas(2)
 class CategoriaListView(ListView):
     model = Categoria
     template_name = 'categoria_list.html'
@@ -89,6 +126,7 @@ class CategoriaListView(ListView):
     paginate_by = 10
     ordering = ['nome']
 
+@orcamento_consultas(3)
 class CategoriaCreateView(SuccessMessageMixin, CreateView):
     model = Categoria
     form_class = CategoriaForm
@@ -96,6 +134,7 @@ class CategoriaCreateView(SuccessMessageMixin, CreateView):
     success_url = reverse_lazy('categoria_list')
     success_message = "Categoria criada com sucesso!"
 
+@orcamento_consultas(4)
 class CategoriaUpdateView(SuccessMessageMixin, UpdateView):
     model = Categoria
     form_class = CategoriaForm
@@ -103,6 +142,7 @@ class CategoriaUpdateView(SuccessMessageMixin, UpdateView):
     success_url = reverse_lazy('categoria_list')
     success_message = "Categoria atualizada com sucesso!"
 
+@orcamento_consultas(4)
 class CategoriaDeleteView(DeleteView): # Removido SuccessMessageMixin
     model = Categoria
     template_name = 'categoria_confirmar_delete.html' # Novo template
@@ -115,23 +155,150 @@ class CategoriaDeleteView(DeleteView): # Removido SuccessMessageMixin
         return super().form_valid(form)
 
 
+# --- Métricas (formato texto do Prometheus) ---
+@orcamento_consultas(0)
+def metricas(request: HttpRequest) -> HttpResponse:
+    return HttpResponse(
+        registro_metricas.texto_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
 # --- View de Exportação de Produtos ---
-@transaction.atomic 
+def _aceita_gzip(request: HttpRequest) -> bool:
+    for codificacao in request.headers.get('Accept-Encoding', '').split(','):
+        nome, _, parametros = codificacao.strip().partition(';')
+        if nome.strip().lower() == 'gzip':
+            return parametros.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+def _opcoes_exportacao(request: HttpRequest) -> dict:
+    """
+    Lê (uma única vez por requisição) o que define a representação exportada:
+    formato, categoria, modo compacto e compressão.
+    """
+    if not hasattr(request, '_opcoes_exportacao'):
+        compressao = request.GET.get('compress', '').lower() or None
+        content_encoding = False
+        if compressao is None and _aceita_gzip(request):
+            compressao, content_encoding = 'gzip', True
+        request._opcoes_exportacao = {
+            'format': request.GET.get('format', 'json').lower(),
+            'categoria': request.GET.get('categoria') or '',
+            'compact': request.GET.get('compact', '').lower() in ('1', 'true', 'sim'),
+            'compressao': compressao,
+            'content_encoding': content_encoding,
+        }
+    return request._opcoes_exportacao
+
+def _versao_exportacao(request: HttpRequest):
+    # Lida uma única vez por requisição e sempre antes dos dados: no pior caso
+    # um corpo mais novo fica associado à versão anterior, nunca o contrário.
+    if not hasattr(request, '_versao_catalogo'):
+        request._versao_catalogo = versao_catalogo()
+    return request._versao_catalogo
+
+def _chave_exportacao(request: HttpRequest) -> tuple:
+    opcoes = _opcoes_exportacao(request)
+    return (
+        opcoes['format'],
+        opcoes['categoria'],
+        opcoes['compact'],
+        opcoes['compressao'],
+        opcoes['content_encoding'],
+        _versao_exportacao(request).versao,
+    )
+
+def _etag_exportacao(request: HttpRequest) -> str:
+    formato, categoria, compact, compressao, content_encoding, versao = _chave_exportacao(request)
+    etag = f"{versao}-{formato}-{categoria or 'todas'}"
+    if compact:
+        etag += '-compact'
+    if compressao:
+        etag += f"-{compressao}"
+    return etag
+
+def _last_modified_exportacao(request: HttpRequest):
+    return _versao_exportacao(request).atualizado_em
+
+# Sem @transaction.atomic: o exportador abre um snapshot somente leitura
+# que dura enquanto a resposta em streaming é consumida.
+# Integrações que repetem a consulta com If-None-Match/If-Modified-Since
+# recebem 304 enquanto a versão do catálogo não mudar.
+@orcamento_consultas(2)
+@condition(etag_func=_etag_exportacao, last_modified_func=_last_modified_exportacao)
 def export_produtos(request: HttpRequest) -> HttpResponse:
+    opcoes = _opcoes_exportacao(request)
+    queryset = Produto.objects.all().select_related('categoria').order_by('nome')
+    if opcoes['categoria']:
+        queryset = queryset.filter(categoria_id=opcoes['categoria'])
+    factory = ExporterFactory()
+    try:
+        exporter = factory.get_exporter(
+            opcoes['format'],
+            queryset,
+            streaming=True,
+            compact=opcoes['compact'],
+            compressao=opcoes['compressao'],
+            content_encoding=opcoes['content_encoding'],
+        )
+    except ValueError as e:
+        raise Http404(str(e))
+
+    chave = _chave_exportacao(request)
+    corpo = cache_exportacoes.get(chave)
+    if corpo is not None:
+        response = exporter.export_from_cache(corpo)
+    else:
+        response = exporter.export()
+        response.streaming_content = cache_exportacoes.armazenar_ao_final(chave, response.streaming_content)
+    # O cliente pode guardar a resposta, mas deve revalidar (ETag) a cada uso
+    patch_cache_control(response, private=True, no_cache=True)
+    if not request.GET.get('compress'):
+        patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+@orcamento_consultas(lambda dados: 3 + 2 * (dados['categorias'] + 1))
+def export_produtos_zip(request: HttpRequest) -> HttpResponse:
+    """
+    Exportação em lote do catálogo completo: uma parte por categoria
+    (?dividir=categoria) ou por faixa de ids (?dividir=faixa), geradas em
+    paralelo e entregues em um único ZIP com manifest.json.
+    Cada parte sai comprimida com gzip, a menos que ?compress=bz2|xz|none.
+    Só EXPORTACAO_ZIP_SIMULTANEAS exportações rodam ao mesmo tempo (503 para as demais).
+    """
     export_format = request.GET.get('format', 'json').lower()
     categoria_id = request.GET.get('categoria')
+    compressao = request.GET.get('compress', 'gzip').lower()
+
     queryset = Produto.objects.all().select_related('categoria').order_by('nome')
     if categoria_id:
         queryset = queryset.filter(categoria_id=categoria_id)
-    factory = ExporterFactory()
     try:
-        exporter = factory.get_exporter(export_format, queryset)
+        exportacao = ExportacaoZip(
+            export_format,
+            queryset,
+            modo=request.GET.get('dividir', MODO_CATEGORIA),
+            compact=request.GET.get('compact', '').lower() in ('1', 'true', 'sim'),
+            compressao=None if compressao == 'none' else compressao,
+        )
     except ValueError as e:
         raise Http404(str(e))
-    return exporter.export()
+
+    # Cada exportação ocupa um pool de processos: acima do limite, o cliente tenta depois
+    vaga = VagaExportacao.reservar()
+    if vaga is None:
+        response = HttpResponse("Exportação ZIP em andamento; tente novamente em instantes.", status=503)
+        response['Retry-After'] = str(NOVA_TENTATIVA)
+        return response
+
+    response = StreamingHttpResponse(vaga.acompanhar(exportacao.iter_bytes()), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{exportacao.filename}"'
+    return response
 
 # --- View de Importação de Produtos ---
-@transaction.atomic 
+# A importação em si roda em segundo plano (comando 'processar_importacoes');
+# aqui só guardamos o arquivo e enfileiramos um ImportJob.
+@orcamento_consultas(1)
 def import_produtos(request: HttpRequest) -> HttpResponse:
     if request.method != 'POST':
         messages.error(request, "Método não permitido.")
@@ -142,75 +309,254 @@ def import_produtos(request: HttpRequest) -> HttpResponse:
         messages.error(request, "Nenhum arquivo enviado.")
         return redirect('produto_list')
 
-    try:
-        if arquivo.name.endswith('.json'):
-            count = _processar_json(arquivo)
-        elif arquivo.name.endswith('.xml'):
-            count = _processar_xml(arquivo)
-        else:
-            messages.error(request, "Formato de arquivo inválido. Use .json ou .xml.")
-            return redirect('produto_list')
-        
-        messages.success(request, f"{count} produtos foram importados/atualizados com sucesso!")
-    
-    except Exception as e:
-        messages.error(request, f"Erro ao processar o arquivo: {e}")
-    
+    formato = formato_do_arquivo(arquivo.name)
+    if not formato:
+        messages.error(request, "Formato de arquivo inválido. Use .json, .xml, .csv ou .ndjson.")
+        return redirect('produto_list')
+
+    job = ImportJob.objects.create(arquivo=arquivo, formato=formato)
+    status_url = reverse('produto_import_status', args=[job.pk])
+
+    # Clientes de integração recebem o id do job para acompanhar o progresso
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({'id': job.pk, 'status': job.status, 'status_url': status_url}, status=202)
+
+    messages.success(request, f"Importação #{job.pk} enfileirada. Acompanhe o progresso em {status_url}")
     return redirect('produto_list')
 
-def _get_categoria_dinamicamente(categoria_nome: str) -> Categoria:
-    if not categoria_nome:
-        return None
-    categoria, _ = Categoria.objects.get_or_create(
-        nome__iexact=categoria_nome,
-        defaults={'nome': categoria_nome.capitalize()}
+# --- Autocomplete de produtos (select2 dos itens da venda) ---
+# Responde no formato do select2: {"results": [{"id", "text"}], "pagination": {"more"}}.
+# Só produtos com estoque; com 'q' os resultados vêm da busca (vendas/busca.py),
+# sem 'q' em ordem de nome.
+AUTOCOMPLETE_POR_PAGINA = 20
+
+# +1 na primeira busca do processo no PostgreSQL (verifica o índice de trigramas)
+@orcamento_consultas(2)
+def autocomplete_produtos(request: HttpRequest) -> JsonResponse:
+    try:
+        pagina = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        pagina = 1
+    queryset = Produto.objects.filter(estoque__gt=0)
+    texto = request.GET.get('q', '').strip()
+    queryset = buscar_produtos(texto, queryset) if texto else queryset.order_by('nome')
+    inicio = (pagina - 1) * AUTOCOMPLETE_POR_PAGINA
+    # Uma linha a mais diz se há outra página, sem COUNT
+    produtos = list(
+        queryset.values('pk', 'nome', 'preco', 'estoque')[inicio:inicio + AUTOCOMPLETE_POR_PAGINA + 1]
     )
-    return categoria
-def _processar_json(arquivo) -> int:
-    dados = json.load(arquivo)
-    if not isinstance(dados, list):
-        raise ValueError("JSON deve ser uma lista (array) de produtos.")
-    count = 0
-    for item in dados:
-        categoria_obj = _get_categoria_dinamicamente(item.get('categoria'))
-        Produto.objects.update_or_create(
-            nome=item.get('nome'),
-            defaults={
-                'preco': Decimal(item.get('preco', 0)),
-                'estoque': int(item.get('estoque', 0)),
-                'descricao': item.get('descricao', ''),
-                'categoria': categoria_obj
-            }
-        )
-        count += 1
-    return count
-def _processar_xml(arquivo) -> int:
-    tree = ET.parse(arquivo)
-    root = tree.getroot()
-    count = 0
-    for produto_node in root.findall('produto'):
-        nome = produto_node.find('nome').text
-        categoria_nome = produto_node.find('categoria').text if produto_node.find('categoria') is not None else None
-        categoria_obj = _get_categoria_dinamicamente(categoria_nome)
-        Produto.objects.update_or_create(
-            nome=nome,
-            defaults={
-                'preco': Decimal(produto_node.find('preco').text or 0),
-                'estoque': int(produto_node.find('estoque').text or 0),
-                'descricao': produto_node.find('descricao').text if produto_node.find('descricao') is not None else '',
-                'categoria': categoria_obj
-            }
-        )
-        count += 1
-    return count
+    return JsonResponse({
+        'results': [
+            {'id': produto['pk'], 'text': produto['nome'], 'preco': str(produto['preco']), 'estoque': produto['estoque']}
+            for produto in produtos[:AUTOCOMPLETE_POR_PAGINA]
+        ],
+        'pagination': {'more': len(produtos) > AUTOCOMPLETE_POR_PAGINA},
+    })
+
+@orcamento_consultas(1)
+def import_status(request: HttpRequest, pk: int) -> JsonResponse:
+    job = get_object_or_404(ImportJob, pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'formato': job.formato,
+        'criado_em': job.criado_em,
+        'iniciado_em': job.iniciado_em,
+        'finalizado_em': job.finalizado_em,
+        'processados': job.processados,
+        'criados': job.criados,
+        'atualizados': job.atualizados,
+        'inalterados': job.inalterados,
+        'total_erros': job.total_erros,
+        'erros': job.erros,
+        'linhas_por_segundo': round(job.linhas_por_segundo, 1),
+        'mensagem': job.mensagem,
+    })
+
+# --- Ingestão de vendas em lote (JSON) ---
+# Usada pelas lojas para sincronizar vendas feitas offline.
+# Só aceita Content-Type application/json: um formulário de outro site não
+# consegue enviar esse tipo sem preflight de CORS, por isso a view dispensa o token CSRF.
+@orcamento_consultas(7)
+@csrf_exempt
+@require_POST
+def vendas_em_lote(request: HttpRequest) -> JsonResponse:
+    if request.content_type != 'application/json':
+        return JsonResponse({'erro': "Envie as vendas como application/json."}, status=415)
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'erro': "JSON inválido."}, status=400)
+    # Aceita tanto [venda, ...] quanto {"vendas": [venda, ...]}
+    vendas = dados.get('vendas') if isinstance(dados, dict) else dados
+    if not isinstance(vendas, list):
+        return JsonResponse({'erro': "Envie uma lista de vendas."}, status=400)
+
+    def registrar():
+        resultados = VendaFacade().criar_vendas_em_lote(vendas)
+        criadas = sum(1 for resultado in resultados if resultado['status'] == 'criada')
+        return {
+            'criadas': criadas,
+            'rejeitadas': len(resultados) - criadas,
+            'resultados': resultados,
+        }
+
+    # Com o cabeçalho Idempotency-Key, reenviar o mesmo lote devolve a resposta original
+    try:
+        resposta, repetida = executar_uma_vez(request, 'venda_lote', registrar)
+    except ConflitoIdempotencia as e:
+        return JsonResponse({'erro': str(e)}, status=422)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+
+    response = JsonResponse(resposta)
+    if repetida:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+# --- Fila de vendas (JSON) ---
+# Modo assíncrono para picos (promoções): a venda é só enfileirada e o worker
+# 'processar_vendas' da partição dos seus produtos a registra. O cliente acompanha
+# o resultado em status_url. Aceita Idempotency-Key como /vendas/lote/.
+@orcamento_consultas(1)
+@csrf_exempt
+@require_POST
+def enfileirar_venda_view(request: HttpRequest) -> JsonResponse:
+    if request.content_type != 'application/json':
+        return JsonResponse({'erro': "Envie a venda como application/json."}, status=415)
+    try:
+        dados = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'erro': "JSON inválido."}, status=400)
+
+    # Erros de formato são devolvidos já; estoque e produtos são verificados pelo worker
+    erros, _ = VendaFacade().validar_dados_venda(dados)
+    if erros:
+        return JsonResponse({'erros': erros}, status=400)
+
+    def enfileirar():
+        pedido = enfileirar_venda(dados)
+        return {
+            'id': pedido.pk,
+            'status': pedido.status,
+            'status_url': reverse('venda_fila_status', args=[pedido.pk]),
+        }
+
+    try:
+        resposta, _ = executar_uma_vez(request, 'venda_fila', enfileirar)
+    except ConflitoIdempotencia as e:
+        return JsonResponse({'erro': str(e)}, status=422)
+    return JsonResponse(resposta, status=202)
+
+@orcamento_consultas(1)
+def status_pedido_venda(request: HttpRequest, pk: int) -> JsonResponse:
+    pedido = get_object_or_404(PedidoVenda, pk=pk)
+    return JsonResponse({
+        'id': pedido.pk,
+        'status': pedido.status,
+        'venda': pedido.venda_id,
+        'erros': pedido.erros,
+        'criado_em': pedido.criado_em,
+        'processado_em': pedido.processado_em,
+    })
+
+# --- Mudança de status em lote (JSON) ---
+# Ex.: {"ids": [1, 2, 3], "status": "PAGA"}. Mesmas regras de estoque da edição
+# de uma venda, aplicadas de uma vez (e mesma política de CSRF de 'vendas_em_lote').
+@orcamento_consultas(4)
+@csrf_exempt
+@require_POST
+def status_vendas_em_lote(request: HttpRequest) -> JsonResponse:
+    if request.content_type != 'application/json':
+        return JsonResponse({'erro': "Envie os dados como application/json."}, status=415)
+    try:
+        dados = json.loads(request.body)
+        venda_ids = [int(pk) for pk in dados['ids']]
+        novo_status = str(dados['status'])
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'erro': "Envie {\"ids\": [...], \"status\": \"...\"} com ids inteiros."}, status=400)
+
+    try:
+        resultados = VendaFacade().atualizar_status_em_lote(venda_ids, novo_status)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+
+    atualizadas = sum(1 for resultado in resultados if resultado['status'] == 'atualizada')
+    return JsonResponse({
+        'atualizadas': atualizadas,
+        'rejeitadas': sum(1 for resultado in resultados if resultado['status'] == 'rejeitada'),
+        'resultados': resultados,
+    })
 
 # --- CRUD de Vendas ---
+@orcamento_consultas(3)
 class VendaListView(ListView):
+    """
+    Lista de vendas paginada por cursor (vendas/paginacao.py), com filtros por
+    status e datas. Com ?format=json devolve a mesma página em JSON.
+    """
     model = Venda
     template_name = 'venda_list.html'
     context_object_name = 'vendas'
+    tamanho_pagina = TAMANHO_PAGINA
+    def get(self, request, *args, **kwargs):
+        self.filtro = FiltroVendasForm(request.GET)
+        try:
+            self.pagina = pagina_por_cursor(
+                self.filtro.filtrar(Venda.objects.prefetch_related('itens__produto')),
+                depois=request.GET.get('depois'),
+                antes=request.GET.get('antes'),
+                tamanho=self.tamanho_pagina,
+            )
+        except CursorInvalido as e:
+            if request.GET.get('format') == 'json':
+                return JsonResponse({'erro': str(e)}, status=400)
+            raise Http404(str(e))
+        return super().get(request, *args, **kwargs)
     def get_queryset(self):
-        return Venda.objects.prefetch_related('itens__produto').order_by('-data')
+        return self.pagina['itens']
+    def _url_pagina(self, **cursor):
+        # Mantém filtros e formato, trocando só o cursor
+        parametros = self.request.GET.copy()
+        parametros.pop('depois', None)
+        parametros.pop('antes', None)
+        parametros.update({chave: valor for chave, valor in cursor.items() if valor})
+        return f"{self.request.path}?{parametros.urlencode()}" if parametros else self.request.path
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filtro'] = self.filtro
+        context['url_proxima'] = self.pagina['proximo'] and self._url_pagina(depois=self.pagina['proximo'])
+        context['url_anterior'] = self.pagina['anterior'] and self._url_pagina(antes=self.pagina['anterior'])
+        context['url_inicio'] = self._url_pagina()
+        return context
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') != 'json':
+            return super().render_to_response(context, **response_kwargs)
+        return JsonResponse({
+            'vendas': [
+                {
+                    'id': venda.pk,
+                    'cliente': venda.cliente,
+                    'data': venda.data.isoformat(),
+                    'status': venda.status,
+                    'total': str(venda.total),
+                    'comprovante': venda.comprovante.url if venda.comprovante else None,
+                    'itens': [
+                        {
+                            'produto': item.produto_id,
+                            'nome': item.produto.nome,
+                            'quantidade': item.quantidade,
+                            'preco_unitario': str(item.preco_unitario),
+                        }
+                        for item in venda.itens.all()
+                    ],
+                }
+                for venda in context['vendas']
+            ],
+            'proximo': context['url_proxima'],
+            'anterior': context['url_anterior'],
+        })
+@orcamento_consultas(9)
 class VendaCreateView(SuccessMessageMixin, CreateView):
     model = Venda
     form_class = VendaForm
@@ -224,6 +570,8 @@ class VendaCreateView(SuccessMessageMixin, CreateView):
         else:
             context['formset'] = ItemVendaFormSet(prefix='itens')
             context['empty_form'] = ItemVendaFormSet(prefix='itens').empty_form
+        # Uma chave por formulário aberto; se o POST falhar, a mesma chave é reaproveitada
+        context['idempotency_key'] = chave_da_requisicao(self.request) or uuid.uuid4().hex
         return context
     def post(self, request, *args, **kwargs):
         self.object = None 
@@ -232,7 +580,13 @@ class VendaCreateView(SuccessMessageMixin, CreateView):
         if form.is_valid() and (form.cleaned_data['status'] == Venda.StatusVenda.CANCELADA or formset.is_valid()):
             try:
                 facade = VendaFacade()
-                facade.criar_venda(form, formset, request.FILES)
+                # Um reenvio com a mesma chave (duplo clique, retry após timeout)
+                # devolve a venda já criada em vez de criar outra
+                executar_uma_vez(
+                    request,
+                    'venda_create',
+                    lambda: {'venda_id': facade.criar_venda(form, formset, request.FILES).pk},
+                )
                 messages.success(request, self.success_message)
                 return redirect(self.success_url)
             except Exception as e:
@@ -244,6 +598,7 @@ class VendaCreateView(SuccessMessageMixin, CreateView):
         context = self.get_context_data(form=form, formset=formset)
         context['empty_form'] = ItemVendaFormSet(prefix='itens').empty_form
         return self.render_to_response(context)
+@orcamento_consultas(8)
 class VendaUpdateView(SuccessMessageMixin, UpdateView):
     model = Venda
     form_class = VendaForm
@@ -255,7 +610,8 @@ class VendaUpdateView(SuccessMessageMixin, UpdateView):
         context['is_update_view'] = True 
         return context
     def form_valid(self, form):
-        old_status = self.get_object().status
+        # O status anterior já está no 'initial' do formulário (sem consultar de novo)
+        old_status = form.initial['status']
         new_status = form.cleaned_data['status']
         if old_status != new_status:
             facade = VendaFacade()